@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+
+"""
+Times loading, indexing, searching and page rendering against a
+synthetic schema, see benchmarks/synthetic.py.
+
+    python -m benchmarks.run --classes 2000 --output new.json
+    python -m benchmarks.run --classes 2000 --compare old.json
+
+Results are written as json, timings are in seconds per call. With
+--compare the medians of both runs are printed side by side. Where
+/proc/self/smaps exists the memory a --workers process doesn't share
+with the others is measured too, in kB.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+from collections import OrderedDict
+
+import rdflib
+import tornado.template
+
+from sdoserver import RDFApi
+from schemadiff import SchemaDiff, graph_lines, sorted_lines
+from benchmarks import synthetic
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+log = logging.getLogger("benchmarks")
+
+
+class TemplateModules(object):
+    """ stands in for tornado's ui modules so that templates using
+    {% module Template(...) %} can be rendered outside a request
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def Template(self, path, **kwargs):
+        return self.loader.load(path).generate(_tt_modules=self, **kwargs)
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in xrange(repeat):
+        t = time.time()
+        fn()
+        times.append(time.time() - t)
+    return times
+
+
+def summarize(times):
+    times = sorted(times)
+    n = len(times)
+    median = times[n // 2] if n % 2 else (times[n // 2 - 1] + times[n // 2]) / 2.0
+    return OrderedDict(
+        [("min", times[0]), ("median", median), ("mean", sum(times) / n), ("n", n)]
+    )
+
+
+def new_api():
+    return RDFApi(log)
+
+
+def private_kb():
+    """ resident memory of this process that no other process shares """
+    kb = 0
+    with open("/proc/self/smaps") as f:
+        for line in f:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                kb += int(line.split()[1])
+    return kb
+
+
+class Benchmark(object):
+    def __init__(self, schema, data_dir, repeat):
+        self.schema = schema
+        self.data_dir = data_dir
+        self.repeat = repeat
+        self.results = OrderedDict()
+        self.memory = OrderedDict()
+
+    def time(self, name, fn, repeat=None):
+        times = timeit(fn, repeat or self.repeat)
+        self.results[name] = summarize(times)
+        log.info("%s median=%.4f", name, self.results[name]["median"])
+
+    def run(self):
+        rdfa = os.path.join(self.data_dir, "rdfa", "schema.rdfa")
+        jsonld = os.path.join(self.data_dir, "jsonld", "schema.jsonld")
+
+        self.time("add_file.rdfa", lambda: new_api().add_file(rdfa))
+        self.time("add_file.jsonld", lambda: new_api().add_file(jsonld))
+
+        api = new_api()
+        api.add_file(rdfa)
+        self.time("reload_term_meta", api.reload_term_meta)
+
+        # the same schema from the other file, every triple is compared
+        other = new_api()
+        other.add_file(jsonld)
+        self.time(
+            "schemadiff",
+            lambda: SchemaDiff(
+                sorted_lines(graph_lines(other.graph)),
+                sorted_lines(graph_lines(api.graph)),
+            ),
+        )
+
+        self.bench_search(api)
+        self.bench_render(api)
+        # last, it freezes api
+        if os.path.exists("/proc/self/smaps"):
+            self.bench_workers(api)
+        return self.results
+
+    def bench_search(self, api):
+        index_dir = tempfile.mkdtemp(prefix="sdo-bench-index-")
+        try:
+
+            def fresh_index():
+                shutil.rmtree(index_dir)
+                os.makedirs(index_dir)
+                api.prepare_search_index(index_dir)
+
+            self.time("prepare_search_index", fresh_index)
+            # nothing changed since, only digests are compared
+            self.time(
+                "prepare_search_index.unchanged",
+                lambda: api.prepare_search_index(index_dir),
+            )
+
+            rand = self.schema.rand
+            labels = [
+                self.schema.label(rand.choice(self.schema.classes)[0])
+                for _ in xrange(20)
+            ]
+            labels += rand.sample(synthetic.WORDS, 10)
+            self.time("search", lambda: [api.search(l) for l in labels])
+        finally:
+            api.rdf_searcher.close()
+            shutil.rmtree(index_dir)
+
+    def bench_render(self, api):
+        modules = TemplateModules(tornado.template.Loader(TEMPLATE_DIR))
+
+        def render(template, **kwargs):
+            return lambda: modules.Template(template, api=api, **kwargs)
+
+        thing = rdflib.term.URIRef(synthetic.SDO + "Thing")
+        # a class with children and properties, and one of its properties
+        klass = rdflib.term.URIRef(self.schema.classes[2][0])
+        prop = rdflib.term.URIRef(self.schema.properties[0][0])
+
+        self.time("render.class", render("single_schema.html", subject=klass))
+        self.time("render.property", render("single_schema.html", subject=prop))
+        self.time("render.tree", render("tree_node.html", term=thing, expanded=True))
+        self.time("render.children", render("tree_children.html", term=klass))
+
+        def render_full():
+            # section by section, the way /schema/full streams it
+            for term in api.iter_hierarchy(thing):
+                modules.Template("single_schema.html", api=api, subject=term)
+
+        self.time("render.full", render_full)
+
+    def bench_workers(self, api, workers=2):
+        """ the private memory of processes forked after mapping the image,
+        the way --workers does, right after the fork and once they have
+        rendered every class page. the term list and id dict of the store
+        and the api's hierarchy indexes are python objects, the pages
+        holding them turn private as they are used.
+        """
+        modules = TemplateModules(tornado.template.Loader(TEMPLATE_DIR))
+        thing = rdflib.term.URIRef(synthetic.SDO + "Thing")
+        image_dir = tempfile.mkdtemp(prefix="sdo-bench-image-")
+        try:
+            path = os.path.join(image_dir, "graph.image")
+            api.freeze()
+            api.save_image(path)
+            api.map_image(path)
+            self.memory["image"] = os.path.getsize(path) // 1024
+            # the templates are compiled before the fork, like the server's
+            modules.Template("single_schema.html", api=api, subject=thing)
+
+            measured = []
+            for _ in xrange(workers):
+                r, w = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    try:
+                        forked = private_kb()
+                        for term in api.iter_hierarchy(thing):
+                            modules.Template(
+                                "single_schema.html", api=api, subject=term
+                            )
+                        os.write(w, json.dumps([forked, private_kb()]))
+                    finally:
+                        os._exit(0)
+
+                os.close(w)
+                with os.fdopen(r) as f:
+                    measured.append(json.loads(f.read()))
+                os.waitpid(pid, 0)
+        finally:
+            shutil.rmtree(image_dir)
+
+        self.memory["worker.forked"] = max(m[0] for m in measured)
+        self.memory["worker.rendered"] = max(m[1] for m in measured)
+        log.info("worker private memory kb=%s", self.memory)
+
+
+def compare(old, new, out=sys.stdout):
+    old_results, new_results = old["results"], new["results"]
+    out.write("%-32s %12s %12s %8s\n" % ("benchmark", "old", "new", "new/old"))
+    for name in new_results:
+        n = new_results[name]["median"]
+        if name not in old_results:
+            out.write("%-32s %12s %12.4f %8s\n" % (name, "-", n, "-"))
+            continue
+
+        o = old_results[name]["median"]
+        ratio = n / o if o else float("inf")
+        out.write("%-32s %12.4f %12.4f %8.2f\n" % (name, o, n, ratio))
+
+    old_memory, new_memory = old.get("memory", {}), new.get("memory", {})
+    for name in new_memory:
+        o = old_memory.get(name)
+        out.write(
+            "%-32s %12s %12s kB\n"
+            % ("memory." + name, "-" if o is None else o, new_memory[name])
+        )
+
+    if old["params"] != new["params"]:
+        out.write("warning: runs used different parameters\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    synthetic.define_args(parser)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results as json here")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=args.log_level.upper())
+
+    params = OrderedDict(
+        [
+            ("classes", args.classes),
+            ("depth", args.depth),
+            ("fanout", args.fanout),
+            ("properties", args.properties),
+            ("seed", args.seed),
+            ("repeat", args.repeat),
+        ]
+    )
+
+    data_dir = tempfile.mkdtemp(prefix="sdo-bench-")
+    try:
+        schema = synthetic.generate(
+            data_dir, args.classes, args.depth, args.fanout, args.properties, args.seed
+        )
+        benchmark = Benchmark(schema, data_dir, args.repeat)
+        results = benchmark.run()
+    finally:
+        shutil.rmtree(data_dir)
+
+    report = OrderedDict(
+        [
+            ("params", params),
+            (
+                "env",
+                OrderedDict(
+                    [
+                        ("python", platform.python_version()),
+                        ("rdflib", rdflib.__version__),
+                        ("time", int(time.time())),
+                    ]
+                ),
+            ),
+            ("results", results),
+            ("memory", benchmark.memory),
+        ]
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report, out=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
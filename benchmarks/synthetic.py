@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+"""
+Generates synthetic schema.org style schemas for benchmarking.
+
+The class hierarchy is rooted at http://schema.org/Thing, every class
+gets `fanout` subclasses breadth first until `classes` classes exist.
+Classes that would end up deeper than `depth` are spread over the
+deepest allowed level instead. Every class is the domainIncludes of
+`properties` properties whose rangeIncludes is another class or Text.
+
+The same schema can be written as RDFa (like schema.org's own files)
+and as expanded JSON-LD.
+
+    python -m benchmarks.synthetic --classes 2000 --depth 6 out_dir
+"""
+
+import os
+import json
+import random
+import argparse
+from collections import deque
+from xml.sax.saxutils import escape, quoteattr
+
+SDO = "http://schema.org/"
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+
+WORDS = (
+    "abstract action area audience brand category code date event item "
+    "language location media name offer organization person place price "
+    "product rating review service status time type value version work"
+).split()
+
+
+class SyntheticSchema(object):
+    def __init__(self, classes=500, depth=5, fanout=4, properties=3, seed=0):
+        self.rand = random.Random(seed)
+
+        # (uri, parent uri or None, depth)
+        self.classes = [(SDO + "Thing", None, 0), (SDO + "Text", None, 0)]
+
+        # parents that can still take children, breadth first
+        open_parents = deque([(SDO + "Thing", 0)])
+        nchildren = {}
+        # once every level above depth is full, the classes at depth - 1
+        # take the rest in turn
+        depth = max(depth, 1)
+        deepest = [(SDO + "Thing", 0)] if depth == 1 else []
+        for i in xrange(max(0, classes - len(self.classes))):
+            while open_parents and nchildren.get(open_parents[0][0], 0) >= fanout:
+                open_parents.popleft()
+
+            if open_parents:
+                parent, d = open_parents[0]
+            else:
+                parent, d = deepest[i % len(deepest)]
+
+            nchildren[parent] = nchildren.get(parent, 0) + 1
+            uri = SDO + "Class%d" % i
+            self.classes.append((uri, parent, d + 1))
+            if d + 1 < depth:
+                open_parents.append((uri, d + 1))
+            if d + 1 == depth - 1:
+                deepest.append((uri, d + 1))
+
+        # (uri, domain uri, range uri)
+        self.properties = []
+        targets = [c[0] for c in self.classes]
+        for n, (uri, _, _) in enumerate(self.classes):
+            for j in xrange(properties):
+                target = self.rand.choice(targets)
+                self.properties.append((SDO + "prop%dx%d" % (n, j), uri, target))
+
+    def label(self, uri):
+        return uri[len(SDO) :]
+
+    def comment(self, uri):
+        words = [self.rand.choice(WORDS) for _ in xrange(12)]
+        return "%s is about %s." % (self.label(uri), " ".join(words))
+
+    def write_rdfa(self, fname):
+        with open(fname, "w") as f:
+            f.write("<html><head><title>synthetic schema</title></head><body>\n")
+            for uri, parent, _ in self.classes:
+                f.write('<div typeof="rdfs:Class" resource=%s>\n' % quoteattr(uri))
+                f.write(
+                    '  <span property="rdfs:label">%s</span>\n'
+                    % escape(self.label(uri))
+                )
+                f.write(
+                    '  <span property="rdfs:comment">%s</span>\n'
+                    % escape(self.comment(uri))
+                )
+                if parent is not None:
+                    f.write(
+                        '  <a property="rdfs:subClassOf" href=%s>%s</a>\n'
+                        % (quoteattr(parent), escape(self.label(parent)))
+                    )
+                f.write("</div>\n")
+
+            for uri, domain, range_ in self.properties:
+                f.write('<div typeof="rdf:Property" resource=%s>\n' % quoteattr(uri))
+                f.write(
+                    '  <span property="rdfs:label">%s</span>\n'
+                    % escape(self.label(uri))
+                )
+                f.write(
+                    '  <span property="rdfs:comment">%s</span>\n'
+                    % escape(self.comment(uri))
+                )
+                f.write(
+                    '  <a property="%sdomainIncludes" href=%s>d</a>\n'
+                    % (SDO, quoteattr(domain))
+                )
+                f.write(
+                    '  <a property="%srangeIncludes" href=%s>r</a>\n'
+                    % (SDO, quoteattr(range_))
+                )
+                f.write("</div>\n")
+            f.write("</body></html>\n")
+
+    def write_jsonld(self, fname):
+        ref = lambda uri: [{"@id": uri}]
+        text = lambda s: [{"@value": s}]
+        nodes = []
+        for uri, parent, _ in self.classes:
+            node = {
+                "@id": uri,
+                "@type": [RDFS + "Class"],
+                RDFS + "label": text(self.label(uri)),
+                RDFS + "comment": text(self.comment(uri)),
+            }
+            if parent is not None:
+                node[RDFS + "subClassOf"] = ref(parent)
+            nodes.append(node)
+
+        for uri, domain, range_ in self.properties:
+            nodes.append(
+                {
+                    "@id": uri,
+                    "@type": [RDF + "Property"],
+                    RDFS + "label": text(self.label(uri)),
+                    RDFS + "comment": text(self.comment(uri)),
+                    SDO + "domainIncludes": ref(domain),
+                    SDO + "rangeIncludes": ref(range_),
+                }
+            )
+
+        with open(fname, "w") as f:
+            json.dump(nodes, f, indent=1)
+
+
+def generate(out_dir, classes=500, depth=5, fanout=4, properties=3, seed=0):
+    """ writes out_dir/rdfa/schema.rdfa and out_dir/jsonld/schema.jsonld,
+    both holding the same schema, returns the SyntheticSchema
+    """
+    schema = SyntheticSchema(classes, depth, fanout, properties, seed)
+    for fmt, ext in (("rdfa", ".rdfa"), ("jsonld", ".jsonld")):
+        d = os.path.join(out_dir, fmt)
+        if not os.path.exists(d):
+            os.makedirs(d)
+        getattr(schema, "write_%s" % fmt)(os.path.join(d, "schema%s" % ext))
+
+    return schema
+
+
+def define_args(parser):
+    parser.add_argument("--classes", type=int, default=500)
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument(
+        "--properties", type=int, default=3, help="properties per class"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    define_args(parser)
+    parser.add_argument("out_dir")
+    args = parser.parse_args()
+    generate(
+        args.out_dir, args.classes, args.depth, args.fanout, args.properties, args.seed
+    )
+
+
+if __name__ == "__main__":
+    main()
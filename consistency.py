@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""
+Ontology consistency checks, re-using the SPARQL checks from schema.org
+and adding more.
+
+Every check takes a loaded RDFApi and returns a list of problems, an
+empty list meaning the check passed. They only read the in-memory
+indexes built by reload_term_meta and single pattern lookups on the
+graph, so running all of them is cheap.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+import rdflib
+
+INVERSE_OF = rdflib.term.URIRef("http://schema.org/inverseOf")
+URL = rdflib.term.URIRef("http://schema.org/URL")
+
+
+def inverse_of_pairs(api):
+    return sorted(set(api.graph.subject_objects(INVERSE_OF)))
+
+
+def check_even_number_inverse_of(api):
+    pairs = inverse_of_pairs(api)
+    if len(pairs) % 2 == 0:
+        return []
+    return ["Even number of inverseOf triples expected. Found: %s" % len(pairs)]
+
+
+def check_symmetric_inverse_of(api):
+    """ if x is inverseOf y, y should be declared inverseOf x """
+    pairs = inverse_of_pairs(api)
+    declared = set(pairs)
+    fmt = "property {x} is inverseOf {y} but {y} is not inverseOf {x}"
+    return [fmt.format(x=x, y=y) for x, y in pairs if (y, x) not in declared]
+
+
+def check_inverse_of_domain_range(api):
+    """ the rangeIncludes of x should be the domainIncludes of its
+    inverse y and vice versa
+    """
+    problems = []
+    fmt = "property {x} has {a} {xs} but its inverseOf {y} has {b} {ys}"
+    for x, y in inverse_of_pairs(api):
+        x_ranges = api.property_to_ranges.get(x, [])
+        y_domains = api.property_to_domains.get(y, [])
+        if set(x_ranges) != set(y_domains):
+            problems.append(
+                fmt.format(
+                    x=x,
+                    a="rangeIncludes",
+                    xs=x_ranges,
+                    y=y,
+                    b="domainIncludes",
+                    ys=y_domains,
+                )
+            )
+    return problems
+
+
+def needless_includes(api, property_to_classes, kind, excused=()):
+    # check immediate subtypes don't declare the same includes
+    problems = []
+    fmt = "property {prop} defining {kind}, {c1}, [which is subclassOf] {c2} unnecessarily."
+    for prop in sorted(property_to_classes):
+        classes = property_to_classes[prop]
+        for c1 in classes:
+            if c1 in excused:
+                continue
+            for c2 in api.term_to_parents.get(c1, ()):
+                if c2 != c1 and c2 in classes:
+                    problems.append(fmt.format(prop=prop, kind=kind, c1=c1, c2=c2))
+    return problems
+
+
+def check_needless_domain_includes(api):
+    return needless_includes(api, api.property_to_domains, "domain")
+
+
+def check_needless_range_includes(api):
+    # we excuse URL as it is special, not best seen as a Text subtype.
+    return needless_includes(api, api.property_to_ranges, "range", excused=(URL,))
+
+
+def invalid_includes(api, property_to_classes, kind):
+    fmt = "Property {prop} invalid {kind} value: {c}"
+    return [
+        fmt.format(prop=prop, kind=kind, c=c)
+        for prop in sorted(property_to_classes)
+        for c in property_to_classes[prop]
+        if c not in api.classes
+    ]
+
+
+def check_valid_range_includes(api):
+    """ Every range includes should be a valid type """
+    return invalid_includes(api, api.property_to_ranges, "rangeIncludes")
+
+
+def check_valid_domain_includes(api):
+    """ Every domain includes should be a valid type """
+    return invalid_includes(api, api.property_to_domains, "domainIncludes")
+
+
+def check_duplicate_comments(api):
+    """ different terms should not have identical comments """
+    comment_to_terms = {}
+    for term, desc in api.term_to_desc.iteritems():
+        desc = desc.strip()
+        if desc:
+            comment_to_terms.setdefault(desc, []).append(term)
+
+    fmt = "terms {terms} share the comment {desc!r}"
+    return [
+        fmt.format(terms=sorted(terms), desc=desc)
+        for desc, terms in sorted(comment_to_terms.iteritems())
+        if len(terms) > 1
+    ]
+
+
+CHECKS = OrderedDict(
+    [
+        ("even_number_inverseOf", check_even_number_inverse_of),
+        ("symmetric_inverseOf", check_symmetric_inverse_of),
+        ("inverseOf_domain_range", check_inverse_of_domain_range),
+        ("needless_domainIncludes", check_needless_domain_includes),
+        ("needless_rangeIncludes", check_needless_range_includes),
+        ("valid_rangeIncludes", check_valid_range_includes),
+        ("valid_domainIncludes", check_valid_domain_includes),
+        ("duplicate_comments", check_duplicate_comments),
+    ]
+)
+
+
+class ConsistencyReport(object):
+    """ runs every check against an api and keeps the outcome around
+    for the status endpoint, run() is meant for a background thread.
+    with path the finished report is also written there, for other
+    processes to read with ReportFile.
+    """
+
+    def __init__(self, api, log, path=None):
+        self.api = api
+        self.log = log
+        self.path = path
+        self.generation = api.generation
+        self.state = "pending"
+        self.started = None
+        self.finished = None
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def run(self):
+        self.state = "running"
+        self.started = time.time()
+        for name, check in CHECKS.iteritems():
+            try:
+                problems = check(self.api)
+            except Exception as e:
+                self.log.exception("consistency check %s failed to run", name)
+                problems = ["check failed to run: %r" % e]
+
+            for problem in problems:
+                self.log.warning("%s: %s", name, problem)
+
+            with self.lock:
+                self.results[name] = problems
+
+        self.finished = time.time()
+        self.state = "done"
+        if self.path is not None:
+            self.save()
+
+        failing = [name for name, problems in self.results.iteritems() if problems]
+        if failing:
+            self.log.error("consistency checks are failing !!! %s", failing)
+        else:
+            self.log.info("all %d consistency checks pass", len(CHECKS))
+
+    def to_json(self):
+        with self.lock:
+            results = OrderedDict(
+                (name, dict(passed=not problems, problems=problems))
+                for name, problems in self.results.iteritems()
+            )
+
+        return dict(
+            state=self.state,
+            generation=self.generation,
+            started=self.started,
+            finished=self.finished,
+            checks=results,
+        )
+
+    def save(self):
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(self.to_json(), f)
+        # readers never see half a report
+        os.rename(tmp, self.path)
+
+
+class ReportFile(object):
+    """ the report another process writes to path when its checks of
+    the same graph are done, pending until then
+    """
+
+    def __init__(self, path, generation):
+        self.path = path
+        self.generation = generation
+
+    def to_json(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except IOError:
+            return dict(state="pending", generation=self.generation)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+A bounded thread pool for the graph work of requests.
+
+Handlers hand their RDFApi calls and template renders to the pool and
+wait on the future, so the ioloop keeps accepting, serving static
+files and answering cheap requests while a big page renders. At most
+workers calls run at once and at most max_queue more wait for a
+thread, anything beyond that is turned away with Saturated right away
+instead of piling up.
+
+The time every call spent waiting for a thread is recorded in STATS
+under "queue", by name.
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from latency import STATS
+
+
+class Saturated(Exception):
+    pass
+
+
+class BoundedExecutor(object):
+    def __init__(self, workers, max_queue):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pool = ThreadPoolExecutor(workers)
+        self.lock = threading.Lock()
+        # queued or running
+        self.pending = 0
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+
+    def submit(self, name, fn, *args, **kwargs):
+        """ runs fn(*args, **kwargs) in the pool and returns its future,
+        raises Saturated when the pool and its queue are full. the calls
+        fn makes show up in the Trace passed as trace=, the submitting
+        request's, see latency.py
+        """
+        trace = kwargs.pop("trace", None)
+        with self.lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise Saturated("%d calls pending" % self.pending)
+            self.pending += 1
+            self.submitted += 1
+
+        return self.queue(name, trace, fn, args, kwargs)
+
+    def submit_admitted(self, name, fn, *args, **kwargs):
+        """ like submit but never turned away, for the follow up work of
+        a request that is already being answered
+        """
+        trace = kwargs.pop("trace", None)
+        with self.lock:
+            self.pending += 1
+            self.submitted += 1
+
+        return self.queue(name, trace, fn, args, kwargs)
+
+    def queue(self, name, trace, fn, args, kwargs):
+        return self.pool.submit(self.run, name, time.time(), trace, fn, args, kwargs)
+
+    def run(self, name, queued, trace, fn, args, kwargs):
+        ms = (time.time() - queued) * 1000
+        STATS.record("queue", name, ms)
+        STATS.send("queue.%s" % name, ms)
+
+        with self.lock:
+            self.running += 1
+        STATS.resume_trace(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            STATS.end_trace(trace)
+            with self.lock:
+                self.running -= 1
+                self.pending -= 1
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+    def to_json(self):
+        return dict(
+            workers=self.workers,
+            max_queue=self.max_queue,
+            running=self.running,
+            queued=self.pending - self.running,
+            submitted=self.submitted,
+            rejected=self.rejected,
+        )
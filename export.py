@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""
+Exports of the whole graph, serialized once per graph generation and
+format.
+
+An Export holds the serialized bytes next to a gzipped copy, and a
+brotli compressed one when the brotli module is installed, each with a
+strong etag of its own. Requests only ever stream those bytes, a
+request that started on one generation keeps streaming it when a
+reload swaps the graph.
+"""
+
+import time
+import hashlib
+import threading
+
+import rdflib
+
+from pagecache import accepts_encoding, gzip_bytes
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# extension -> (rdflib format, content type)
+FORMATS = {
+    "nt": ("nt", "application/n-triples"),
+    "ttl": ("turtle", "text/turtle"),
+    "jsonld": ("json-ld", "application/ld+json"),
+}
+
+# bound before serializing, for readable turtle
+PREFIXES = {"schema": "http://schema.org/"}
+
+# preferred first
+ENCODINGS = ("br", "gzip")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """ (start, end) of the bytes a Range header asks for out of size,
+    end excluded. None when there is no range to honour, several ranges
+    included, the whole body is sent then.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    first, _, last = header[len("bytes=") :].strip().partition("-")
+    try:
+        if not first:
+            # the last n bytes
+            n = int(last)
+            if n <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(size - n, 0), size
+
+        start = int(first)
+        end = int(last) + 1 if last else max(size, start + 1)
+    except ValueError:
+        return None
+
+    if end <= start:
+        # last before first, invalid
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size)
+
+
+def serialize(graph, fmt):
+    """ the triples of graph as fmt. they are copied into a graph of their
+    own first, the named graphs of the files they came from are left out
+    and the prefixes are bound there rather than on the shared graph.
+    """
+    union = rdflib.Graph()
+    for prefix, namespace in graph.namespaces():
+        union.bind(prefix, namespace)
+    for prefix, namespace in PREFIXES.iteritems():
+        union.bind(prefix, namespace)
+    for triple in graph.triples((None, None, None)):
+        union.add(triple)
+    return union.serialize(format=FORMATS[fmt][0])
+
+
+class Export(object):
+    def __init__(self, fmt, generation, body):
+        self.fmt = fmt
+        self.generation = generation
+        self.content_type = FORMATS[fmt][1]
+        self.modified = int(time.time())
+
+        digest = hashlib.sha1(body).hexdigest()
+        # content encoding -> (bytes, etag)
+        self.bodies = {
+            None: (body, '"%s"' % digest),
+            "gzip": (gzip_bytes(body), '"%s-gzip"' % digest),
+        }
+        if brotli is not None:
+            self.bodies["br"] = (brotli.compress(body), '"%s-br"' % digest)
+
+    def negotiate(self, accept_encoding):
+        """ the content encoding to answer an Accept-Encoding with, None
+        for the body as it is
+        """
+        for encoding in ENCODINGS:
+            if encoding in self.bodies and accepts_encoding(accept_encoding, encoding):
+                return encoding
+        return None
+
+
+class ExportCache(object):
+    """ the exports of the latest graph generation, every format is
+    serialized once however many requests ask for it meanwhile
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (generation, format) -> future of the Export
+        self.exports = {}
+        self.builds = 0
+
+    def get(self, api, fmt, submit):
+        """ the future of api's graph exported as fmt, submit(fn, *args)
+        runs the serialization, see BoundedExecutor.submit
+        """
+        key = (api.generation, fmt)
+        with self.lock:
+            future = self.exports.get(key)
+            if future is not None:
+                return future
+
+            future = self.exports[key] = submit(self.build, api, fmt)
+            self.builds += 1
+
+        future.add_done_callback(lambda f: self.forget_failed(key, f))
+        return future
+
+    def build(self, api, fmt):
+        return Export(fmt, api.generation, serialize(api.graph, fmt))
+
+    def forget_failed(self, key, future):
+        # the next request tries again
+        if future.exception() is None:
+            return
+        with self.lock:
+            if self.exports.get(key) is future:
+                del self.exports[key]
+
+    def expire(self, generation):
+        """ drops the exports of generations before generation, requests
+        still streaming them hold on to their own
+        """
+        with self.lock:
+            for key in self.exports.keys():
+                if key[0] < generation:
+                    del self.exports[key]
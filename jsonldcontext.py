@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""
+JSON-LD @context documents generated from the loaded schema.
+
+Every class and property of the schema gets a term named after it,
+properties get an @type hint when their rangeIncludes make the
+coercion unambiguous:
+
+    only Date, DateTime or Time     the datatype, eg "schema:Date"
+    URL and classes, no other text  "@id", a string value is a url
+
+Terms are keyed by their local name, a term of another namespace whose
+local name is taken already is keyed by its compact iri instead.
+schema.org is the @vocab, its terms without a hint expand by their
+name alone and are left out. The full context covers every namespace;
+a slice covers the terms of one namespace and declares the same
+prefixes, so slices can be combined in an @context array.
+
+Contexts are built once per graph generation and namespace, see
+ContextCache, and kept compressed as export.Export does.
+"""
+
+import json
+import threading
+
+from export import Export, ExportCache, PREFIXES
+
+SDO = "http://schema.org/"
+
+# single ranges coerced to their datatype
+DATE_TYPES = frozenset([SDO + "Date", SDO + "DateTime", SDO + "Time"])
+# ranges whose json values speak for themselves or are free text
+LITERAL_TYPES = frozenset(
+    [SDO + t for t in ["Text", "Number", "Integer", "Float", "Boolean"]]
+)
+
+
+class UnknownNamespace(KeyError):
+    pass
+
+
+def split_term(term):
+    """ (namespace, local name) of a term's uri """
+    uri = unicode(term)
+    cut = max(uri.rfind("#"), uri.rfind("/")) + 1
+    return uri[:cut], uri[cut:]
+
+
+def type_hint(ranges):
+    ranges = set(unicode(r) for r in ranges)
+    if len(ranges) == 1 and ranges <= DATE_TYPES:
+        return ranges.pop()
+    if SDO + "URL" in ranges and not ranges & (LITERAL_TYPES | DATE_TYPES):
+        return "@id"
+    return None
+
+
+class Vocabulary(object):
+    """ the terms of an api's schema grouped by namespace, with the
+    prefixes they are compacted with
+    """
+
+    def __init__(self, api):
+        # namespace -> {local name -> term}
+        self.namespaces = {}
+        for term in list(api.classes) + list(api.properties):
+            namespace, local = split_term(term)
+            if local:
+                self.namespaces.setdefault(namespace, {})[local] = term
+
+        self.prefixes = {}
+        known = dict(PREFIXES)
+        known.update((p, unicode(ns)) for p, ns in api.graph.namespaces())
+        by_namespace = {ns: p for p, ns in sorted(known.iteritems(), reverse=True)}
+        for namespace in sorted(self.namespaces):
+            prefix = by_namespace.get(namespace)
+            if prefix is None or prefix in self.prefixes:
+                prefix = "ns%d" % (len(self.prefixes) + 1)
+            self.prefixes[prefix] = namespace
+        self.prefix_of = {ns: p for p, ns in self.prefixes.iteritems()}
+
+        # schema.org keeps the bare local names when they clash
+        self.order = sorted(self.namespaces, key=lambda ns: (ns != SDO, ns))
+        self.keys = {}
+        taken = set(self.prefixes)
+        for namespace in self.order:
+            for local in sorted(self.namespaces[namespace]):
+                key = local
+                if key in taken:
+                    key = "%s:%s" % (self.prefix_of[namespace], local)
+                taken.add(key)
+                self.keys[namespace, local] = key
+
+        self.ranges = api.property_to_ranges
+        self.properties = api.properties
+
+    def namespace(self, name):
+        """ the namespace a prefix or namespace uri names """
+        if name in self.namespaces:
+            return name
+        if name in self.prefixes:
+            return self.prefixes[name]
+        raise UnknownNamespace(name)
+
+    def context(self, namespace=None):
+        """ the @context document of one namespace, or of all of them """
+        namespaces = self.order if namespace is None else [namespace]
+        context = dict(self.prefixes)
+        if SDO in namespaces:
+            context["@vocab"] = SDO
+
+        for ns in namespaces:
+            prefix = self.prefix_of[ns]
+            for local, term in self.namespaces[ns].iteritems():
+                key = self.keys[ns, local]
+                iri = "%s:%s" % (prefix, local)
+                hint = None
+                if term in self.properties:
+                    hint = type_hint(self.ranges.get(term, ()))
+
+                if hint is None:
+                    # @vocab expands it the same
+                    if ns != SDO or key != local:
+                        context[key] = iri
+                    continue
+
+                if hint != "@id":
+                    hint = self.compact(hint)
+                context[key] = {"@id": iri, "@type": hint}
+
+        return {"@context": context}
+
+    def compact(self, uri):
+        namespace, local = split_term(uri)
+        if namespace not in self.prefix_of:
+            return uri
+        return "%s:%s" % (self.prefix_of[namespace], local)
+
+
+class ContextCache(ExportCache):
+    """ the @context documents of the latest graph generation, keyed by
+    the prefix or namespace uri they were asked for, None for the full
+    context
+    """
+
+    def __init__(self):
+        super(ContextCache, self).__init__()
+        # generation -> Vocabulary, apart from the exports' lock which
+        # is held while builds are submitted
+        self.vocabulary_lock = threading.Lock()
+        self.vocabularies = {}
+
+    def vocabulary(self, api):
+        with self.vocabulary_lock:
+            vocabulary = self.vocabularies.get(api.generation)
+            if vocabulary is None:
+                vocabulary = Vocabulary(api)
+                self.vocabularies = {api.generation: vocabulary}
+            return vocabulary
+
+    def build(self, api, name):
+        """ the Export of the context of the namespace name, a prefix or
+        namespace uri, raises UnknownNamespace when there is none
+        """
+        vocabulary = self.vocabulary(api)
+        namespace = None if name is None else vocabulary.namespace(name)
+        context = vocabulary.context(namespace)
+        body = json.dumps(context, sort_keys=True, separators=(",", ":"))
+        return Export("jsonld", api.generation, body)
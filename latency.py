@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+"""
+Latency histograms for requests, RDFApi methods and sparql queries.
+
+Every timing goes into a histogram keyed by (group, name), eg.
+("queries", "get_classes") or ("requests", "/schema/tree"), which
+/debug/stats serves as json. A request carries a trace of its own and
+hands it to the executor with every call, the thread running the call
+adds the api methods and queries it makes to that trace, so a slow
+request can be logged with where its time went.
+"""
+
+import time
+import bisect
+import threading
+import functools
+from collections import OrderedDict
+
+# upper bounds of the histogram buckets in ms, the last bucket is open
+BUCKETS_MS = (
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    25,
+    50,
+    100,
+    250,
+    500,
+    1000,
+    2500,
+    5000,
+    10000,
+)
+
+# distinct names kept per group, the rest share OVERFLOW so that
+# arbitrary request uris can't grow the stats without bound
+MAX_NAMES = 5000
+OVERFLOW = "(other)"
+
+
+class Histogram(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.counts = [0] * (len(BUCKETS_MS) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def add(self, ms):
+        with self.lock:
+            self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+            self.count += 1
+            self.total += ms
+            if ms > self.max:
+                self.max = ms
+
+    def percentile(self, p):
+        """ upper bound of the bucket holding the p-th percentile """
+        rank = p / 100.0 * self.count
+        seen = 0
+        for n, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return BUCKETS_MS[n] if n < len(BUCKETS_MS) else self.max
+        return 0.0
+
+    def to_json(self):
+        buckets = OrderedDict()
+        for n, count in enumerate(self.counts):
+            if count:
+                le = BUCKETS_MS[n] if n < len(BUCKETS_MS) else "inf"
+                buckets["le_%s" % le] = count
+
+        return OrderedDict(
+            [
+                ("count", self.count),
+                ("mean_ms", self.total / self.count if self.count else 0.0),
+                ("max_ms", self.max),
+                ("p50_ms", self.percentile(50)),
+                ("p90_ms", self.percentile(90)),
+                ("p99_ms", self.percentile(99)),
+                ("buckets", buckets),
+            ]
+        )
+
+
+class Trace(object):
+    """ the timings of one request, {name: [calls, ms]}. the executor
+    may run calls of one request on several threads at once.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.timings = {}
+        self.lock = threading.Lock()
+        # api methods calling each other only count the outermost call
+        # so that the breakdown adds up, the nesting is per thread
+        self.local = threading.local()
+
+    def enter(self):
+        self.local.depth = getattr(self.local, "depth", 0) + 1
+
+    def leave(self):
+        """ True when leaving the outermost call of this thread """
+        self.local.depth -= 1
+        return self.local.depth == 0
+
+    def add(self, name, ms):
+        with self.lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = [0, 0.0]
+            timing[0] += 1
+            timing[1] += ms
+
+    def breakdown(self, limit=10):
+        """ the names that took the most time, as 'name=calls/ms' """
+        with self.lock:
+            timings = sorted(self.timings.iteritems(), key=lambda t: -t[1][1])
+        return ", ".join(
+            "%s=%d/%.1fms" % (name, calls, ms) for name, (calls, ms) in timings[:limit]
+        )
+
+
+class LatencyStats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # a statsd.StatsClient, request and query timings are sent there
+        self.statsd = None
+
+        self.since = time.time()
+        self.groups = {}
+
+    def reset(self):
+        # histograms are cleared in place, time_method holds on to its own
+        with self.lock:
+            self.since = time.time()
+            for histograms in self.groups.itervalues():
+                for histogram in histograms.itervalues():
+                    histogram.clear()
+
+    def histogram(self, group, name):
+        with self.lock:
+            histograms = self.groups.setdefault(group, {})
+            histogram = histograms.get(name)
+            if histogram is None:
+                if len(histograms) >= MAX_NAMES:
+                    name = OVERFLOW
+                histogram = histograms.setdefault(name, Histogram())
+            return histogram
+
+    def record(self, group, name, ms):
+        self.histogram(group, name).add(ms)
+
+    def send(self, stat, ms):
+        if self.statsd is not None:
+            self.statsd.timing(stat, ms)
+
+    def resume_trace(self, trace):
+        """ collects the calls made on this thread into trace, for a
+        thread running a call on behalf of trace's request
+        """
+        self.local.trace = trace
+
+    def end_trace(self, trace):
+        if getattr(self.local, "trace", None) is trace:
+            self.local.trace = None
+
+    def current_trace(self):
+        return getattr(self.local, "trace", None)
+
+    def time_method(self, fn):
+        """ wraps an api method, timed in the "methods" group """
+        name = fn.__name__
+        histogram = self.histogram("methods", name)
+        local = self.local
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            trace = getattr(local, "trace", None)
+            if trace is not None:
+                trace.enter()
+
+            t = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                ms = (time.time() - t) * 1000
+                histogram.add(ms)
+                if trace is not None and trace.leave():
+                    trace.add(name, ms)
+
+        return timed
+
+    def time_query(self, name, ms, trace=None):
+        """ times a query in the "queries" group and in trace, by default
+        the trace of this thread
+        """
+        self.record("queries", name, ms)
+        self.send("query.%s" % name, ms)
+        if trace is None:
+            trace = self.current_trace()
+        if trace is not None:
+            trace.add("query:%s" % name, ms)
+
+    def to_json(self):
+        with self.lock:
+            groups = OrderedDict(
+                (
+                    group,
+                    OrderedDict(
+                        (name, histograms[name].to_json())
+                        for name in sorted(histograms)
+                        if histograms[name].count
+                    ),
+                )
+                for group, histograms in sorted(self.groups.iteritems())
+            )
+
+        return OrderedDict(
+            [("since", self.since), ("uptime", time.time() - self.since)]
+            + groups.items()
+        )
+
+
+# the process wide stats
+STATS = LatencyStats()
+
+
+def untimed(fn):
+    """ leaves a method out of instrument, for the lookups templates make
+    for every term on a page, where the histogram's lock would cost more
+    than the lookup itself
+    """
+    fn.untimed = True
+    return fn
+
+
+def instrument(cls):
+    """ class decorator timing every public method of cls in STATS,
+    except the untimed ones
+    """
+    for name, attr in cls.__dict__.items():
+        if name.startswith("_") or not callable(attr):
+            continue
+        if getattr(attr, "untimed", False):
+            continue
+        setattr(cls, name, STATS.time_method(attr))
+    return cls
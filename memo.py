@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""
+Memoization of RDFApi lookups, keyed by graph generation and arguments.
+"""
+
+import threading
+import functools
+
+
+class MemoCache(object):
+    """ remembers method results for one graph generation
+
+    every entry belongs to the generation it was computed in, looking
+    anything up for another generation drops them all. when max_entries
+    is reached the cache is emptied, like the re module does, which
+    keeps hits down to a single dict lookup.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.generation = None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, generation, key):
+        """ returns (found, value) """
+        if generation != self.generation:
+            self.invalidate(generation)
+
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return False, None
+        except TypeError:
+            # unhashable arguments are never cached
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        return True, value
+
+    def put(self, generation, key, value):
+        with self.lock:
+            if generation != self.generation or self.max_entries <= 0:
+                return
+
+            if len(self.entries) >= self.max_entries:
+                self.entries = {}
+                self.evictions += 1
+
+            try:
+                self.entries[key] = value
+            except TypeError:
+                pass
+
+    def invalidate(self, generation=None):
+        with self.lock:
+            self.generation = generation
+            self.entries = {}
+
+    def to_json(self):
+        return dict(
+            generation=self.generation,
+            entries=len(self.entries),
+            max_entries=self.max_entries,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+def memoized(fn):
+    """ caches fn(self, *args) in self.memo for self.generation, the
+    value is shared by every caller so it must not be mutated
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def cached(self, *args):
+        key = (name, args)
+        generation = self.generation
+        found, value = self.memo.get(generation, key)
+        if found:
+            return value
+
+        value = fn(self, *args)
+        self.memo.put(generation, key, value)
+        return value
+
+    return cached
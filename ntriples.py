@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+"""
+N-Triples terms, written the same by schemadiff.py and the CONSTRUCT
+results of sparql.py.
+"""
+
+import rdflib
+
+
+def nt_term(term):
+    """ term as N-Triples, literals escaped """
+    if isinstance(term, rdflib.term.Literal):
+        value = u'"%s"' % (
+            term.replace(u"\\", u"\\\\")
+            .replace(u"\n", u"\\n")
+            .replace(u'"', u'\\"')
+            .replace(u"\r", u"\\r")
+        )
+        if term.language:
+            return u"%s@%s" % (value, term.language)
+        if term.datatype:
+            return u"%s^^<%s>" % (value, term.datatype)
+        return value
+    if isinstance(term, rdflib.term.BNode):
+        return u"_:%s" % term
+    return u"<%s>" % term
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import gzip
+import hashlib
+import threading
+from StringIO import StringIO
+from collections import OrderedDict, namedtuple
+
+# body is the rendered page, gzipped is the pre-compressed body or None
+Page = namedtuple("Page", ["body", "etag", "gzipped"])
+
+
+def gzip_bytes(data, level=9):
+    """ gzips data with a fixed mtime so the output is reproducible """
+    out = StringIO()
+    f = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=level, mtime=0)
+    f.write(data)
+    f.close()
+    return out.getvalue()
+
+
+def accepts_encoding(accept_encoding, coding):
+    """ whether an Accept-Encoding header takes coding, by its q-value or
+    that of "*". "gzip;q=0" refuses gzip.
+    """
+    q = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        q[name.strip().lower()] = weight
+
+    return q.get(coding, q.get("*", 0.0)) > 0
+
+
+class PageCache(object):
+    """ a size bounded LRU cache of rendered pages
+
+    keys are expected to carry the graph generation the page was rendered
+    from, so pages of an older graph are never served and simply age out.
+    """
+
+    def __init__(self, max_bytes, compress=False):
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.pages = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def page_size(page):
+        return len(page.body) + len(page.gzipped or "")
+
+    def make_page(self, body, compress=None):
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+        if compress is None:
+            compress = self.compress
+
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        gzipped = gzip_bytes(body) if compress else None
+        return Page(body, etag, gzipped)
+
+    def get(self, key):
+        with self.lock:
+            page = self.pages.pop(key, None)
+            if page is None:
+                self.misses += 1
+                return None
+
+            # re-insert to mark it as most recently used
+            self.pages[key] = page
+            self.hits += 1
+            return page
+
+    def put(self, key, body, compress=None):
+        """ builds a page out of body, caches it if it fits and returns it.
+        compress overrides the cache's own for pieces of pages that are
+        never sent on their own.
+        """
+        page = self.make_page(body, compress)
+        size = self.page_size(page)
+        if size > self.max_bytes:
+            return page
+
+        with self.lock:
+            old = self.pages.pop(key, None)
+            if old is not None:
+                self.nbytes -= self.page_size(old)
+
+            while self.pages and self.nbytes + size > self.max_bytes:
+                _, evicted = self.pages.popitem(last=False)
+                self.nbytes -= self.page_size(evicted)
+
+            self.pages[key] = page
+            self.nbytes += size
+
+        return page
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.nbytes = 0
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import bisect
+
+
+class PrefixIndex(object):
+    """ case insensitive label prefix lookups for type-ahead
+
+    labels are kept sorted so the matches of a prefix are one contiguous
+    slice found by bisection. matches are ranked by a per term key; the
+    ranked matches of every short prefix are computed up front since
+    those are the ones with many matches.
+    """
+
+    # prefixes up to this length have their ranking precomputed
+    PRECOMPUTED_PREFIX_LEN = 2
+
+    def __init__(self, entries):
+        """ entries are (label, rank, term), a lower rank comes first """
+        entries = sorted((label.lower(), rank, term) for label, rank, term in entries)
+        self.keys = [e[0] for e in entries]
+        self.entries = entries
+
+        ranked = {}
+        for n in xrange(1, self.PRECOMPUTED_PREFIX_LEN + 1):
+            for key, rank, term in entries:
+                if len(key) >= n:
+                    ranked.setdefault(key[:n], []).append((rank, key, term))
+
+        self.ranked = {
+            prefix: [term for _, _, term in sorted(matches)]
+            for prefix, matches in ranked.iteritems()
+        }
+
+    def matches(self, prefix):
+        """ all terms whose label starts with prefix, best first """
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+
+        ranked = self.ranked.get(prefix)
+        if ranked is not None or len(prefix) <= self.PRECOMPUTED_PREFIX_LEN:
+            return ranked or []
+
+        lo = bisect.bisect_left(self.keys, prefix)
+        # u"\uffff" sorts after every character a label can continue with
+        hi = bisect.bisect_right(self.keys, prefix + u"\uffff", lo)
+        matches = sorted((rank, key, term) for key, rank, term in self.entries[lo:hi])
+        return [term for _, _, term in matches]
+
+    def lookup(self, prefix, offset=0, limit=10):
+        """ returns (number of matches, one page of the best matches) """
+        matches = self.matches(prefix)
+        return len(matches), matches[offset : offset + limit]
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+
+"""
+Renders the schema to a directory of static files, for hosting it
+without a server.
+
+Every class and property page, the tree tab with one fragment per
+expandable branch, the full schema and a client side search page with
+its json index are written with the server's own templates, each next
+to a gzipped copy for hosts that serve precompressed files.
+
+Pages are rendered in a pool of worker processes that inherit the
+loaded graph by forking. A manifest remembers a digest of the triples
+every page was rendered from, re-running over the same directory only
+renders the pages whose triples (or the templates) changed and removes
+the pages of terms that are gone.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import multiprocessing
+
+import rdflib
+from funcserver.funcserver import Server, TemplateLoader, resolve_path
+
+from pagecache import gzip_bytes
+
+MANIFEST = "prerender.json"
+MANIFEST_VERSION = 1
+
+THING = "http://schema.org/Thing"
+
+# set in the parent right before the pool forks, see render_job
+_prerenderer = None
+
+
+class StaticRequest(object):
+    """ the little of a request the templates look at """
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.path = uri
+        self.arguments = {}
+
+
+class TemplateModules(object):
+    """ {% module Template(...) %} for rendering outside a request,
+    like tornado's, the included template sees the page's namespace
+    """
+
+    def __init__(self, loader, namespace):
+        self.loader = loader
+        self.namespace = namespace
+
+    def Template(self, path, **kwargs):
+        ns = dict(self.namespace, **kwargs)
+        return self.loader.load(path).generate(_tt_modules=self, **ns)
+
+
+def static_url(path):
+    return "/static/%s" % path
+
+
+def page_file(path):
+    """ relative file a page at path is written to """
+    return os.path.join(path.strip("/"), "index.html")
+
+
+def children_file(path):
+    """ relative file the children of the term with its page at path are
+    written to, see childrenUrl in tree_schema_tab.html
+    """
+    return "%s.html" % path.replace("/schema/", "schema/children/", 1)
+
+
+def write_file(out_dir, relpath, chunks):
+    """ writes the chunks to relpath and a gzipped copy to relpath.gz,
+    through temporary files so a host never serves half a page
+    """
+    path = os.path.join(out_dir, relpath)
+    d = os.path.dirname(path)
+    if not os.path.exists(d):
+        try:
+            os.makedirs(d)
+        except OSError:
+            pass  # another worker made it
+
+    nbytes = 0
+    with open(path + ".tmp", "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            nbytes += len(chunk)
+
+    with open(path + ".tmp", "rb") as f:
+        gzipped = gzip_bytes(f.read())
+    with open(path + ".gz.tmp", "wb") as f:
+        f.write(gzipped)
+
+    os.rename(path + ".tmp", path)
+    os.rename(path + ".gz.tmp", path + ".gz")
+    return nbytes
+
+
+def render_job(job):
+    """ runs in a worker, returns (relpath, bytes written) """
+    return _prerenderer.run_job(job)
+
+
+class Prerenderer(object):
+    """ full_schema is the (template, marker) of FullSchemaHandler, the
+    sections are rendered where the marker is
+    """
+
+    def __init__(self, server, api, out_dir, full_schema, log):
+        self.server = server
+        self.full_schema = full_schema
+        self.api = api
+        self.out_dir = out_dir
+        self.log = log
+
+        self.loader = TemplateLoader([resolve_path(Server.TEMPLATE_PATH)])
+        self.loader = server.prepare_template_loader(self.loader) or self.loader
+
+        self.namespace = server.define_template_namespace()
+        self.namespace.update(api=api, static_url=static_url, static_site=True)
+
+        self.term_digests = {}
+
+    # rendering, in the workers
+
+    def render(self, template, uri, **kwargs):
+        ns = dict(self.namespace, request=StaticRequest(uri), handler=None)
+        ns.update(kwargs)
+        modules = TemplateModules(self.loader, ns)
+        return self.loader.load(template).generate(_tt_modules=modules, **ns)
+
+    def iter_full_schema(self):
+        # the same shell and sections FullSchemaHandler streams
+        template, marker = self.full_schema
+        page = self.render(template, "/schema/full")
+        head, _, tail = page.partition(marker)
+        yield head
+        for term in self.api.iter_hierarchy(THING):
+            yield self.render(
+                "single_schema.html", "/schema/full", api=self.api, subject=term
+            )
+        yield tail
+
+    def terms(self):
+        api = self.api
+        terms = api.classes | api.properties
+        return sorted(t for t in terms if isinstance(t, rdflib.term.URIRef))
+
+    def search_index(self):
+        api = self.api
+        docs = []
+        for term in self.terms():
+            docs.append(
+                dict(
+                    uri=term.toPython(),
+                    label=api.get_label(term),
+                    kind=api.get_kind(term),
+                    href=api.get_id(term),
+                    desc=api.get_desc(term),
+                )
+            )
+        return json.dumps(docs, sort_keys=True)
+
+    def run_job(self, job):
+        kind, arg, relpath = job[0], job[1], job[2]
+        if kind == "term":
+            uri = self.api.get_id(arg)
+            chunks = [self.render("single_schema_tab.html", uri)]
+        elif kind == "children":
+            chunks = [self.render("tree_children.html", "", term=arg)]
+        elif kind == "tree":
+            chunks = [self.render("tree_schema_tab.html", "/schema/tree")]
+        elif kind == "full":
+            chunks = self.iter_full_schema()
+        elif kind == "search":
+            chunks = [self.render("search_tab.html", "/schema/search")]
+        elif kind == "search_index":
+            chunks = [self.search_index()]
+        elif kind == "home":
+            chunks = [
+                '<html><head><meta http-equiv="refresh" content="0; url=%s/">'
+                "</head></html>" % self.api.get_id(THING)
+            ]
+        else:
+            raise ValueError("unknown job %s" % kind)
+
+        chunks = (c.encode("utf8") if isinstance(c, unicode) else c for c in chunks)
+        return relpath, write_file(self.out_dir, relpath, chunks)
+
+    # what to render, in the parent
+
+    def term_digest(self, term):
+        """ digest of the triples term is the subject of """
+        digest = self.term_digests.get(term)
+        if digest is None:
+            lines = sorted(
+                "%s %s" % (p.n3(), o.n3())
+                for p, o in self.api.graph.predicate_objects(term)
+            )
+            digest = hashlib.sha1("\n".join(lines).encode("utf8")).hexdigest()
+            self.term_digests[term] = digest
+        return digest
+
+    def digest(self, kind, terms):
+        h = hashlib.sha1(self.templates_digest)
+        h.update(kind)
+        for term in sorted(terms):
+            h.update(term.encode("utf8"))
+            h.update(self.term_digest(term))
+        return h.hexdigest()
+
+    def term_deps(self, term):
+        """ the terms a term's page shows anything of: its ancestors, the
+        properties it is the domain of directly or by inheritance or the
+        range of, and whatever all of those point to
+        """
+        api = self.api
+        base = set(api.get_ancestors(term))
+        props = set(api.class_to_range_properties.get(term, ()))
+        for ancestor in base:
+            props.update(api.class_to_domain_properties.get(ancestor, ()))
+
+        deps = base | props
+        for subject in list(deps):
+            deps.update(
+                o
+                for o in api.graph.objects(subject)
+                if isinstance(o, rdflib.term.URIRef)
+            )
+        return deps
+
+    def children_deps(self, term):
+        """ a branch shows its subclasses and whether they have any """
+        children = self.api.term_to_children.get(term, ())
+        deps = set([term])
+        for child in children:
+            deps.add(child)
+            deps.update(self.api.term_to_children.get(child, ()))
+        return deps
+
+    def jobs(self):
+        """ every page as (kind, arg, relpath, digest) """
+        api = self.api
+        thing = rdflib.term.URIRef(THING)
+        everything = set(
+            s for s in api.graph.subjects() if isinstance(s, rdflib.term.URIRef)
+        )
+
+        jobs = []
+        for term in self.terms():
+            path = api.get_id(term)
+            relpath = page_file(path)
+            jobs.append(
+                ("term", term, relpath, self.digest("term", self.term_deps(term)))
+            )
+
+            if api.has_descendants(term):
+                deps = self.children_deps(term)
+                jobs.append(
+                    (
+                        "children",
+                        term,
+                        children_file(path),
+                        self.digest("children", deps),
+                    )
+                )
+
+        tree_deps = self.children_deps(thing)
+        all_digest = self.digest("all", everything)
+        jobs.extend(
+            [
+                (
+                    "tree",
+                    None,
+                    page_file("/schema/tree"),
+                    self.digest("tree", tree_deps),
+                ),
+                ("full", None, page_file("/schema/full"), all_digest),
+                (
+                    "search",
+                    None,
+                    page_file("/schema/search"),
+                    self.digest("search", []),
+                ),
+                ("search_index", None, "schema/search/index.json", all_digest),
+                ("home", None, "index.html", self.digest("home", [])),
+            ]
+        )
+        return jobs
+
+    def template_files(self):
+        for d in self.loader.dirs:
+            for name in sorted(os.listdir(d)):
+                path = os.path.join(d, name)
+                if os.path.isfile(path):
+                    yield path
+
+    def load_manifest(self):
+        path = os.path.join(self.out_dir, MANIFEST)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest.get("pages", {})
+
+    def save_manifest(self, pages):
+        path = os.path.join(self.out_dir, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump(dict(version=MANIFEST_VERSION, pages=pages), f, sort_keys=True)
+        os.rename(path + ".tmp", path)
+
+    def copy_static(self):
+        """ the css, js and fonts the pages link to """
+        src = resolve_path(Server.STATIC_PATH)
+        dst = os.path.join(self.out_dir, "static")
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        shutil.copytree(src, dst)
+
+    def run(self, workers=1):
+        """ renders what changed since the last run, returns the files
+        (rendered, unchanged, removed)
+        """
+        global _prerenderer
+
+        h = hashlib.sha1()
+        for path in self.template_files():
+            with open(path, "rb") as f:
+                h.update(f.read())
+        self.templates_digest = h.hexdigest()
+
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+
+        old = self.load_manifest()
+        jobs = self.jobs()
+        pages = {}
+        todo = []
+        for kind, arg, relpath, digest in jobs:
+            pages[relpath] = digest
+            exists = os.path.exists(os.path.join(self.out_dir, relpath))
+            if old.get(relpath) != digest or not exists:
+                todo.append((kind, arg, relpath))
+
+        self.log.info(
+            "prerendering pages=%d changed=%d workers=%d", len(jobs), len(todo), workers
+        )
+
+        if todo:
+            _prerenderer = self
+            if workers > 1:
+                pool = multiprocessing.Pool(workers)
+                try:
+                    done = list(pool.imap_unordered(render_job, todo, chunksize=16))
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                done = map(render_job, todo)
+            _prerenderer = None
+            self.log.info(
+                "rendered pages=%d bytes=%d", len(done), sum(n for _, n in done)
+            )
+
+        removed = sorted(set(old) - set(pages))
+        for relpath in removed:
+            for path in (relpath, relpath + ".gz"):
+                path = os.path.join(self.out_dir, path)
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self.copy_static()
+        self.save_manifest(pages)
+        rendered = [job[2] for job in todo]
+        unchanged = sorted(set(pages) - set(rendered))
+        return rendered, unchanged, removed
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+
+"""
+Semantic diff between two versions of the schema, for reviewing what a
+release changes.
+
+Each version is turned into a sorted stream of N-Triples lines, sorted
+in chunks spilled to temporary files and merged, so only a chunk of
+lines is ever held besides the graph. Walking both streams side by side
+tells the triples only the old version has from the ones only the new
+one has, and since the lines are sorted by subject every term's triples
+come together. Those are reported per term:
+
+    added / removed classes and properties
+    parents     rdfs:subClassOf and rdfs:subPropertyOf moves
+    domains     schema:domainIncludes changes
+    ranges      schema:rangeIncludes changes
+    other       any other predicate, labels and comments included
+
+Triples with blank nodes are left out, blank nodes have no identity
+that carries over from one load to the next. From the command line:
+
+    python schemadiff.py --old <RDFDIR> --new <RDFDIR> [--json]
+"""
+
+import os
+import sys
+import json
+import heapq
+import logging
+import argparse
+import itertools
+import tempfile
+import multiprocessing
+
+import rdflib
+
+from ntriples import nt_term
+
+SDO = "http://schema.org/"
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+RDF_TYPE = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+RDFS_CLASS = "<http://www.w3.org/2000/01/rdf-schema#Class>"
+RDF_PROPERTY = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#Property>"
+
+# predicate -> the section of a term's changes it goes in
+SECTIONS = {
+    "<http://www.w3.org/2000/01/rdf-schema#subClassOf>": "parents",
+    "<http://www.w3.org/2000/01/rdf-schema#subPropertyOf>": "parents",
+    "<http://schema.org/domainIncludes>": "domains",
+    "<http://schema.org/rangeIncludes>": "ranges",
+    RDF_TYPE: "types",
+}
+
+# lines sorted in memory before they are spilled to a temporary file
+SPILL_LINES = 200000
+
+
+def graph_lines(graph):
+    """ the triples of graph as utf-8 N-Triples lines, unsorted """
+    BNode = rdflib.term.BNode
+    for s, p, o in graph.triples((None, None, None)):
+        if isinstance(s, BNode) or isinstance(o, BNode):
+            continue
+        yield (u"%s %s %s ." % (nt_term(s), nt_term(p), nt_term(o))).encode("utf-8")
+
+
+def split_line(line):
+    """ (subject, predicate, object) of a line, as N-Triples terms """
+    s, p, o = line.split(" ", 2)
+    return s, p, o[:-2]
+
+
+def spill(lines):
+    f = tempfile.TemporaryFile()
+    for line in lines:
+        f.write(line)
+        f.write("\n")
+    f.seek(0)
+    return f
+
+
+def read_spilled(f):
+    try:
+        for line in f:
+            yield line[:-1]
+    finally:
+        f.close()
+
+
+def sorted_lines(lines, spill_lines=SPILL_LINES):
+    """ lines sorted and without duplicates, chunks of spill_lines are
+    sorted and spilled to temporary files which are merged at the end
+    """
+    spilled = []
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= spill_lines:
+            chunk.sort()
+            spilled.append(spill(chunk))
+            chunk = []
+    chunk.sort()
+
+    previous = None
+    streams = [read_spilled(f) for f in spilled] + [iter(chunk)]
+    for line in heapq.merge(*streams):
+        if line != previous:
+            yield line
+            previous = line
+
+
+def merge(old, new):
+    """ (sign, line) of two sorted streams, - for lines only in old, +
+    for lines only in new and = for lines in both
+    """
+    old, new = iter(old), iter(new)
+    a, b = next(old, None), next(new, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a < b):
+            yield "-", a
+            a = next(old, None)
+        elif a is None or b < a:
+            yield "+", b
+            b = next(new, None)
+        else:
+            yield "=", a
+            a, b = next(old, None), next(new, None)
+
+
+def display(term):
+    """ Person for <http://schema.org/Person>, rdfs:label for the rdfs
+    uri, other uris unbracketed, literals stay N-Triples
+    """
+    if term.startswith("<") and term.endswith(">"):
+        term = term[1:-1]
+        if term.startswith(SDO):
+            term = term[len(SDO) :]
+        elif term.startswith(RDFS):
+            term = "rdfs:" + term[len(RDFS) :]
+        elif term.startswith(RDF):
+            term = "rdf:" + term[len(RDF) :]
+    return term.decode("utf-8")
+
+
+class TermDiff(object):
+    """ the changes to one subject """
+
+    def __init__(self, subject):
+        self.uri = subject[1:-1].decode("utf-8")
+        self.name = display(subject)
+        self.kind = None
+        self.status = "changed"
+        # section -> {"added": [...], "removed": [...]}
+        self.sections = {}
+        # types in both versions, only in the old one, only in the new one
+        self.types = {"=": set(), "-": set(), "+": set()}
+
+    def add(self, sign, predicate, obj):
+        if predicate == RDF_TYPE:
+            self.types[sign].add(obj)
+        if sign == "=":
+            return
+
+        section = SECTIONS.get(predicate, "other")
+        value = display(obj)
+        if section == "other":
+            value = "%s %s" % (display(predicate), value)
+
+        changes = self.sections.setdefault(section, {"added": [], "removed": []})
+        changes["added" if sign == "+" else "removed"].append(value)
+
+    def finish(self):
+        types = set().union(*self.types.values())
+        if RDFS_CLASS in types:
+            self.kind = "class"
+        elif RDF_PROPERTY in types:
+            self.kind = "property"
+
+        if self.types["+"] and not self.types["="] and not self.types["-"]:
+            self.status = "added"
+        elif self.types["-"] and not self.types["="] and not self.types["+"]:
+            self.status = "removed"
+
+    def to_json(self):
+        return dict(
+            uri=self.uri,
+            name=self.name,
+            kind=self.kind,
+            status=self.status,
+            changes=self.sections,
+        )
+
+
+class SchemaDiff(object):
+    """ the per term changes between two sorted line streams """
+
+    def __init__(self, old_lines, new_lines):
+        self.terms = []
+        self.triples = {"=": 0, "-": 0, "+": 0}
+
+        subject = lambda signed: signed[1].split(" ", 1)[0]
+        for s, signed in itertools.groupby(merge(old_lines, new_lines), subject):
+            term = TermDiff(s)
+            changed = False
+            for sign, line in signed:
+                self.triples[sign] += 1
+                changed = changed or sign != "="
+                term.add(sign, *split_line(line)[1:])
+
+            if changed:
+                term.finish()
+                self.terms.append(term)
+
+    def select(self, status=None, kind=None, section=None):
+        return [
+            t
+            for t in self.terms
+            if (status is None or t.status == status)
+            and (kind is None or t.kind == kind)
+            and (section is None or section in t.sections)
+        ]
+
+    def summary(self):
+        return dict(
+            added_classes=len(self.select("added", "class")),
+            removed_classes=len(self.select("removed", "class")),
+            added_properties=len(self.select("added", "property")),
+            removed_properties=len(self.select("removed", "property")),
+            moved=len(self.select("changed", section="parents")),
+            domains=len(self.select("changed", section="domains")),
+            ranges=len(self.select("changed", section="ranges")),
+            changed=len(self.select("changed")),
+            triples_added=self.triples["+"],
+            triples_removed=self.triples["-"],
+            triples_unchanged=self.triples["="],
+        )
+
+    def to_json(self):
+        return dict(summary=self.summary(), terms=[t.to_json() for t in self.terms])
+
+    def to_text(self):
+        lines = ["%s: %s" % kv for kv in sorted(self.summary().iteritems())]
+        for term in self.terms:
+            lines.append("")
+            lines.append("%s %s %s" % (term.status, term.kind or "term", term.uri))
+            for section, changes in sorted(term.sections.iteritems()):
+                for sign, key in (("-", "removed"), ("+", "added")):
+                    for value in changes[key]:
+                        lines.append("  %s %s %s" % (sign, section, value))
+        return "\n".join(lines)
+
+
+class Version(object):
+    """ the sorted lines of a schema version, kept in a temporary file
+    so the graph they came from can go
+    """
+
+    def __init__(self, lines):
+        fd, self.path = tempfile.mkstemp(prefix="sdo-diff-", suffix=".nt")
+        self.count = 0
+        with os.fdopen(fd, "wb") as f:
+            for line in sorted_lines(lines):
+                f.write(line)
+                f.write("\n")
+                self.count += 1
+
+    def lines(self):
+        with open(self.path, "rb") as f:
+            for line in f:
+                yield line[:-1]
+
+    def close(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def load_version(rdf_dirs, workers, log):
+    """ the Version of the rdf files in rdf_dirs, parsed by RDFApi """
+    from sdoserver import RDFApi
+
+    api = RDFApi(log)
+    api.add_files(RDFApi.find_files(rdf_dirs), workers)
+    return Version(graph_lines(api.graph))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--old", action="append", required=True, help="rdf dir, repeatable"
+    )
+    parser.add_argument(
+        "--new", action="append", required=True, help="rdf dir, repeatable"
+    )
+    parser.add_argument(
+        "--workers", default=multiprocessing.cpu_count(), type=int,
+    )
+    parser.add_argument("--json", default=False, action="store_true")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=args.log_level.upper())
+    log = logging.getLogger("schemadiff")
+
+    old = load_version(args.old, args.workers, log)
+    new = load_version(args.new, args.workers, log)
+    try:
+        diff = SchemaDiff(old.lines(), new.lines())
+    finally:
+        old.close()
+        new.close()
+
+    if args.json:
+        sys.stdout.write(json.dumps(diff.to_json(), indent=2, sort_keys=True))
+    else:
+        sys.stdout.write(diff.to_text().encode("utf-8"))
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,16 +7,52 @@ old_patchall = monkey.patch_all
 monkey.patch_all = lambda: None  # try old_patchall(socket=False, threading=False) later
 
 import os
+import json
+import time
 import glob
+import calendar
+import collections
+import email.utils
 import rdflib
 import shutil
-import unittest
-from StringIO import StringIO
+import traceback
+import threading
+import statsd
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import tornado.gen
+import tornado.escape
 import tornado.web
+import tornado.ioloop
+import tornado.netutil
+import tornado.httputil
+import tornado.process
+import tornado.httpserver
 from rdflib.plugins.sparql import prepareQuery
-from funcserver import Server, make_handler, BaseHandler
+from funcserver import Server, BaseHandler
 
 from search import RDFSearch
+from pagecache import PageCache, accepts_encoding, gzip_bytes
+from prefix import PrefixIndex
+from consistency import ConsistencyReport, ReportFile
+from latency import STATS, Trace, instrument, untimed
+from prerender import Prerenderer
+from memo import MemoCache, memoized
+from termstore import TermStore, FrozenTable
+from executor import BoundedExecutor, Saturated
+from export import ExportCache, parse_range, RangeNotSatisfiable
+from jsonldcontext import ContextCache, UnknownNamespace
+from validation import Constraints, ValidationPool
+from sparql import (
+    CONTENT_TYPES,
+    PlanCache,
+    QueryError,
+    QueryTimeout,
+    SparqlRunner,
+)
+import validation
+from schemadiff import SchemaDiff, load_version, graph_lines, sorted_lines
+import snapshot
 
 make_term = lambda x: rdflib.term.URIRef(x) if isinstance(x, basestring) else x
 
@@ -24,22 +60,102 @@ HTTPSS = "http://"
 LHTTPSS = len(HTTPSS)
 
 
+def term_path(term):
+    """ the /schema/ path of the page of a known term """
+    termstr = term.toPython()
+    if termstr.startswith(HTTPSS):
+        termstr = termstr[LHTTPSS:]
+
+    return "/schema/%s" % termstr
+
+
+def parse_rdf_file(fname):
+    """ parses fname in a worker process for RDFApi.add_files
+
+    returns (fname, packed triples or None, seconds taken, error or None)
+    """
+    t = time.time()
+    try:
+        fmt = RDFApi.EXT_TO_FORMAT[os.path.splitext(fname)[1]]
+        graph = rdflib.Graph()
+        graph.load(fname, format=fmt)
+        data = snapshot.pack_graph(graph)
+    except Exception:
+        return fname, None, time.time() - t, traceback.format_exc()
+
+    return fname, data, time.time() - t, None
+
+
+@instrument
 class RDFApi(object):
     EXT_TO_FORMAT = {".rdfa": "rdfa", ".jsonld": "json-ld"}
     RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+    SUBCLASS_OF = make_term(RDFS + "subClassOf")
     DOMAIN_INCLUDES = make_term("http://schema.org/domainIncludes")
     RANGE_INCLUDES = make_term("http://schema.org/rangeIncludes")
 
+    # the tables built by reload_term_meta and how they are snapshotted
+    TERM_META_TABLES = {
+        "classes": snapshot.SET,
+        "properties": snapshot.SET,
+        "term_to_label": snapshot.TO_STR,
+        "term_to_desc": snapshot.TO_STR,
+        "term_to_parents": snapshot.TO_LIST,
+        "term_to_children": snapshot.TO_LIST,
+        "term_to_ancestors": snapshot.TO_LIST,
+        "class_to_domain_properties": snapshot.TO_DICT,
+        "class_to_range_properties": snapshot.TO_DICT,
+        "property_to_domains": snapshot.TO_LIST,
+        "property_to_ranges": snapshot.TO_LIST,
+        "term_to_link": snapshot.TO_STR,
+    }
+
+    # the fields get_terms_meta knows about
+    TERM_META_FIELDS = (
+        "kind",
+        "label",
+        "desc",
+        "ancestors",
+        "descendants",
+        "domain_properties",
+        "range_properties",
+        "predicate_objects",
+    )
+
+    # most lookups remembered per graph generation, see memo.py
+    MEMO_ENTRIES = 100000
+
     def __init__(self, log):
         # the directory where all rdf files are
         self.log = log
+        # the triples of every file live in a context of their own, see
+        # file_context
         self.files = set()
         self.graph = RDFApi.new_graph()
+        # bumped every time the derived term meta is rebuilt, anything
+        # cached off the graph should be keyed by it
+        self.generation = 0
+        self.memo = MemoCache(RDFApi.MEMO_ENTRIES)
         self.prepare_queries()
 
+    @classmethod
+    def find_files(cls, rdf_dirs):
+        """ the rdf files of a supported format in rdf_dirs """
+        filelist = []
+        for rdf_dir in map(os.path.abspath, rdf_dirs):
+            for ext in RDFApi.EXT_TO_FORMAT.iterkeys():
+                files = glob.glob(os.path.join(rdf_dir, "*%s" % ext))
+                filelist.extend(files)
+
+        return filelist
+
     @classmethod
     def new_graph(cls):
-        return rdflib.Graph()
+        return rdflib.ConjunctiveGraph()
+
+    def file_context(self, fname):
+        """ the named graph holding the triples loaded from fname """
+        return self.graph.get_context(rdflib.term.URIRef("file://%s" % fname))
 
     def add_file(self, fname):
         """ add a file to the graph """
@@ -54,10 +170,147 @@ class RDFApi(object):
             raise Exception("Unsupported ext %s for %s" % (ext, fname))
 
         self.log.debug("loading into graph file=%s", fname)
-        self.graph.load(fname, format=fmt)
+        self.file_context(fname).load(fname, format=fmt)
         self.log.debug("done loading file=%s", fname)
         self.files.add(fname)
 
+    def add_files(self, fnames, workers=1):
+        """ adds many files to the graph, parsing them in a pool of
+        worker processes when workers > 1
+        """
+        todo = []
+        for fname in fnames:
+            if fname in self.files or fname in todo:
+                self.log.warning("file %s already added, not adding again...", fname)
+                continue
+
+            name, ext = os.path.splitext(fname)
+            if ext not in RDFApi.EXT_TO_FORMAT:
+                raise Exception("Unsupported ext %s for %s" % (ext, fname))
+
+            todo.append(fname)
+
+        if workers <= 1 or len(todo) <= 1:
+            for fname in todo:
+                t = time.time()
+                self.add_file(fname)
+                self.log.info("loaded file=%s time=%.2fs", fname, time.time() - t)
+            return
+
+        self.log.info("parsing %d files with %d workers", len(todo), workers)
+        failed = []
+        pool = multiprocessing.Pool(min(workers, len(todo)))
+        try:
+            for fname, data, elapsed, error in pool.imap_unordered(
+                parse_rdf_file, todo
+            ):
+                if error is not None:
+                    self.log.error("failed to parse file=%s\n%s", fname, error)
+                    failed.append(fname)
+                    continue
+
+                t = time.time()
+                ntriples = snapshot.unpack_graph(data, self.file_context(fname))
+                self.files.add(fname)
+                self.log.info(
+                    "loaded file=%s triples=%d parse_time=%.2fs merge_time=%.2fs",
+                    fname,
+                    ntriples,
+                    elapsed,
+                    time.time() - t,
+                )
+        finally:
+            pool.close()
+            pool.join()
+
+        if failed:
+            raise Exception("could not parse files %s" % ", ".join(failed))
+
+    def remove_file(self, fname):
+        """ drops every triple that was loaded from fname """
+        self.graph.remove_context(self.file_context(fname))
+        self.files.discard(fname)
+
+    def copy_files(self, api, fnames):
+        """ copies the triples of already parsed files from another api """
+        for fname in fnames:
+            context = self.file_context(fname)
+            context.addN((s, p, o, context) for s, p, o in api.file_context(fname))
+            self.files.add(fname)
+
+    def save_snapshot(self, path, fingerprints):
+        """ writes the graph and term meta to path, fingerprints are those
+        of the files the graph was loaded from (see snapshot.fingerprints)
+        """
+        self.log.info("writing snapshot %s", path)
+        tables = {
+            name: (kind, getattr(self, name))
+            for name, kind in RDFApi.TERM_META_TABLES.iteritems()
+        }
+        snapshot.dump(path, fingerprints, self.graph, tables)
+
+    def load_snapshot(self, path, fingerprints, freeze=False):
+        """ loads graph and term meta from the snapshot at path instead of
+        add_file / reload_term_meta. returns False, leaving the graph
+        untouched, if the snapshot was not made from the exact same files.
+        with freeze the snapshot goes straight into a frozen store, see
+        freeze.
+        """
+        doc = snapshot.read(path, fingerprints, RDFApi.TERM_META_TABLES.keys())
+        if doc is None:
+            self.log.info("no usable snapshot at %s", path)
+            return False
+
+        terms, contexts, tables = doc
+        for name, table in tables.iteritems():
+            setattr(self, name, table)
+
+        if freeze:
+            self.freeze(TermStore(terms.terms, contexts))
+        else:
+            for identifier, triples in contexts:
+                context = self.graph.get_context(terms.terms[identifier])
+                snapshot.decode_triples(triples, terms, context)
+
+        self.reload_prefix_index()
+        self.files.update(fp[0] for fp in fingerprints)
+        self.generation += 1
+        self.log.info("loaded snapshot %s", path)
+        return True
+
+    def freeze(self, store=None):
+        """ swaps the rdflib memory store and the term meta tables for
+        the compact read only ones of termstore.py, for serving. lookups
+        and queries work as before, nothing can be added afterwards.
+        """
+        if store is None:
+            store = TermStore.from_graph(self.graph)
+
+        self.graph = rdflib.ConjunctiveGraph(store=store)
+        for name, kind in RDFApi.TERM_META_TABLES.iteritems():
+            setattr(self, name, FrozenTable(store, kind, getattr(self, name)))
+
+        self.log.info("froze graph triples=%d terms=%d", len(store), len(store.terms))
+
+    def save_image(self, path):
+        """ writes the frozen store and term meta tables to an image file
+        at path, see map_image
+        """
+        self.log.info("writing image %s", path)
+        tables = {name: getattr(self, name) for name in RDFApi.TERM_META_TABLES}
+        self.graph.store.dump(path, tables)
+
+    def map_image(self, path):
+        """ swaps the frozen store and tables for the ones memory mapped
+        from the image at path, processes forked afterwards share them
+        """
+        store, tables = TermStore.map(path)
+        self.graph = rdflib.ConjunctiveGraph(store=store)
+        for name, table in tables.iteritems():
+            setattr(self, name, table)
+
+        self.log.info("mapped image %s bytes=%d", path, len(store.image))
+
     def add_prepared_query(self, name, query, initNs=None):
         self.log.debug("adding prepared query with name %s", name)
         pq = lambda x, y: prepareQuery(x, initNs=y)
@@ -119,14 +372,19 @@ class RDFApi(object):
         """
         self.add_prepared_query("get_ancestors", get_ancestors, initNs)
 
-    def prepare_search_index(self, index_dir):
+    def prepare_search_index(self, index_dir, update=True):
+        """ opens the search index in index_dir, brought up to date with
+        the graph unless update is False
+        """
         self.log.info("preparing search index...")
-        self.rdf_searcher = RDFSearch(index_dir, self.graph)
+        graph = self.graph if update else None
+        self.rdf_searcher = RDFSearch(index_dir, graph, log=self.log)
 
     def search(self, term):
         self.log.debug("searching for %s", term)
         return map(make_term, self.rdf_searcher.search(term))
 
+    @untimed
     def get_desc(self, term):
         term = make_term(term)
 
@@ -136,22 +394,20 @@ class RDFApi(object):
 
         return desc
 
+    @untimed
     def get_id(self, term):
         term = make_term(term)
 
         if term not in self.classes and term not in self.properties:
             return term.toPython()  # not something we know about
 
-        termstr = term.toPython()
-        if termstr.startswith(HTTPSS):
-            termstr = termstr[LHTTPSS:]
-
-        termstr = "/schema/%s" % termstr
-        return termstr
+        return term_path(term)
 
+    @untimed
     def get_term_from_str(self, termstr):
         return make_term(termstr)
 
+    @untimed
     def get_label(self, term):
         term = make_term(term)
 
@@ -161,20 +417,58 @@ class RDFApi(object):
 
         return label
 
+    @untimed
+    def term_link(self, term):
+        """ the html a template shows term as, already escaped: a link to
+        the page of a known term, an external link for other uris and
+        the value of literals
+        """
+        link = self.term_to_link.get(term)
+        if link is not None:
+            return link
+
+        if not isinstance(term, rdflib.term.Identifier):
+            # a uri string
+            term = make_term(term)
+            link = self.term_to_link.get(term)
+            if link is not None:
+                return link
+
+        if isinstance(term, rdflib.term.URIRef):
+            return u'<a href="%s" target="_blank"> %s </a>' % (
+                tornado.escape.xhtml_escape(term),
+                tornado.escape.xhtml_escape(self.get_label(term)),
+            )
+
+        value = term.toPython() if isinstance(term, rdflib.term.Literal) else term
+        if not isinstance(value, basestring):
+            value = str(value)
+        return tornado.escape.xhtml_escape(value)
+
+    @untimed
+    def term_links(self, terms, separator):
+        """ the term_link of every term, joined by separator """
+        return separator.join(self.term_link(t) for t in terms)
+
+    @untimed
     def is_term(self, term):
         return isinstance(term, rdflib.term.URIRef)
 
+    @untimed
     def is_known_term(self, term):
         return term in self.classes or term in self.properties
 
+    @untimed
     def is_literal(self, term):
         return isinstance(term, rdflib.term.Literal)
 
+    @untimed
     def is_class(self, term):
         term = make_term(term)
 
         return term in self.classes
 
+    @untimed
     def is_property(self, term):
         term = make_term(term)
 
@@ -195,6 +489,169 @@ class RDFApi(object):
         result = self.execute_prepared_query("get_term_to_desc")
         self.term_to_desc = {row[0]: row[1].toPython() for row in result}
 
+        self.reload_hierarchy()
+        self.reload_property_index()
+        self.reload_term_links()
+        self.reload_prefix_index()
+        self.generation += 1
+
+    def reload_term_links(self):
+        """ renders the html link of every class and property once, the
+        templates emit term_to_link fragments instead of rendering a
+        link per cell, see term_link
+        """
+        escape = tornado.escape.xhtml_escape
+        self.term_to_link = {
+            term: u'<a href="%s"> %s </a>'
+            % (
+                escape(term_path(term)),
+                escape(self.term_to_label.get(term) or term.toPython()),
+            )
+            for term in self.classes | self.properties
+        }
+
+    def reload_hierarchy(self):
+        """ builds the subClassOf index used by get_ancestors / get_descendants
+
+        term_to_parents and term_to_children hold the direct edges,
+        term_to_ancestors holds the reflexive ancestor chain of every term,
+        the term first and then its ancestors deepest first, i.e. nearest
+        first as the old sparql query ordered them. a term's depth is the
+        longest subClassOf path from it up to a root. a subClassOf cycle
+        is cut where the walk runs into it.
+        """
+        term_to_parents = {}
+        term_to_children = {}
+        for child, parent in self.graph.subject_objects(RDFApi.SUBCLASS_OF):
+            term_to_parents.setdefault(child, set()).add(parent)
+            term_to_children.setdefault(parent, set()).add(child)
+
+        terms = set(term_to_parents) | set(term_to_children) | self.classes
+
+        # one pass for the depth of every term, parents before children
+        depth = {}
+        for start in terms:
+            if start in depth:
+                continue
+            path = set([start])
+            stack = [(start, iter(term_to_parents.get(start, ())))]
+            while stack:
+                term, parents = stack[-1]
+                parent = next(parents, None)
+                if parent is None:
+                    stack.pop()
+                    path.discard(term)
+                    done = [
+                        depth[p] for p in term_to_parents.get(term, ()) if p in depth
+                    ]
+                    depth[term] = max(done) + 1 if done else 0
+                elif parent not in depth and parent not in path:
+                    path.add(parent)
+                    stack.append((parent, iter(term_to_parents.get(parent, ()))))
+
+        # terms are numbered deepest first, closures are sets of those
+        # numbers, cheaper to hash and sort than the terms themselves
+        order = sorted(terms, key=lambda t: (-depth[t], t))
+        number = {term: n for n, term in enumerate(order)}
+        parents_of = [
+            [number[p] for p in term_to_parents.get(term, ())] for term in order
+        ]
+        closure = [None] * len(order)
+
+        def upwards(n):
+            """ the numbers of n and everything above it """
+            result = closure[n]
+            if result is not None:
+                return result
+
+            # walked without recursion, chains can be deep, and numbers
+            # already in result stop cycles in the hierarchy
+            result = set([n])
+            todo = [n]
+            while todo:
+                for parent in parents_of[todo.pop()]:
+                    if parent in result:
+                        continue
+                    above = closure[parent]
+                    if above is not None:
+                        result.update(above)
+                    else:
+                        result.add(parent)
+                        todo.append(parent)
+
+            closure[n] = result
+            return result
+
+        term_to_ancestors = {}
+        # shallowest first, the closures of parents are there to reuse
+        for n in xrange(len(order) - 1, -1, -1):
+            term = order[n]
+            above = sorted(upwards(n))
+            above.remove(n)
+            term_to_ancestors[term] = [term] + [order[a] for a in above]
+
+        self.term_to_parents = {k: sorted(v) for k, v in term_to_parents.iteritems()}
+        self.term_to_children = {k: sorted(v) for k, v in term_to_children.iteritems()}
+        self.term_to_ancestors = term_to_ancestors
+
+    def reload_property_index(self):
+        """ builds class -> {property -> [targets]} for both directions
+
+        as with the sparql join it replaces, a property only shows up
+        on its domains if it has a rangeIncludes and vice versa.
+        """
+        property_to_domains = {}
+        for prop, domain in self.graph.subject_objects(RDFApi.DOMAIN_INCLUDES):
+            property_to_domains.setdefault(prop, set()).add(domain)
+
+        property_to_ranges = {}
+        for prop, range_ in self.graph.subject_objects(RDFApi.RANGE_INCLUDES):
+            property_to_ranges.setdefault(prop, set()).add(range_)
+
+        def invert(property_to_classes, property_to_targets):
+            class_to_properties = {}
+            for prop, classes in property_to_classes.iteritems():
+                targets = property_to_targets.get(prop)
+                if not targets:
+                    continue
+
+                targets = sorted(targets)
+                for klass in classes:
+                    class_to_properties.setdefault(klass, {})[prop] = targets
+
+            return class_to_properties
+
+        self.class_to_domain_properties = invert(
+            property_to_domains, property_to_ranges
+        )
+        self.class_to_range_properties = invert(property_to_ranges, property_to_domains)
+        self.property_to_domains = {
+            k: sorted(v) for k, v in property_to_domains.iteritems()
+        }
+        self.property_to_ranges = {
+            k: sorted(v) for k, v in property_to_ranges.iteritems()
+        }
+
+    def reload_prefix_index(self):
+        """ builds the label prefix index behind complete, classes rank
+        before properties before anything else, then shallower first
+        """
+        entries = []
+        for term, label in self.term_to_label.iteritems():
+            if term in self.classes:
+                rank = (0, len(self.term_to_ancestors.get(term, ())))
+            elif term in self.properties:
+                rank = (1, 0)
+            else:
+                rank = (2, 0)
+            entries.append((label, rank, term))
+
+        self.prefix_index = PrefixIndex(entries)
+
+    def complete(self, prefix, offset=0, limit=10):
+        """ type-ahead over labels, returns (number of matches, terms) """
+        return self.prefix_index.lookup(prefix, offset, limit)
+
     def execute_prepared_query(self, name, **kwargs):
         # log query and ...
         qstr, pq = self.prepared_queries.get(name, (None, None))
@@ -202,125 +659,857 @@ class RDFApi(object):
             raise Exception("could not find query for name %s" % name)
 
         self.log.debug("executing query: %s", qstr)
-        return self.graph.query(pq, **kwargs)
+        t = time.time()
+        result = self.graph.query(pq, **kwargs)
+        # rows are produced lazily, count them in the query's time
+        len(result)
+        STATS.time_query(name, (time.time() - t) * 1000)
+        return result
 
     def get_descendants(self, subject):
+        """ returns the direct subclasses of subject """
         subject = make_term(subject)
-        # TODO make this a compiled query
+        return list(self.term_to_children.get(subject, ()))
 
-        query = """
-        select ?class where {
-            ?class rdfs:subClassOf <%(subject_uri)s> .
-        }
-        """ % dict(
-            subject_uri=subject.toPython()
-        )
-
-        descendants = [
-            term[0] for term in self.graph.query(query, initNs={"rdfs": RDFApi.RDFS})
-        ]
-        return descendants
+    def iter_hierarchy(self, root):
+        """ yields root and every class below it depth first, parents
+        before their subclasses. a class with several parents comes up
+        once under each of them, a subClassOf cycle is followed once.
+        """
+        root = make_term(root)
+        yield root
+
+        # the terms from root down to the one being expanded
+        path = set([root])
+        stack = [(root, iter(self.term_to_children.get(root, ())))]
+        while stack:
+            term, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                path.discard(term)
+                continue
+
+            if child in path:
+                continue
+
+            yield child
+            path.add(child)
+            stack.append((child, iter(self.term_to_children.get(child, ()))))
+
+    @untimed
+    def has_descendants(self, subject):
+        subject = make_term(subject)
+        return bool(self.term_to_children.get(subject))
 
     def get_ancestors(self, subject):
+        """ returns subject followed by its superclasses, nearest first """
         subject = make_term(subject)
-
-        # TODO make this a compiled query
-        ancestor_query = """
-        select ?class where {
-            <%(subject_uri)s> rdfs:subClassOf* ?mid .
-            ?mid rdfs:subClassOf* ?class .
-        }
-        group by ?class
-        order by count(?mid)
-        """ % dict(
-            subject_uri=subject.toPython()
-        )
-        ancestors = [
-            term[0]
-            for term in self.graph.query(ancestor_query, initNs={"rdfs": RDFApi.RDFS})
-        ]
-        return ancestors
+        return list(self.term_to_ancestors.get(subject, (subject,)))
 
     def get_ancestors_beta(self, subject):
-        subject = make_term(subject)
+        """ returns subject followed by its superclasses, as the sparql
+        query get_ancestors orders them
+        """
+        return list(self.query_ancestors(make_term(subject)))
 
-        query, prepared_query = self.prepared_queries["get_ancestors"]
+    @memoized
+    def query_ancestors(self, subject):
         result = self.execute_prepared_query(
             "get_ancestors", initBindings={"subject": subject}
         )
-        ancestors = [term[0] for term in result]
-        return ancestors
+        return tuple(term[0] for term in result)
 
     def get_properties_for_class_as_domain(self, class_resource):
+        """ returns {property: [rangeIncludes]} for the properties
+        that have class_resource as domainIncludes
+        """
         class_resource = make_term(class_resource)
+        return dict(self.class_to_domain_properties.get(class_resource, {}))
 
-        # TODO does it have to be OPTIONAL rangeIncludes ?
-        # TODO what about domain and range itself
-        # TODO make this prepared query
-        query = """
-        prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        SELECT ?property ?object
-        WHERE {
-            ?property <http://schema.org/domainIncludes> <%(subject_uri)s> .
-            ?property <http://schema.org/rangeIncludes> ?object .
-        }
-        ORDER BY ?property
-        """ % dict(
-            subject_uri=class_resource.toPython()
-        )
+    def get_properties_for_class_as_range(self, class_resource):
+        """ returns {property: [domainIncludes]} for the properties
+        that have class_resource as rangeIncludes
+        """
+        class_resource = make_term(class_resource)
+        return dict(self.class_to_range_properties.get(class_resource, {}))
 
-        property_to_obj_list = {}
-        result = self.graph.query(query)
-        for prop, target in result:
-            property_to_obj_list.setdefault(prop, []).append(target)
+    def get_inherited_properties_for_class(self, class_resource):
+        """ returns [(ancestor, {property: [rangeIncludes]}), ...] for
+        class_resource and all of its ancestors (nearest first), leaving
+        out the ancestors that are not the domain of any property
+        """
+        class_resource = make_term(class_resource)
 
-        return property_to_obj_list
+        inherited = []
+        for ancestor in self.get_ancestors(class_resource):
+            properties = self.class_to_domain_properties.get(ancestor)
+            if properties:
+                inherited.append((ancestor, dict(properties)))
 
-    def get_properties_for_class_as_range(self, class_resource):
-        # TODO make this prepared query
-        class_resource = make_term(class_resource)
-        query = """
-        prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        SELECT ?property ?object
-        WHERE {
-            ?property <http://schema.org/rangeIncludes> <%(subject_uri)s> .
-            ?property <http://schema.org/domainIncludes> ?object .
+        return inherited
+
+    @staticmethod
+    def term_to_json(term):
+        """ a term the way sparql json results write it """
+        if isinstance(term, rdflib.term.Literal):
+            d = {"type": "literal", "value": unicode(term)}
+            if term.language:
+                d["xml:lang"] = term.language
+            elif term.datatype:
+                d["datatype"] = unicode(term.datatype)
+            return d
+
+        if isinstance(term, rdflib.term.BNode):
+            return {"type": "bnode", "value": unicode(term)}
+
+        return {"type": "uri", "value": unicode(term)}
+
+    @untimed
+    def get_kind(self, term):
+        term = make_term(term)
+        if term in self.classes:
+            return "class"
+        if term in self.properties:
+            return "property"
+        return None
+
+    def get_term_meta(self, term, fields):
+        term = make_term(term)
+        uris = lambda terms: [t.toPython() for t in terms]
+        by_property = lambda d: {p.toPython(): uris(v) for p, v in d.iteritems()}
+
+        getters = {
+            "kind": lambda: self.get_kind(term),
+            "label": lambda: self.term_to_label.get(term),
+            "desc": lambda: self.term_to_desc.get(term),
+            "ancestors": lambda: uris(self.get_ancestors(term)),
+            "descendants": lambda: uris(self.get_descendants(term)),
+            "domain_properties": lambda: by_property(
+                self.get_properties_for_class_as_domain(term)
+            ),
+            "range_properties": lambda: by_property(
+                self.get_properties_for_class_as_range(term)
+            ),
+            "predicate_objects": lambda: [
+                [p.toPython(), RDFApi.term_to_json(o)]
+                for p, o in self.get_predicate_object_for_subject(term)
+            ],
         }
-        ORDER BY ?property
-        """ % dict(
-            subject_uri=class_resource.toPython()
-        )
+        return {field: getters[field]() for field in fields}
 
-        property_to_obj_list = {}
-        result = self.graph.query(query)
-        for prop, target in result:
-            property_to_obj_list.setdefault(prop, []).append(target)
+    def get_terms_meta(self, terms, fields=None):
+        """ returns {uri: {field: value}} for many terms at once, as plain
+        json-able data. fields default to all of TERM_META_FIELDS.
+        """
+        if fields is None:
+            fields = RDFApi.TERM_META_FIELDS
 
-        return property_to_obj_list
+        unknown = set(fields) - set(RDFApi.TERM_META_FIELDS)
+        if unknown:
+            raise ValueError("unknown fields %s" % ", ".join(sorted(unknown)))
+
+        return {
+            make_term(term).toPython(): self.get_term_meta(term, fields)
+            for term in terms
+        }
 
+    @untimed
     def is_predicate_domain_includes(self, predicate):
         predicate = make_term(predicate)
         return predicate == RDFApi.DOMAIN_INCLUDES
 
+    @untimed
     def is_predicate_range_includes(self, predicate):
         predicate = make_term(predicate)
         return predicate == RDFApi.RANGE_INCLUDES
 
+    @memoized
     def get_predicate_object_for_subject(self, subject):
-        # TODO make this prepared query
         subject = make_term(subject)
 
-        query = """
-        SELECT ?predicate ?object
-        WHERE {
-            <%(subject_uri)s> ?predicate ?object
-        }
-        ORDER BY ?predicate
-        """ % dict(
-            subject_uri=subject.toPython()
+        # a single pattern lookup, straight off the store's index
+        return tuple(
+            sorted(self.graph.predicate_objects(subject), key=lambda po: po[0])
+        )
+
+
+class TimedHandler(BaseHandler):
+    """ records the time taken by every request, by uri, and logs the
+    requests slower than --slow-request-ms with what they spent it on
+    """
+
+    def prepare(self):
+        # the ioloop serves many requests at once, the trace goes along
+        # with every call handed to the executor instead
+        self.trace = Trace()
+
+    def offload(self, fn, *args, **kwargs):
+        """ runs fn in the server's bounded executor and returns the
+        future to yield, answers 503 when the executor is saturated
+        """
+        try:
+            return self.server.executor.submit(
+                type(self).__name__, fn, *args, trace=self.trace, **kwargs
+            )
+        except Saturated as e:
+            raise tornado.web.HTTPError(503, "executor saturated, %s", e)
+
+    def keep_encoding(self):
+        """ keeps tornado's gzip transform off this response, for handlers
+        that pick the content encoding and the etag of their bytes themselves
+        """
+        self._transforms = [
+            t
+            for t in self._transforms
+            if not isinstance(t, tornado.web.GZipContentEncoding)
+        ]
+        self.set_header("Vary", "Accept-Encoding")
+
+    def write_error(self, status_code, **kwargs):
+        if status_code == 503:
+            self.set_header("Retry-After", str(self.server.args.retry_after))
+        super(TimedHandler, self).write_error(status_code, **kwargs)
+
+    def on_finish(self):
+        ms = self.request.request_time() * 1000
+        STATS.record("requests", self.request.path, ms)
+        STATS.send("request.%s" % type(self).__name__, ms)
+
+        slow_ms = self.server.args.slow_request_ms
+        if slow_ms > 0 and ms >= slow_ms:
+            self.log.warning(
+                "slow request uri=%s status=%s ms=%.1f breakdown=%s",
+                self.request.uri,
+                self.get_status(),
+                ms,
+                self.trace.breakdown(),
+            )
+
+
+class FullSchemaHandler(TimedHandler):
+    """ GET /schema/full, every class under Thing streamed one section at
+    a time so that a request only ever holds one section. the sections
+    are kept in the page cache, per graph generation, like whole pages.
+    """
+
+    TEMPLATE = "full_schema_tab.html"
+    # where the sections go in TEMPLATE
+    SECTIONS = "<!-- sections -->"
+
+    @tornado.gen.coroutine
+    def get(self):
+        # a reload may swap the api while we stream, stick to this one
+        api = self.api
+        # the same generation of this process renders the same page
+        self.set_header("Etag", 'W/"%d-%d"' % (self.server.started, api.generation))
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return
+
+        page = yield self.offload(self.render_section, None, self.TEMPLATE, api=api)
+        head, _, tail = page.partition(self.SECTIONS)
+        self.write(head)
+        yield self.flush()
+
+        # admitted already, the sections are rendered whatever the load
+        executor = self.server.executor
+        name = type(self).__name__
+        thing = api.get_term_from_str("http://schema.org/Thing")
+        for term in api.iter_hierarchy(thing):
+            section = yield executor.submit_admitted(
+                name,
+                self.render_section,
+                term,
+                "single_schema.html",
+                api=api,
+                subject=term,
+                trace=self.trace,
+            )
+            self.write(section)
+            # waits for the section to be sent before rendering the next
+            yield self.flush()
+
+        self.finish(tail)
+
+    def render_section(self, term, template, api, **kwargs):
+        """ the section of term, or the page around the sections for None,
+        from the page cache when it is there
+        """
+        page_cache = self.server.page_cache
+        if page_cache is None:
+            return self.render_string(template, api=api, **kwargs)
+
+        key = (self.request.path, term, api.generation)
+        page = page_cache.get(key)
+        if page is None:
+            body = self.render_string(template, api=api, **kwargs)
+            page = page_cache.put(key, body, compress=False)
+        return page.body
+
+
+class ExportHandler(TimedHandler):
+    """ GET /schema/export.<nt|ttl|jsonld>, the whole graph serialized
+    once per graph generation and format, see export.py. answers
+    conditional requests and single byte ranges.
+    """
+
+    # bytes written between flushes
+    CHUNK_SIZE = 64 * 1024
+
+    @tornado.gen.coroutine
+    def get(self, fmt):
+        export = yield self.server.exports.get(self.api, fmt, self.offload)
+        yield self.write_export(export)
+
+    @tornado.gen.coroutine
+    def write_export(self, export):
+        self.keep_encoding()
+        encoding = export.negotiate(self.request.headers.get("Accept-Encoding", ""))
+        body, etag = export.bodies[encoding]
+        modified = tornado.httputil.format_timestamp(export.modified)
+        self.set_header("Content-Type", export.content_type)
+        self.set_header("Etag", etag)
+        self.set_header("Last-Modified", modified)
+        self.set_header("Accept-Ranges", "bytes")
+        if encoding is not None:
+            self.set_header("Content-Encoding", encoding)
+
+        if self.not_modified(export.modified):
+            self.set_status(304)
+            self.finish()
+            return
+
+        size = len(body)
+        byte_range = None
+        # a range of an older export must not be mixed into this one
+        if_range = self.request.headers.get("If-Range")
+        if if_range is None or if_range in (etag, modified):
+            try:
+                byte_range = parse_range(self.request.headers.get("Range"), size)
+            except RangeNotSatisfiable:
+                self.set_status(416)
+                self.set_header("Content-Range", "bytes */%d" % size)
+                self.finish()
+                return
+
+        start, end = byte_range or (0, size)
+        if byte_range is not None:
+            self.set_status(206)
+            self.set_header("Content-Range", "bytes %d-%d/%d" % (start, end - 1, size))
+
+        self.set_header("Content-Length", end - start)
+        for offset in xrange(start, end, self.CHUNK_SIZE):
+            self.write(body[offset : min(offset + self.CHUNK_SIZE, end)])
+            yield self.flush()
+
+        self.finish()
+
+    def not_modified(self, modified):
+        if self.request.headers.get("If-None-Match"):
+            return self.check_etag_header()
+
+        since = self.request.headers.get("If-Modified-Since")
+        if since is None:
+            return False
+
+        since = email.utils.parsedate(since)
+        return since is not None and calendar.timegm(since) >= modified
+
+
+class ContextHandler(ExportHandler):
+    """ GET /schema/context.jsonld[?ns=<prefix or namespace uri>], a
+    json-ld @context generated from the loaded schema, of one namespace
+    with ns. see jsonldcontext.py.
+    """
+
+    @tornado.gen.coroutine
+    def get(self):
+        name = self.get_argument("ns", None) or None
+        try:
+            context = yield self.server.contexts.get(self.api, name, self.offload)
+        except UnknownNamespace:
+            raise tornado.web.HTTPError(404, "unknown namespace %s", name)
+
+        # processors fetch contexts from other origins
+        self.set_header("Access-Control-Allow-Origin", "*")
+        self.set_header(
+            "Cache-Control", "public, max-age=%d" % self.server.args.context_max_age
+        )
+        yield self.write_export(context)
+
+
+@tornado.web.stream_request_body
+class ValidateHandler(TimedHandler):
+    """ POST /schema/api/validate[?errors_only=1], newline delimited
+    json-ld documents in, one json result per document out in the same
+    order, see validation.py. batches are validated as the body arrives
+    and their results written as soon as they are in order, at most
+    MAX_BATCHES of them are validated at once for one request.
+    """
+
+    # bytes of documents accepted in one request
+    MAX_BODY_SIZE = 1024 * 1024 * 1024
+    # batches of one request validated at once, the body is read no
+    # faster than they are done
+    MAX_BATCHES = 4
+
+    def prepare(self):
+        super(ValidateHandler, self).prepare()
+        self.request.connection.set_max_body_size(self.MAX_BODY_SIZE)
+        self.pool = self.server.validation_pool(self.api)
+        self.pool.acquire()
+        self.errors_only = self.get_argument("errors_only", "") in ("1", "true")
+        self.buffer = b""
+        self.batch = []
+        # the number of the first line in batch
+        self.line = 1
+        # futures of the batches submitted, in order
+        self.results = collections.deque()
+        self.sent = False
+        # Saturated or ValidationTimeout, answered once the body is in
+        self.failed = None
+
+    @tornado.gen.coroutine
+    def data_received(self, chunk):
+        if self.failed is not None:
+            return
+
+        lines = (self.buffer + chunk).split(b"\n")
+        self.buffer = lines.pop()
+        self.batch.extend(lines)
+        if len(self.batch) >= validation.BATCH_SIZE:
+            yield self.submit_batch()
+
+    @tornado.gen.coroutine
+    def submit_batch(self):
+        while len(self.results) >= self.MAX_BATCHES and self.failed is None:
+            yield self.write_results()
+        if self.failed is not None:
+            return
+
+        if self.batch:
+            # the first batch admits the request, see BoundedExecutor
+            try:
+                future = self.pool.submit(
+                    self.line, self.batch, trace=self.trace, admitted=self.line > 1
+                )
+            except Saturated as e:
+                self.failed = e
+                return
+
+            self.results.append(future)
+            self.line += len(self.batch)
+            self.batch = []
+
+        while self.results and self.results[0].done() and self.failed is None:
+            yield self.write_results()
+
+    @tornado.gen.coroutine
+    def write_results(self):
+        """ writes and sends the results of the oldest batch """
+        try:
+            results = yield self.results.popleft()
+        except validation.ValidationTimeout as e:
+            self.failed = e
+            return
+
+        self.write(
+            "".join(
+                json.dumps(r) + "\n"
+                for r in results
+                if not (self.errors_only and r["valid"])
+            )
+        )
+        self.sent = True
+        yield self.flush()
+
+    @tornado.gen.coroutine
+    def post(self):
+        if self.failed is None:
+            self.batch.append(self.buffer)
+            yield self.submit_batch()
+        while self.results and self.failed is None:
+            yield self.write_results()
+
+        if self.failed is None:
+            self.finish()
+        elif not self.sent:
+            raise tornado.web.HTTPError(503, "validation failed, %s", self.failed)
+        else:
+            # cut the response short, clients mustn't take it for complete
+            self.log.warning("validation cut short error=%s", self.failed)
+            self.request.connection.close()
+
+    def release_pool(self):
+        if self.pool is not None:
+            self.pool.release()
+            self.pool = None
+
+    def on_connection_close(self):
+        self.release_pool()
+
+    def on_finish(self):
+        self.release_pool()
+        super(ValidateHandler, self).on_finish()
+
+
+class SparqlHandler(TimedHandler):
+    """ GET /sparql?query=<sparql>[&format=json|csv|nt], or POST the query
+    as a form or an application/sparql-query body. SELECT, ASK and
+    CONSTRUCT only, each run in a process of its own with a timeout and
+    a row limit, results are streamed as they come. see sparql.py.
+    """
+
+    def initialize(self):
+        self.process = None
+
+    @tornado.gen.coroutine
+    def get(self):
+        yield self.run_query(self.get_argument("query", None))
+
+    @tornado.gen.coroutine
+    def post(self):
+        query = self.get_argument("query", None)
+        content_type = self.request.headers.get("Content-Type", "")
+        if content_type.startswith("application/sparql-query"):
+            query = self.request.body.decode("utf-8")
+
+        yield self.run_query(query)
+
+    @tornado.gen.coroutine
+    def run_query(self, query):
+        if not query:
+            raise tornado.web.HTTPError(400, "expected a query")
+
+        sparql = self.server.sparql
+        try:
+            plan = yield self.offload(sparql.plans.get, query)
+        except QueryError as e:
+            raise tornado.web.HTTPError(400, "%s", e)
+
+        fmt = plan.negotiate(
+            self.get_argument("format", None), self.request.headers.get("Accept", "")
+        )
+        if fmt is None:
+            raise tornado.web.HTTPError(
+                406, "%s results can't be written in that format", plan.kind
+            )
+
+        try:
+            process = self.process = sparql.start(self.api.graph, plan, fmt)
+        except Saturated as e:
+            raise tornado.web.HTTPError(503, "%s", e)
+
+        # on_connection_close drops self.process while a read waits
+        self.set_header("Content-Type", CONTENT_TYPES[fmt])
+        sent = False
+        try:
+            while True:
+                chunk = yield process.read()
+                if chunk is None:
+                    break
+                self.write(chunk)
+                sent = True
+                yield self.flush()
+        except (QueryTimeout, QueryError) as e:
+            if not sent:
+                status = 503 if isinstance(e, QueryTimeout) else 400
+                raise tornado.web.HTTPError(status, "%s", e)
+
+            # cut the response short, clients mustn't take it for complete
+            self.log.warning("sparql results cut short error=%s", e)
+            self.request.connection.close()
+            return
+        finally:
+            STATS.time_query(
+                "sparql", (time.time() - process.started) * 1000, self.trace
+            )
+            self.stop_query()
+
+        self.finish()
+
+    def stop_query(self):
+        if self.process is not None:
+            self.server.sparql.done(self.process)
+            self.process = None
+
+    def on_connection_close(self):
+        self.stop_query()
+
+    def write_error(self, status_code, **kwargs):
+        # tell the client what was wrong with its query
+        e = kwargs.get("exc_info", (None, None, None))[1]
+        if not isinstance(e, tornado.web.HTTPError) or not e.log_message:
+            return super(SparqlHandler, self).write_error(status_code, **kwargs)
+
+        if status_code == 503:
+            self.set_header("Retry-After", str(self.server.args.retry_after))
+        self.set_header("Content-Type", "text/plain; charset=UTF-8")
+        self.finish((e.log_message % e.args) + "\n")
+
+
+class StatsHandler(BaseHandler):
+    """ GET /debug/stats, latency histograms of requests, api methods
+    and queries since the server started, and the api's memo counters.
+    with --workers these are the answering worker's own.
+    """
+
+    def get(self):
+        stats = STATS.to_json()
+        stats["memo"] = self.api.memo.to_json()
+        stats["worker"] = dict(task_id=self.server.task_id, pid=os.getpid())
+        stats["executor"] = self.server.executor.to_json()
+        stats["sparql"] = self.server.sparql.to_json()
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(json.dumps(stats))
+
+
+class TermsHandler(TimedHandler):
+    """ json metadata for many terms in one round trip
+
+    GET /schema/api/terms?uri=<uri>&uri=<uri>&fields=label,ancestors
+    POST /schema/api/terms {"uris": [...], "fields": [...]}
+    """
+
+    # most uris accepted in one request
+    MAX_TERMS = 5000
+
+    @tornado.gen.coroutine
+    def get(self):
+        uris = self.get_arguments("uri")
+        fields = self.get_argument("fields", None)
+        if fields is not None:
+            fields = [f for f in fields.split(",") if f]
+
+        yield self.write_terms(uris, fields)
+
+    @tornado.gen.coroutine
+    def post(self):
+        try:
+            body = json.loads(self.request.body)
+            uris = body["uris"]
+            fields = body.get("fields")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise tornado.web.HTTPError(400, 'expected {"uris": [...]}')
+
+        if not self.is_strings(uris) or not (fields is None or self.is_strings(fields)):
+            raise tornado.web.HTTPError(400, "uris and fields are lists of strings")
+
+        yield self.write_terms(uris, fields)
+
+    @staticmethod
+    def is_strings(value):
+        return isinstance(value, list) and all(isinstance(v, basestring) for v in value)
+
+    @tornado.gen.coroutine
+    def write_terms(self, uris, fields):
+        if len(uris) > self.MAX_TERMS:
+            raise tornado.web.HTTPError(400, "at most %d uris" % self.MAX_TERMS)
+
+        try:
+            terms = yield self.offload(self.api.get_terms_meta, uris, fields)
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(json.dumps({"terms": terms}))
+
+
+class CompleteHandler(TimedHandler):
+    """ GET /schema/api/complete?q=<prefix>&offset=0&limit=10 """
+
+    MAX_LIMIT = 100
+
+    @tornado.gen.coroutine
+    def get(self):
+        prefix = self.get_argument("q", u"")
+        try:
+            offset = max(0, int(self.get_argument("offset", 0)))
+            limit = min(self.MAX_LIMIT, max(0, int(self.get_argument("limit", 10))))
+        except ValueError:
+            raise tornado.web.HTTPError(400, "offset and limit must be integers")
+
+        total, results = yield self.offload(self.complete, prefix, offset, limit)
+
+        # answers only change with the graph, let clients and proxies
+        # keep them for a while, the etag covers the rest
+        self.set_header("Cache-Control", "public, max-age=300")
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(
+            json.dumps(
+                dict(
+                    query=prefix,
+                    total=total,
+                    offset=offset,
+                    limit=limit,
+                    results=results,
+                )
+            )
         )
-        result = self.graph.query(query)
-        return [(row[0], row[1]) for row in self.graph.query(query)]
+
+    def complete(self, prefix, offset, limit):
+        api = self.api
+        total, terms = api.complete(prefix, offset, limit)
+        results = [
+            dict(
+                uri=term.toPython(),
+                label=api.get_label(term),
+                kind=api.get_kind(term),
+                href=api.get_id(term),
+            )
+            for term in terms
+        ]
+        return total, results
+
+
+class ChecksHandler(TimedHandler):
+    """ GET /schema/api/checks, outcome of the background consistency checks """
+
+    def get(self):
+        checks = self.server.checks
+        status = dict(state="disabled") if checks is None else checks.to_json()
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(json.dumps(status))
+
+
+class PageHandler(TimedHandler):
+    """ renders TEMPLATE in the server's executor, off the ioloop """
+
+    TEMPLATE = None
+
+    def get_template_namespace(self):
+        # the api can be swapped by a reload while we render,
+        # stick to the one the request started with
+        ns = super(PageHandler, self).get_template_namespace()
+        ns["api"] = self.api
+        return ns
+
+    @tornado.gen.coroutine
+    def get(self):
+        yield self.render_page()
+
+    @tornado.gen.coroutine
+    def render_page(self):
+        page = yield self.offload(self.render_string, self.TEMPLATE)
+        self.finish(page)
+
+
+class SearchHandler(PageHandler):
+    """ GET /schema/search?term=<text> """
+
+    TEMPLATE = "search_tab.html"
+
+
+class CachedPageHandler(PageHandler):
+    """ renders TEMPLATE once per uri and graph generation and serves the
+    cached bytes with a strong etag afterwards
+    """
+
+    # of the pages gzipped per request, tornado's own level
+    GZIP_LEVEL = tornado.web.GZipContentEncoding.GZIP_LEVEL
+
+    def initialize(self):
+        self.page_key = None
+
+    @tornado.gen.coroutine
+    def get(self):
+        page_cache = self.server.page_cache
+        if page_cache is None:
+            yield self.render_page()
+            return
+
+        key = (self.request.uri, self.api.generation)
+        page = page_cache.get(key)
+        if page is None:
+            # finish() picks up the rendered page and caches it
+            self.page_key = key
+            yield self.render_page()
+            return
+
+        self.write_page(page)
+
+    def finish(self, chunk=None):
+        # error pages are never cached
+        if self.page_key is not None and chunk is not None and self.get_status() == 200:
+            page = self.server.page_cache.put(self.page_key, chunk)
+            self.page_key = None
+            return self.write_page(page)
+
+        return super(CachedPageHandler, self).finish(chunk)
+
+    def write_page(self, page):
+        self.keep_encoding()
+        body, etag = page.body, page.etag
+        gzipped = accepts_encoding(
+            self.request.headers.get("Accept-Encoding", ""), "gzip"
+        )
+        if gzipped:
+            # a strong etag has to differ between content encodings
+            etag = '%s-gzip"' % etag[:-1]
+            self.set_header("Content-Encoding", "gzip")
+
+        self.set_header("Etag", etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            return super(CachedPageHandler, self).finish()
+
+        if gzipped:
+            # pages are only kept gzipped with --page-cache-gzip
+            body = page.gzipped or gzip_bytes(body, level=self.GZIP_LEVEL)
+        super(CachedPageHandler, self).finish(body)
+
+
+class ChildrenHandler(CachedPageHandler):
+    """ GET /schema/api/children?uri=<uri>, the direct subclasses of uri
+    as tree nodes for the tree tab to expand a branch with. every node
+    has a data-has-children flag.
+    """
+
+    TEMPLATE = "tree_children.html"
+
+    def get(self):
+        self.term = self.api.get_term_from_str(self.get_argument("uri"))
+        return super(ChildrenHandler, self).get()
+
+    def get_template_namespace(self):
+        ns = super(ChildrenHandler, self).get_template_namespace()
+        ns["term"] = self.term
+        return ns
+
+
+class DiffHandler(PageHandler):
+    """ GET /schema/diff[?format=json], what changed from the
+    --diff-against version to the loaded graph, see schemadiff.py
+    """
+
+    TEMPLATE = "diff_tab.html"
+
+    @tornado.gen.coroutine
+    def get(self):
+        if not self.server.args.diff_against:
+            raise tornado.web.HTTPError(404, "no --diff-against version")
+
+        self.diff = yield self.offload(self.server.schema_diff, self.api)
+        if self.get_argument("format", None) == "json":
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
+            self.finish(json.dumps(self.diff.to_json()))
+            return
+
+        yield self.render_page()
+
+    def get_template_namespace(self):
+        ns = super(DiffHandler, self).get_template_namespace()
+        ns["diff"] = self.diff
+        return ns
+
+
+def make_cached_handler(template):
+    class SimpleCachedHandler(CachedPageHandler):
+        TEMPLATE = template
+
+    return SimpleCachedHandler
 
 
 class SdoServer(Server):
@@ -329,58 +1518,324 @@ class SdoServer(Server):
     Special logic to handle schema.org domainIncludes and rangeIncludes.
     """
 
-    def run_tests(self, rdf_dirs):
-        from tests.test_consistency import GraphConsistenctyTestCase
+    def start_checks(self, api, path=None):
+        """ runs the consistency checks against api in the background,
+        their progress is at /schema/api/checks. the report is written
+        to path when they are done, see ConsistencyReport.
+        """
+        self.log.info("running consistency checks generation=%d", api.generation)
+        self.checks = ConsistencyReport(api, self.log, path)
+        self.threadpool.apply_async(self.checks.run)
 
-        self.log.info("running tests...")
-        self.log.info("=" * 100)
-        os.environ["RDF_DIR"] = ":".join(rdf_dirs)
-        stream = StringIO()
-        runner = unittest.TextTestRunner(stream=stream)
-        result = runner.run(unittest.makeSuite(GraphConsistenctyTestCase))
+    def checks_file(self):
+        """ where the worker running the checks leaves the report for the
+        other --workers
+        """
+        return self.args.image_file + ".checks.json"
 
-        self.log.info("tests run: %s", result.testsRun)
-        self.log.info("errors: %s", result.errors)
-        self.log.info("failures: %s", result.failures)
-        stream.seek(0)
-        self.log.info("output: %s", stream.read())
+    def validation_pool(self, api):
+        """ the pool validating documents against api's graph, see
+        validation.py. made on first use and again for a newer graph
+        """
+        pool = self.validation
+        if pool is None or api.generation > pool.generation:
+            if pool is not None:
+                pool.retire()
+
+            self.log.info("preparing validation generation=%d", api.generation)
+            pool = self.validation = ValidationPool(
+                Constraints(api),
+                self.args.validate_workers,
+                executor=self.executor,
+                timeout=self.args.validate_timeout,
+            )
+        return pool
 
-        if len(result.failures) > 0:
-            self.log.error("tests are failing !!!")
+    def schema_diff(self, api):
+        """ the SchemaDiff from the --diff-against version to api's graph,
+        once per graph generation. the old version is parsed on first use
+        and only its sorted lines are kept, on disk.
+        """
+        with self.diff_lock:
+            if self.diff_base is None:
+                self.log.info("loading diff version dirs=%s", self.args.diff_against)
+                self.diff_base = load_version(
+                    self.args.diff_against, self.args.load_workers, self.log
+                )
 
-        self.log.info("=" * 100)
+            if self.diff is None or self.diff[0] != api.generation:
+                t = time.time()
+                new_lines = sorted_lines(graph_lines(api.graph))
+                diff = SchemaDiff(self.diff_base.lines(), new_lines)
+                self.diff = (api.generation, diff)
+                self.log.info(
+                    "computed schema diff generation=%d terms=%d time=%.2fs",
+                    api.generation,
+                    len(diff.terms),
+                    time.time() - t,
+                )
 
-    def prepare_api(self):
-        rdf_dirs = map(os.path.abspath, self.args.rdf_dirs)
-        # before preparing api, make sure tests pass !
-        # TODO remove this , and do it externally ?
-        if not self.args.skip_tests:
-            self.run_tests(rdf_dirs)
+            return self.diff[1]
 
-        filelist = []
-        for rdf_dir in rdf_dirs:
-            for ext in RDFApi.EXT_TO_FORMAT.iterkeys():
-                files = glob.glob(os.path.join(rdf_dir, "*%s" % ext))
-                filelist.extend(files)
+    def find_rdf_files(self):
+        return RDFApi.find_files(self.args.rdf_dirs)
 
-        api = RDFApi(self.log)
-        for f in filelist:
-            api.add_file(f)
+    def prepare_api(self):
+        self.started = int(time.time())
+        if self.args.statsd_server:
+            host, _, port = self.args.statsd_server.partition(":")
+            STATS.statsd = statsd.StatsClient(
+                host, int(port or 8125), prefix=self.args.statsd_prefix
+            )
 
-        api.reload_term_meta()
+        filelist = self.find_rdf_files()
+        api = self.load_graph(filelist)
         if self.args.force_index and os.path.exists(self.args.index_dir):
             self.log.info("removing %s as --force-index=True", self.args.index_dir)
             shutil.rmtree(self.args.index_dir)
 
         api.prepare_search_index(self.args.index_dir)
+
+        self.checks = None
+        self.task_id = None
+        if self.args.workers > 1:
+            api = self.fork_workers(api)
+
+        self.executor = BoundedExecutor(
+            self.args.executor_workers, self.args.executor_queue
+        )
+        # forked now, while no thread of this process is busy
+        self.validation = None
+        self.validation_pool(api)
+
+        if self.args.workers > 1:
+            if self.task_id == 0 and not self.args.skip_tests:
+                # one worker runs them for all, after the fork so that
+                # they don't hold up the start
+                self.start_checks(api, self.checks_file())
+            elif not self.args.skip_tests:
+                self.checks = ReportFile(self.checks_file(), api.generation)
+        elif not self.args.skip_tests:
+            self.start_checks(api)
+
+        self.exports = ExportCache()
+        self.contexts = ContextCache()
+        self.sparql = SparqlRunner(
+            self.args.sparql_processes,
+            self.args.sparql_max_rows,
+            self.args.sparql_timeout,
+            self.args.sparql_max_memory * 1024 * 1024,
+            PlanCache(self.args.sparql_plan_cache),
+        )
+
+        # see schema_diff
+        self.diff_lock = threading.Lock()
+        self.diff_base = None
+        self.diff = None
+
+        self.page_cache = None
+        if self.args.page_cache_size > 0:
+            self.page_cache = PageCache(
+                self.args.page_cache_size * 1024 * 1024,
+                compress=self.args.page_cache_gzip,
+            )
+
+        self.reloading = False
+        if self.args.reload_interval > 0 and self.task_id is not None:
+            # every worker would reparse on its own and end up with a
+            # private copy of the graph
+            self.log.warning("--reload-interval is ignored with --workers > 1")
+        elif self.args.reload_interval > 0:
+            tornado.ioloop.PeriodicCallback(
+                self.check_rdf_files, self.args.reload_interval * 1000
+            ).start()
+
         self.log.info("api is ready to be used...")
         return api
 
+    def fork_workers(self, api):
+        """ maps api from --image-file, binds the port and forks --workers
+        processes accepting on it, returns the api in each of them. the
+        parent stays behind restarting workers that die.
+        """
+        api.save_image(self.args.image_file)
+        api.map_image(self.args.image_file)
+        # reopened by each worker
+        api.rdf_searcher.close()
+
+        sockets = tornado.netutil.bind_sockets(self.args.port)
+        # Server.run must not listen on it again
+        self.args.port = 0
+        # the pool's threads don't survive a fork
+        self.threadpool.terminate()
+        # a report of an earlier run isn't about this graph
+        if os.path.exists(self.checks_file()):
+            os.remove(self.checks_file())
+        self.log.info("forking workers=%d", self.args.workers)
+
+        self.task_id = tornado.process.fork_processes(self.args.workers)
+
+        self.threadpool = ThreadPool(self.THREADPOOL_WORKERS)
+        api.prepare_search_index(self.args.index_dir, update=False)
+        tornado.httpserver.HTTPServer(self.app).add_sockets(sockets)
+        self.log.info("worker ready task_id=%d pid=%d", self.task_id, os.getpid())
+        return api
+
+    def load_graph(self, filelist):
+        """ returns an RDFApi with filelist loaded, going through the
+        snapshot at --snapshot-file when the files haven't changed
+        """
+        # fingerprint before parsing so a file edited while we parse
+        # can't end up in a snapshot keyed by its new contents
+        fingerprints = snapshot.fingerprints(filelist)
+        self.fingerprints = fingerprints
+
+        path = self.args.snapshot_file
+        api = RDFApi(self.log)
+        try:
+            if path and api.load_snapshot(path, fingerprints, freeze=True):
+                return api
+        except Exception:
+            self.log.exception("failed to load snapshot %s, reparsing", path)
+            api = RDFApi(self.log)
+
+        api.add_files(filelist, self.args.load_workers)
+        api.reload_term_meta()
+        self.save_snapshot(api, fingerprints)
+        # from here on the graph is only read
+        api.freeze()
+        return api
+
+    def save_snapshot(self, api, fingerprints):
+        path = self.args.snapshot_file
+        if not path:
+            return
+
+        try:
+            api.save_snapshot(path, fingerprints)
+        except Exception:
+            self.log.exception("failed to write snapshot %s", path)
+
+    def check_rdf_files(self):
+        """ runs periodically on the ioloop, starts a reload in the
+        background when any rdf file was added, removed or modified
+        """
+        if self.reloading:
+            return
+
+        known = set((fp[0], fp[1], fp[2]) for fp in self.fingerprints)
+        current = set()
+        for fname in self.find_rdf_files():
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue  # removed while we were looking
+            current.add((os.path.abspath(fname), st.st_size, st.st_mtime))
+
+        if current == known:
+            return
+
+        self.reloading = True
+        self.threadpool.apply_async(self.reload_graph)
+
+    def reload_graph(self):
+        """ builds a new RDFApi next to the live one, reparsing only the
+        files that changed, and swaps it in on the ioloop once every
+        derived index is ready. requests in flight keep the old api.
+        """
+        try:
+            old_api = self.api
+            filelist = self.find_rdf_files()
+            fingerprints = snapshot.fingerprints(filelist)
+
+            # a file is unchanged when its size and content hash match,
+            # a plain touch doesn't need a reparse
+            old = {fp[0]: (fp[1], fp[3]) for fp in self.fingerprints}
+            unchanged, changed = [], []
+            for fp in fingerprints:
+                same = old.get(fp[0]) == (fp[1], fp[3]) and fp[0] in old_api.files
+                (unchanged if same else changed).append(fp[0])
+
+            removed = set(old) - set(fp[0] for fp in fingerprints)
+            self.log.info(
+                "reloading rdf files changed=%s removed=%s", changed, sorted(removed),
+            )
+
+            if not changed and not removed:
+                self.fingerprints = fingerprints
+                self.reloading = False
+                return
+
+            api = RDFApi(self.log)
+            api.copy_files(old_api, unchanged)
+            api.add_files(changed, self.args.load_workers)
+            api.reload_term_meta()
+            api.generation = old_api.generation + 1
+            api.prepare_search_index(self.args.index_dir)
+            self.save_snapshot(api, fingerprints)
+            api.freeze()
+        except Exception:
+            self.log.exception("failed to reload rdf files, keeping the old graph")
+            self.reloading = False
+            return
+
+        tornado.ioloop.IOLoop.instance().add_callback(self.swap_api, api, fingerprints)
+
+    def swap_api(self, api, fingerprints):
+        self.api = api
+        self.fingerprints = fingerprints
+        self.exports.expire(api.generation)
+        self.contexts.expire(api.generation)
+        if self.page_cache is not None:
+            self.page_cache.clear()
+
+        self.reloading = False
+        self.log.info("reloaded rdf files generation=%d", api.generation)
+        if not self.args.skip_tests:
+            self.start_checks(api)
+
+    def define_template_namespace(self):
+        ns = super(SdoServer, self).define_template_namespace()
+        # templates render a little differently for prerender.py
+        ns["static_site"] = False
+        return ns
+
+    def run(self):
+        if self.args.prerender_dir:
+            return self.prerender()
+
+        super(SdoServer, self).run()
+
+    def prerender(self):
+        """ renders the schema to static files in --prerender-dir instead
+        of serving it, see prerender.py
+        """
+        self.api = self.load_graph(self.find_rdf_files())
+        self.nav_tabs = self.prepare_nav_tabs([])
+
+        prerenderer = Prerenderer(
+            self,
+            self.api,
+            self.args.prerender_dir,
+            (FullSchemaHandler.TEMPLATE, FullSchemaHandler.SECTIONS),
+            self.log,
+        )
+        rendered, unchanged, removed = prerenderer.run(self.args.prerender_workers)
+        self.log.info(
+            "prerendered dir=%s rendered=%d unchanged=%d removed=%d",
+            self.args.prerender_dir,
+            len(rendered),
+            len(unchanged),
+            len(removed),
+        )
+
     def prepare_nav_tabs(self, nav_tabs):
         nav_tabs.append(("TreeSchema", "/schema/tree"))
         nav_tabs.append(("FullSchema", "/schema/full"))
         nav_tabs.append(("Search", "/schema/search"))
         nav_tabs.append(("Schema", "/schema/schema.org/Thing"))
+        if self.args.diff_against and not self.args.prerender_dir:
+            nav_tabs.append(("Diff", "/schema/diff"))
 
         return nav_tabs
 
@@ -398,10 +1853,20 @@ class SdoServer(Server):
 
         handlers.extend(
             [
-                (r"/schema/tree", make_handler("tree_schema_tab.html", BaseHandler)),
-                (r"/schema/full", make_handler("full_schema_tab.html", BaseHandler)),
-                (r"/schema/search", make_handler("search_tab.html", BaseHandler)),
-                (r"/schema/.*", make_handler("single_schema_tab.html", BaseHandler)),
+                (r"/schema/tree", make_cached_handler("tree_schema_tab.html")),
+                (r"/schema/full", FullSchemaHandler),
+                (r"/schema/search", SearchHandler),
+                (r"/schema/api/terms", TermsHandler),
+                (r"/schema/api/complete", CompleteHandler),
+                (r"/schema/api/checks", ChecksHandler),
+                (r"/schema/api/children", ChildrenHandler),
+                (r"/schema/export\.(nt|ttl|jsonld)", ExportHandler),
+                (r"/schema/context\.jsonld", ContextHandler),
+                (r"/schema/api/validate", ValidateHandler),
+                (r"/schema/diff", DiffHandler),
+                (r"/schema/.*", make_cached_handler("single_schema_tab.html")),
+                (r"/sparql", SparqlHandler),
+                (r"/debug/stats", StatsHandler),
             ]
         )
         return handlers
@@ -421,7 +1886,7 @@ class SdoServer(Server):
             "--skip-tests",
             default=False,
             action="store_true",
-            help="skips initial test check when starting server...",
+            help="skips the consistency checks run in the background after loading",
         )
         default_index_dir = "/var/lib/sdoserver/index"
         parser.add_argument(
@@ -435,6 +1900,164 @@ class SdoServer(Server):
             action="store_true",
             help="this will clear the old index and force new computation of index",
         )
+        default_snapshot_file = "/var/lib/sdoserver/graph.snapshot"
+        parser.add_argument(
+            "--snapshot-file",
+            default=default_snapshot_file,
+            help="binary snapshot of the loaded graph, reused while the rdf files "
+            "are unchanged, pass an empty string to disable, default %(default)s",
+        )
+        parser.add_argument(
+            "--reload-interval",
+            default=0,
+            type=int,
+            help="seconds between checks of rdf_dirs for changed files, changed "
+            "files are reloaded without a restart, 0 disables, default %(default)s",
+        )
+        parser.add_argument(
+            "--load-workers",
+            default=1,
+            type=int,
+            help="number of processes parsing rdf files in parallel, default %(default)s",
+        )
+        parser.add_argument(
+            "--workers",
+            default=1,
+            type=int,
+            help="number of processes serving requests, with more than one the "
+            "graph is loaded once into --image-file and the workers are forked "
+            "to share it read only, default %(default)s",
+        )
+        default_image_file = "/var/lib/sdoserver/graph.image"
+        parser.add_argument(
+            "--image-file",
+            default=default_image_file,
+            help="memory mapped image of the loaded graph shared by --workers, "
+            "written on every start, default %(default)s",
+        )
+        parser.add_argument(
+            "--executor-workers",
+            default=4,
+            type=int,
+            help="threads rendering pages and running api calls off the ioloop, "
+            "default %(default)s",
+        )
+        parser.add_argument(
+            "--executor-queue",
+            default=64,
+            type=int,
+            help="calls waiting for an executor thread before further requests "
+            "are answered with a 503, default %(default)s",
+        )
+        parser.add_argument(
+            "--retry-after",
+            default=1,
+            type=int,
+            help="seconds a 503 from a saturated executor asks clients to wait, "
+            "default %(default)s",
+        )
+        parser.add_argument(
+            "--validate-workers",
+            default=multiprocessing.cpu_count(),
+            type=int,
+            help="processes validating documents posted to /schema/api/validate, "
+            "per worker, started with the server, default %(default)s",
+        )
+        parser.add_argument(
+            "--validate-timeout",
+            default=60,
+            type=float,
+            help="seconds a batch of documents may take to validate before the "
+            "request fails, default %(default)s",
+        )
+        parser.add_argument(
+            "--sparql-processes",
+            default=2,
+            type=int,
+            help="/sparql queries running at once, each in a process of its "
+            "own, more are answered with a 503, default %(default)s",
+        )
+        parser.add_argument(
+            "--sparql-timeout",
+            default=10,
+            type=float,
+            help="seconds a /sparql query may take before it is killed, "
+            "default %(default)s",
+        )
+        parser.add_argument(
+            "--sparql-max-rows",
+            default=10000,
+            type=int,
+            help="rows or triples a /sparql query returns at most, "
+            "default %(default)s",
+        )
+        parser.add_argument(
+            "--sparql-max-memory",
+            default=512,
+            type=int,
+            help="MB a /sparql query process may allocate, default %(default)s",
+        )
+        parser.add_argument(
+            "--sparql-plan-cache",
+            default=256,
+            type=int,
+            help="prepared /sparql queries kept by query text, default %(default)s",
+        )
+        parser.add_argument(
+            "--context-max-age",
+            default=86400,
+            type=int,
+            help="seconds clients may cache /schema/context.jsonld before "
+            "revalidating it with its etag, default %(default)s",
+        )
+        parser.add_argument(
+            "--diff-against",
+            action="append",
+            default=[],
+            help="directory of an older version's rdf files, repeatable, "
+            "/schema/diff shows what changed from it to the loaded graph",
+        )
+        parser.add_argument(
+            "--page-cache-size",
+            default=64,
+            type=int,
+            help="MB of rendered /schema pages to keep in memory, 0 disables, default %(default)s",
+        )
+        parser.add_argument(
+            "--page-cache-gzip",
+            default=False,
+            action="store_true",
+            help="also keep a gzipped copy of every cached page",
+        )
+        parser.add_argument(
+            "--prerender-dir",
+            default=None,
+            help="instead of serving, render every page to static files in this "
+            "directory and exit, pages whose triples didn't change since the "
+            "last run into the same directory are left alone",
+        )
+        parser.add_argument(
+            "--prerender-workers",
+            default=multiprocessing.cpu_count(),
+            type=int,
+            help="number of processes rendering pages for --prerender-dir, "
+            "default %(default)s",
+        )
+        parser.add_argument(
+            "--slow-request-ms",
+            default=1000,
+            type=int,
+            help="log requests taking longer with a breakdown of where the time "
+            "went, 0 disables, default %(default)s",
+        )
+        parser.add_argument(
+            "--statsd-server",
+            default=None,
+            help="host:port of a statsd server to send request and query timings to",
+        )
+        parser.add_argument(
+            "--statsd-prefix", default="sdoserver", help="default %(default)s"
+        )
 
 
 if __name__ == "__main__":
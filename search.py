@@ -1,49 +1,139 @@
 #!/usr/bin/env python
 
 import os
+import hashlib
+import threading
+import rdflib
 import whoosh.fields
 import whoosh.qparser
 import whoosh.index
 
+RDFS = rdflib.namespace.RDFS
+
 
 class RDFSearch(object):
-    """ creates a whoosh index on a graph """
+    """ creates a whoosh index on a graph
+
+    there is one document per subject, holding its label, comment and
+    every other object as body. each document also stores a hash of the
+    subject's triples so re-indexing only rewrites subjects that changed.
+    """
 
-    def __init__(self, index_dir, graph=None):
+    # number of documents added between commits
+    BATCH_SIZE = 5000
+
+    def __init__(self, index_dir, graph=None, log=None):
         self.index_dir = index_dir
+        self.log = log
         self.schema = whoosh.fields.Schema(
-            uri=whoosh.fields.ID(stored=True), body=whoosh.fields.TEXT
+            uri=whoosh.fields.ID(stored=True, unique=True),
+            label=whoosh.fields.TEXT(field_boost=4.0),
+            comment=whoosh.fields.TEXT(field_boost=2.0),
+            body=whoosh.fields.TEXT,
+            digest=whoosh.fields.ID(stored=True),
         )
 
         self.index = None
-        if os.path.exists(self.index_dir):
+        if whoosh.index.exists_in(self.index_dir):
             self.index = whoosh.index.open_dir(self.index_dir)
+            if self.index.schema.names() != self.schema.names():
+                # an index from before one document per subject, start over
+                self.index.close()
+                self.index = None
 
         if self.index is None:
-            os.makedirs(self.index_dir)
+            if not os.path.exists(self.index_dir):
+                os.makedirs(self.index_dir)
             self.index = whoosh.index.create_in(self.index_dir, self.schema)
 
         if graph is not None:
             self.index_graph(graph)
 
         self.searcher = self.index.searcher()
+        # searches come from the executor's threads and a searcher's
+        # readers aren't safe to share between them
+        self.lock = threading.Lock()
         self.term_parser = whoosh.qparser.MultifieldParser(
-            ["uri", "body"], schema=self.schema, group=whoosh.qparser.OrGroup
+            ["uri", "label", "comment", "body"],
+            schema=self.schema,
+            group=whoosh.qparser.OrGroup,
         )
 
+    @staticmethod
+    def make_document(subject, graph):
+        """ returns the document for subject along with its digest """
+        labels, comments, body, lines = [], [], [], []
+        for p, o in graph.predicate_objects(subject):
+            lines.append(u"%s %s" % (p.n3(), o.n3()))
+            if p == RDFS.label:
+                labels.append(u"%s" % o)
+            elif p == RDFS.comment:
+                comments.append(u"%s" % o)
+            else:
+                body.append(u"%s" % o)
+
+        digest = hashlib.sha1(u"\n".join(sorted(lines)).encode("utf-8"))
+        doc = dict(
+            uri=u"%s" % subject,
+            label=u" ".join(labels),
+            comment=u" ".join(comments),
+            body=u" ".join(body),
+            digest=unicode(digest.hexdigest()),
+        )
+        return doc
+
+    def indexed_digests(self):
+        """ {uri: digest} of everything in the index """
+        with self.index.searcher() as searcher:
+            return {f["uri"]: f["digest"] for f in searcher.all_stored_fields()}
+
     def index_graph(self, graph):
-        """ takes a graph to be indexed """
-        writer = self.index.writer()
-        for (s, p, o) in graph.triples((None, None, None)):
-            uri = "%s" % s
-            body = "%s" % o
-            writer.add_document(uri=uri, body=body)
+        """ takes a graph to be indexed, only subjects whose triples
+        changed since the last call are rewritten
+        """
+        indexed = self.indexed_digests()
+
+        subjects = set(s for s in graph.subjects() if isinstance(s, rdflib.term.URIRef))
+        stale = set(indexed) - set(u"%s" % s for s in subjects)
+
+        writer = None
+        pending = 0
+        updated = 0
+        for subject in subjects:
+            doc = RDFSearch.make_document(subject, graph)
+            if indexed.get(doc["uri"]) == doc["digest"]:
+                continue
+
+            if writer is None:
+                writer = self.index.writer()
+
+            writer.update_document(**doc)
+            pending += 1
+            updated += 1
+            if pending >= self.BATCH_SIZE:
+                writer.commit()
+                writer, pending = None, 0
+
+        for uri in stale:
+            if writer is None:
+                writer = self.index.writer()
+            writer.delete_by_term("uri", uri)
+
+        if writer is not None:
+            writer.commit()
 
-        writer.commit()
+        if self.log is not None:
+            self.log.info(
+                "search index updated=%d deleted=%d unchanged=%d",
+                updated,
+                len(stale),
+                len(subjects) - updated,
+            )
 
     def search(self, term):
-        results = self.searcher.search(self.term_parser.parse(term))
-        return [r["uri"] for r in results]
+        with self.lock:
+            results = self.searcher.search(self.term_parser.parse(term))
+            return [r["uri"] for r in results]
 
     def close(self):
         self.searcher.close()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""
+Binary snapshots of a loaded graph and the term meta derived from it,
+so a restart with unchanged rdf files skips parsing altogether.
+
+A snapshot is a single msgpack document. Every rdflib term is interned
+once into a term table and triples / tables refer to terms by index.
+"""
+
+import os
+import hashlib
+import msgpack
+import rdflib
+
+VERSION = 2
+
+URI, BNODE, LITERAL = 0, 1, 2
+
+# how each term meta table is laid out, see encode_table
+SET, TO_STR, TO_LIST, TO_DICT = "set", "to_str", "to_list", "to_dict"
+
+
+def fingerprint(fname):
+    """ (path, size, mtime, sha1) of fname """
+    st = os.stat(fname)
+    sha1 = hashlib.sha1()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(chunk)
+
+    return [os.path.abspath(fname), st.st_size, st.st_mtime, sha1.hexdigest()]
+
+
+def fingerprints(filelist):
+    return sorted(fingerprint(f) for f in filelist)
+
+
+class TermTable(object):
+    """ interns rdflib terms to consecutive integer ids """
+
+    def __init__(self, encoded=None):
+        self.ids = {}
+        self.terms = []
+        if encoded is not None:
+            self.terms = [decode_term(t) for t in encoded]
+
+    def id(self, term):
+        i = self.ids.get(term)
+        if i is None:
+            i = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return i
+
+    def encode(self):
+        return [encode_term(t) for t in self.terms]
+
+
+def encode_term(term):
+    if isinstance(term, rdflib.term.Literal):
+        return [
+            LITERAL,
+            unicode(term),
+            term.language or u"",
+            unicode(term.datatype or u""),
+        ]
+
+    if isinstance(term, rdflib.term.BNode):
+        return [BNODE, unicode(term)]
+
+    return [URI, unicode(term)]
+
+
+def decode_term(encoded):
+    kind = encoded[0]
+    if kind == LITERAL:
+        _, value, lang, datatype = encoded
+        return rdflib.term.Literal(value, lang=lang or None, datatype=datatype or None)
+
+    if kind == BNODE:
+        return rdflib.term.BNode(encoded[1])
+
+    return rdflib.term.URIRef(encoded[1])
+
+
+def encode_table(kind, table, terms):
+    if kind == SET:
+        return [terms.id(t) for t in table]
+
+    if kind == TO_STR:
+        return {terms.id(k): v for k, v in table.iteritems()}
+
+    if kind == TO_LIST:
+        return {terms.id(k): [terms.id(t) for t in v] for k, v in table.iteritems()}
+
+    if kind == TO_DICT:
+        return {
+            terms.id(k): encode_table(TO_LIST, v, terms) for k, v in table.iteritems()
+        }
+
+    raise Exception("unknown table kind %s" % kind)
+
+
+def decode_table(kind, table, terms):
+    t = terms.terms
+    if kind == SET:
+        return set(t[i] for i in table)
+
+    if kind == TO_STR:
+        return {t[k]: v for k, v in table.iteritems()}
+
+    if kind == TO_LIST:
+        return {t[k]: [t[i] for i in v] for k, v in table.iteritems()}
+
+    if kind == TO_DICT:
+        return {t[k]: decode_table(TO_LIST, v, terms) for k, v in table.iteritems()}
+
+    raise Exception("unknown table kind %s" % kind)
+
+
+def encode_triples(graph, terms):
+    """ flat [s, p, o, s, p, o, ...] list of term ids """
+    triples = []
+    for s, p, o in graph.triples((None, None, None)):
+        triples.extend((terms.id(s), terms.id(p), terms.id(o)))
+    return triples
+
+
+def decode_triples(triples, terms, graph):
+    """ adds the triples encoded by encode_triples to graph """
+    t = terms.terms
+    graph.addN(
+        (t[triples[i]], t[triples[i + 1]], t[triples[i + 2]], graph)
+        for i in xrange(0, len(triples), 3)
+    )
+    return len(triples) // 3
+
+
+def pack_graph(graph):
+    """ graph as msgpack bytes, a cheap way to hand it between processes """
+    terms = TermTable()
+    triples = encode_triples(graph, terms)
+    return msgpack.packb([terms.encode(), triples], use_bin_type=True)
+
+
+def unpack_graph(data, graph):
+    """ adds the triples packed by pack_graph to graph, returns their count """
+    encoded_terms, triples = msgpack.unpackb(data, encoding="utf-8")
+    return decode_triples(triples, TermTable(encoded_terms), graph)
+
+
+def dump(path, files, graph, tables):
+    """ writes the conjunctive graph and tables to path
+
+    files are the fingerprints of the rdf files the graph was loaded from,
+    tables is {name: (kind, table)}
+    """
+    terms = TermTable()
+    # one flat triple list per context, so files can later be reloaded
+    # one at a time
+    contexts = [
+        [terms.id(context.identifier), encode_triples(context, terms)]
+        for context in graph.contexts()
+    ]
+
+    meta = {
+        name: [kind, encode_table(kind, table, terms)]
+        for name, (kind, table) in tables.iteritems()
+    }
+    doc = dict(
+        version=VERSION,
+        files=files,
+        terms=terms.encode(),
+        contexts=contexts,
+        tables=meta,
+    )
+
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    # write aside and rename so a crash never leaves a truncated snapshot
+    tmp = "%s.tmp" % path
+    with open(tmp, "wb") as f:
+        msgpack.pack(doc, f, use_bin_type=True)
+    os.rename(tmp, path)
+
+
+def read(path, files, names):
+    """ reads the snapshot at path if it was made from exactly the given
+    files and holds exactly the tables named by names, returns
+    (TermTable, [(context term id, triples)], {name: table}) or None
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        doc = msgpack.unpack(f, encoding="utf-8")
+
+    if doc.get("version") != VERSION or doc.get("files") != files:
+        return None
+
+    # the tables derived from the graph changed since it was written
+    if set(doc["tables"]) != set(names):
+        return None
+
+    terms = TermTable(doc["terms"])
+    tables = {
+        name: decode_table(kind, table, terms)
+        for name, (kind, table) in doc["tables"].iteritems()
+    }
+    return terms, doc["contexts"], tables
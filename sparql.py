@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+
+"""
+Guarded, read only SPARQL over the loaded graph, for /sparql.
+
+Only SELECT, ASK and CONSTRUCT queries are accepted, without FROM or
+FROM NAMED which would have rdflib load graphs from anywhere, and
+without GRAPH, whose named graphs are the files the schema was loaded
+from. Queries
+are prepared once per query text and kept in PlanCache, like
+RDFApi.prepared_queries.
+
+Every query runs in a process of its own forked from the server, see
+QueryProcess. It sees the loaded graph without copying it, can't hold
+the interpreter lock the server's ioloop needs, is killed when its
+time is up and fails instead of swapping when it outgrows its memory
+limit. The server has threads, so the fork holds the logging locks and
+the child writes to stderr only with os.write: a lock another thread
+held at the fork would stay taken in the child for good. Results are serialized as they are produced and read back
+through a pipe in chunks, a response never holds more than one chunk:
+
+    SELECT      SPARQL-JSON or CSV
+    ASK         SPARQL-JSON
+    CONSTRUCT   N-Triples
+
+At most max_rows rows (or triples) are written, a truncated JSON result
+says so with "truncated": true next to "results".
+"""
+
+import os
+import csv
+import json
+import time
+import errno
+import signal
+import logging
+import struct
+import resource
+import threading
+import traceback
+from StringIO import StringIO
+from collections import OrderedDict
+
+import rdflib
+import tornado.gen
+import tornado.ioloop
+import tornado.iostream
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.parserutils import CompValue
+
+from executor import Saturated
+from ntriples import nt_term
+
+# prefixes queries may use without declaring them
+PREFIXES = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+    "schema": "http://schema.org/",
+}
+
+# algebra name -> query kind
+KINDS = {
+    "SelectQuery": "SELECT",
+    "AskQuery": "ASK",
+    "ConstructQuery": "CONSTRUCT",
+}
+
+# result format -> content type
+CONTENT_TYPES = {
+    "json": "application/sparql-results+json",
+    "csv": "text/csv; charset=utf-8",
+    "nt": "application/n-triples",
+}
+
+# query kind -> the formats it can be written as, the default first
+KIND_FORMATS = {
+    "SELECT": ("json", "csv"),
+    "ASK": ("json",),
+    "CONSTRUCT": ("nt",),
+}
+
+# bytes of serialized results sent through the pipe at once
+CHUNK_SIZE = 64 * 1024
+
+# pipe messages are a type byte and a payload length, see QueryProcess
+HEADER = struct.Struct("<cI")
+DATA, DONE, ERROR = "D", "F", "E"
+
+
+class QueryError(Exception):
+    """ a query that is not accepted, or failed while it ran """
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class Plan(object):
+    def __init__(self, text, prepared, kind):
+        self.text = text
+        self.prepared = prepared
+        self.kind = kind
+
+    def negotiate(self, fmt=None, accept=""):
+        """ the format to write results in, fmt when asked for one, else
+        the first the Accept header names, else the default. None when
+        fmt can't be written for this kind of query.
+        """
+        formats = KIND_FORMATS[self.kind]
+        if fmt:
+            return fmt if fmt in formats else None
+
+        for f in formats:
+            if CONTENT_TYPES[f].split(";")[0] in accept:
+                return f
+        return formats[0]
+
+
+class PlanCache(object):
+    """ prepared queries by query text, the least recently used ones go
+    once there are max_entries
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.plans = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text):
+        """ the Plan of text, raises QueryError for queries that are not
+        accepted
+        """
+        with self.lock:
+            plan = self.plans.pop(text, None)
+            if plan is not None:
+                self.plans[text] = plan
+                self.hits += 1
+                return plan
+            self.misses += 1
+
+        plan = self.prepare(text)
+        with self.lock:
+            self.plans[text] = plan
+            while len(self.plans) > self.max_entries:
+                self.plans.popitem(last=False)
+        return plan
+
+    @staticmethod
+    def prepare(text):
+        try:
+            prepared = prepareQuery(text, initNs=PREFIXES)
+        except Exception as e:
+            # updates don't parse as queries either
+            raise QueryError("could not parse query: %s" % e)
+
+        algebra = prepared.algebra
+        kind = KINDS.get(algebra.name)
+        if kind is None:
+            raise QueryError("only SELECT, ASK and CONSTRUCT queries are allowed")
+        if algebra.datasetClause:
+            raise QueryError("FROM and FROM NAMED are not supported")
+        if has_graph(algebra):
+            raise QueryError("GRAPH is not supported")
+        return Plan(text, prepared, kind)
+
+    def to_json(self):
+        with self.lock:
+            return dict(entries=len(self.plans), hits=self.hits, misses=self.misses)
+
+
+def has_graph(node):
+    """ whether the query algebra under node has a GRAPH pattern """
+    if isinstance(node, CompValue):
+        # EXISTS patterns are left as parsed
+        if node.name in ("Graph", "GraphGraphPattern"):
+            return True
+        node = node.values()
+    elif not isinstance(node, (list, tuple)):
+        return False
+    return any(has_graph(n) for n in node)
+
+
+def term_json(term):
+    if isinstance(term, rdflib.term.Literal):
+        value = dict(type="literal", value=unicode(term))
+        if term.language:
+            value["xml:lang"] = term.language
+        elif term.datatype:
+            value["datatype"] = unicode(term.datatype)
+        return value
+    if isinstance(term, rdflib.term.BNode):
+        return dict(type="bnode", value=unicode(term))
+    return dict(type="uri", value=unicode(term))
+
+
+def term_csv(term):
+    if term is None:
+        return ""
+    if isinstance(term, rdflib.term.BNode):
+        term = u"_:%s" % term
+    return unicode(term).encode("utf-8")
+
+
+def select_json(variables, rows, max_rows):
+    yield json.dumps({"head": {"vars": variables}})[:-1]
+    yield ', "results": {"bindings": ['
+    n = 0
+    for row in rows:
+        if n == max_rows:
+            yield ']}, "truncated": true}'
+            return
+        binding = {
+            v: term_json(value) for v, value in zip(variables, row) if value is not None
+        }
+        yield ("," if n else "") + json.dumps(binding)
+        n += 1
+    yield "]}}"
+
+
+def select_csv(variables, rows, max_rows):
+    out = StringIO()
+    writer = csv.writer(out, lineterminator="\r\n")
+    writer.writerow(variables)
+    for n, row in enumerate(rows):
+        if n == max_rows:
+            break
+        writer.writerow([term_csv(value) for value in row])
+        if out.tell() >= CHUNK_SIZE:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+
+def construct_nt(triples, max_rows):
+    for n, triple in enumerate(triples):
+        if n == max_rows:
+            return
+        yield (u"%s %s %s .\n" % tuple(nt_term(t) for t in triple)).encode("utf-8")
+
+
+def serialize(graph, plan, fmt, max_rows):
+    """ the results of plan over graph in fmt, in pieces """
+    result = graph.query(plan.prepared)
+    if plan.kind == "ASK":
+        return [json.dumps({"head": {}, "boolean": bool(result.askAnswer)})]
+    if plan.kind == "CONSTRUCT":
+        return construct_nt(result, max_rows)
+
+    variables = [unicode(v) for v in result.vars]
+    if fmt == "csv":
+        return select_csv(variables, result, max_rows)
+    return select_json(variables, result, max_rows)
+
+
+def write_message(fd, kind, payload=b""):
+    data = HEADER.pack(kind, len(payload)) + payload
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+def run_query(graph, plan, fmt, max_rows, fd):
+    """ writes the results of plan to fd in DATA messages of about
+    CHUNK_SIZE bytes, then DONE, or ERROR with what went wrong
+    """
+    try:
+        buffered, size = [], 0
+        for piece in serialize(graph, plan, fmt, max_rows):
+            buffered.append(piece)
+            size += len(piece)
+            if size >= CHUNK_SIZE:
+                write_message(fd, DATA, b"".join(buffered))
+                buffered, size = [], 0
+        if buffered:
+            write_message(fd, DATA, b"".join(buffered))
+        write_message(fd, DONE)
+    except MemoryError:
+        write_message(fd, ERROR, "query ran out of memory")
+    except Exception as e:
+        write_message(fd, ERROR, "query failed: %s" % e)
+
+
+def limit_memory(max_bytes):
+    """ caps the address space of this process at max_bytes more than it
+    maps already, linux only
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            mapped = int(f.read().split()[0]) * resource.getpagesize()
+    except (IOError, ValueError, IndexError):
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = mapped + max_bytes
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def fork():
+    """ os.fork with the logging module's lock and every handler's held,
+    the way python 3 forks, so none is taken in the child by a thread
+    that isn't there
+    """
+    logging._acquireLock()
+    try:
+        handlers = [ref() for ref in logging._handlerList]
+        handlers = [h for h in handlers if h is not None and h.lock is not None]
+        for h in handlers:
+            h.acquire()
+        try:
+            return os.fork()
+        finally:
+            for h in reversed(handlers):
+                h.release()
+    finally:
+        logging._releaseLock()
+
+
+class QueryProcess(object):
+    """ a query running in a forked child process, the server reads its
+    results with read() as they come
+    """
+
+    def __init__(self, graph, plan, fmt, max_rows, timeout, max_memory):
+        self.plan = plan
+        self.started = time.time()
+        self.timed_out = False
+
+        r, w = os.pipe()
+        self.pid = fork()
+        if self.pid == 0:
+            # the child, never returns
+            code = 0
+            try:
+                os.close(r)
+                limit_memory(max_memory)
+                run_query(graph, plan, fmt, max_rows, w)
+            except BaseException:
+                # sys.stderr's FILE lock may be held by a server thread
+                os.write(2, traceback.format_exc())
+                code = 1
+            finally:
+                os._exit(code)
+
+        os.close(w)
+        self.stream = tornado.iostream.PipeIOStream(r)
+        self.ioloop = tornado.ioloop.IOLoop.current()
+        self.deadline = self.ioloop.call_later(timeout, self.time_out)
+
+    def time_out(self):
+        self.timed_out = True
+        self.kill()
+
+    @tornado.gen.coroutine
+    def read(self):
+        """ the next chunk of results, None once they are all read.
+        raises QueryTimeout or QueryError when the query doesn't finish.
+        """
+        try:
+            header = yield self.stream.read_bytes(HEADER.size)
+            kind, size = HEADER.unpack(header)
+            payload = b""
+            if size:
+                payload = yield self.stream.read_bytes(size)
+        except tornado.iostream.StreamClosedError:
+            self.close()
+            if self.timed_out:
+                raise QueryTimeout("query timed out")
+            raise QueryError("query process exited")
+
+        if kind == DATA:
+            raise tornado.gen.Return(payload)
+
+        self.close()
+        if kind == ERROR:
+            raise QueryError(payload)
+        raise tornado.gen.Return(None)
+
+    def kill(self):
+        if self.pid is None:
+            return
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def close(self):
+        """ stops the query if it still runs and reaps the process """
+        if self.pid is None:
+            return
+        self.ioloop.remove_timeout(self.deadline)
+        self.kill()
+        self.stream.close()
+        os.waitpid(self.pid, 0)
+        self.pid = None
+
+
+class SparqlRunner(object):
+    """ starts QueryProcesses, at most max_processes at once """
+
+    def __init__(self, max_processes, max_rows, timeout, max_memory, plans):
+        self.max_processes = max_processes
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.plans = plans
+        self.running = 0
+        self.started = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def start(self, graph, plan, fmt):
+        """ the QueryProcess running plan, call done(process) once it's
+        finished with. raises Saturated with max_processes running.
+        """
+        if self.running >= self.max_processes:
+            self.rejected += 1
+            raise Saturated("%d queries running" % self.running)
+
+        process = QueryProcess(
+            graph, plan, fmt, self.max_rows, self.timeout, self.max_memory
+        )
+        self.running += 1
+        self.started += 1
+        return process
+
+    def done(self, process):
+        process.close()
+        self.running -= 1
+        if process.timed_out:
+            self.timeouts += 1
+
+    def to_json(self):
+        return dict(
+            running=self.running,
+            started=self.started,
+            rejected=self.rejected,
+            timeouts=self.timeouts,
+            plans=self.plans.to_json(),
+        )
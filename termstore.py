@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+
+"""
+A frozen, compact representation of a loaded graph for serving.
+
+Every term is interned once to an integer id. Triples are kept as
+columns of ids in arrays sorted by subject, predicate, object (SPO),
+with two permutations of the rows for lookups by predicate (POS) and by
+object (OSP). The term meta tables built by reload_term_meta are kept
+the same way, as flat arrays of ids and one string per table, indexed
+by term id.
+
+TermStore is an rdflib store, so a ConjunctiveGraph over it answers
+pattern lookups and sparql as before, it just can't be modified.
+
+A store and its tables can be written to an image file and memory
+mapped back, see TermStore.dump and TermStore.map. The arrays then live
+in the mapping, which processes forked afterwards share instead of each
+holding a copy. The image is in the byte order of the machine that
+wrote it, it is not meant to be moved elsewhere.
+
+Only the arrays are shared that way. The rdflib terms and the term to
+id dict are python objects built by map, a forked process shares their
+pages only until reference counting writes to them, so every worker
+ends up with a copy of those (see bench_workers in benchmarks/run.py).
+"""
+
+import os
+import mmap
+import bisect
+import ctypes
+import struct
+from array import array
+
+import msgpack
+import rdflib
+from rdflib.store import Store
+
+import snapshot
+
+# id column type, 4 bytes
+ID = "i"
+
+IMAGE_MAGIC = b"SDOIMG01"
+# magic, header length, the msgpack header, then the arrays
+IMAGE_HEADER = struct.Struct("<8sQ")
+IMAGE_ALIGN = 8
+
+# array typecode -> ctypes type of its items, for mapping them back
+CTYPES = {"i": ctypes.c_int, "B": ctypes.c_ubyte, "c": ctypes.c_char}
+
+
+class ReadOnlyError(TypeError):
+    pass
+
+
+def bisect_rows(rows, column, value, lo, hi, right=False):
+    """ bisect over rows[lo:hi] where the rows are positions into column
+    and column[rows[n]] is sorted over the range
+    """
+    while lo < hi:
+        mid = (lo + hi) // 2
+        v = column[rows[mid]]
+        if v < value or (right and v == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class TermStore(Store):
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, terms, contexts):
+        """ terms are rdflib terms, contexts are [(context term id,
+        flat [s, p, o, s, p, o, ...] term ids)] as snapshot.py encodes them
+        """
+        super(TermStore, self).__init__()
+        self.terms = list(terms)
+        self.ids = {t: i for i, t in enumerate(self.terms)}
+
+        # a triple loaded from several files is stored once, the other
+        # contexts it is in are kept aside
+        rows = {}
+        for ctx, triples in contexts:
+            for i in xrange(0, len(triples), 3):
+                spo = (triples[i], triples[i + 1], triples[i + 2])
+                ctxs = rows.get(spo)
+                if ctxs is None:
+                    rows[spo] = ctx
+                elif isinstance(ctxs, list):
+                    if ctx not in ctxs:
+                        ctxs.append(ctx)
+                elif ctxs != ctx:
+                    rows[spo] = [ctxs, ctx]
+
+        spo = sorted(rows)
+        self.s = array(ID, (t[0] for t in spo))
+        self.p = array(ID, (t[1] for t in spo))
+        self.o = array(ID, (t[2] for t in spo))
+        self.ctx = array(ID)
+        self.extra_contexts = {}
+        for n, t in enumerate(spo):
+            ctxs = rows[t]
+            if isinstance(ctxs, list):
+                self.extra_contexts[n] = ctxs[1:]
+                ctxs = ctxs[0]
+            self.ctx.append(ctxs)
+        del rows, spo
+
+        s, p, o = self.s, self.p, self.o
+        n = len(s)
+        self.pos = array(ID, sorted(xrange(n), key=lambda r: (p[r], o[r], s[r])))
+        self.osp = array(ID, sorted(xrange(n), key=lambda r: (o[r], s[r], p[r])))
+
+        self.image = None
+        self.bindings = {}
+        self.set_contexts([ctx for ctx, _ in contexts])
+
+    def set_contexts(self, ids):
+        self.context_graphs = {
+            ctx: rdflib.Graph(store=self, identifier=self.terms[ctx]) for ctx in ids
+        }
+
+    @classmethod
+    def from_graph(cls, graph):
+        """ freezes a ConjunctiveGraph """
+        terms = snapshot.TermTable()
+        contexts = [
+            (terms.id(context.identifier), snapshot.encode_triples(context, terms))
+            for context in graph.contexts()
+        ]
+        store = cls(terms.terms, contexts)
+        for prefix, namespace in graph.namespaces():
+            store.bind(prefix, namespace)
+        return store
+
+    def id(self, term):
+        return self.ids.get(term)
+
+    COLUMNS = ("s", "p", "o", "ctx", "pos", "osp")
+
+    def dump(self, path, tables):
+        """ writes the store and tables, {name: FrozenTable}, to an image
+        file at path for map
+        """
+        blocks = []
+        for name in TermStore.COLUMNS:
+            blocks.append((name, getattr(self, name)))
+        for name, table in sorted(tables.iteritems()):
+            for part in FrozenTable.PARTS:
+                blocks.append(("%s.%s" % (name, part), getattr(table, part)))
+
+        # where every array goes, relative to the end of the header
+        layout = {}
+        offset = 0
+        for name, data in blocks:
+            typecode = data.typecode if isinstance(data, array) else "c"
+            if isinstance(data, bytearray):
+                typecode = "B"
+            layout[name] = (offset, len(data), typecode)
+            offset += len(data) * ctypes.sizeof(CTYPES[typecode])
+            offset += -offset % IMAGE_ALIGN
+
+        terms = snapshot.TermTable()
+        terms.terms = self.terms
+        header = msgpack.packb(
+            dict(
+                terms=terms.encode(),
+                contexts=sorted(self.context_graphs),
+                extra_contexts=self.extra_contexts.items(),
+                tables={
+                    name: (table.kind, table.size) for name, table in tables.iteritems()
+                },
+                layout=layout,
+            ),
+            use_bin_type=True,
+        )
+        start = IMAGE_HEADER.size + len(header)
+        start += -start % IMAGE_ALIGN
+
+        d = os.path.dirname(path)
+        if d and not os.path.exists(d):
+            os.makedirs(d)
+
+        with open(path + ".tmp", "wb") as f:
+            f.write(IMAGE_HEADER.pack(IMAGE_MAGIC, len(header)))
+            f.write(header)
+            for name, data in blocks:
+                f.seek(start + layout[name][0])
+                f.write(data.tostring() if isinstance(data, array) else bytes(data))
+            f.truncate(start + offset)
+        os.rename(path + ".tmp", path)
+
+    @classmethod
+    def map(cls, path):
+        """ maps the image written by dump at path, returns (store,
+        {name: FrozenTable})
+        """
+        with open(path, "rb") as f:
+            # a private mapping, so ctypes can point into it. nothing
+            # writes to it, every page stays shared with the file.
+            image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        magic, size = IMAGE_HEADER.unpack_from(image)
+        if magic != IMAGE_MAGIC:
+            raise ValueError("%s is not a term store image" % path)
+
+        header = msgpack.unpackb(
+            image[IMAGE_HEADER.size : IMAGE_HEADER.size + size], encoding="utf-8"
+        )
+        start = IMAGE_HEADER.size + size
+        start += -start % IMAGE_ALIGN
+
+        def block(name):
+            offset, length, typecode = header["layout"][name]
+            array_type = CTYPES[typecode] * length
+            return array_type.from_buffer(image, start + offset)
+
+        store = cls.__new__(cls)
+        Store.__init__(store)
+        store.image = image
+        store.bindings = {}
+        store.terms = snapshot.TermTable(header["terms"]).terms
+        store.ids = {t: i for i, t in enumerate(store.terms)}
+        for name in TermStore.COLUMNS:
+            setattr(store, name, block(name))
+        store.extra_contexts = dict(header["extra_contexts"])
+        store.set_contexts(header["contexts"])
+
+        tables = {}
+        for name, (kind, size) in header["tables"].iteritems():
+            table = FrozenTable.__new__(FrozenTable)
+            table.store, table.kind, table.size = store, kind, size
+            for part in FrozenTable.PARTS:
+                setattr(table, part, block("%s.%s" % (name, part)))
+            tables[name] = table
+
+        return store, tables
+
+    def intern(self, term):
+        """ id of term, adding it to the term table if need be. only the
+        tables use this, the triples are fixed.
+        """
+        i = self.ids.get(term)
+        if i is None:
+            i = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return i
+
+    # rdflib store interface
+
+    def bind(self, prefix, namespace):
+        # prefixes aren't part of the frozen data, serializers bind
+        # theirs as they go
+        for p, ns in self.bindings.items():
+            if p == prefix or ns == namespace:
+                del self.bindings[p]
+        self.bindings[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self.bindings.get(prefix)
+
+    def prefix(self, namespace):
+        for p, ns in self.bindings.iteritems():
+            if ns == namespace:
+                return p
+        return None
+
+    def namespaces(self):
+        return iter(self.bindings.items())
+
+    def add(self, triple, context, quoted=False):
+        raise ReadOnlyError("the term store is read only")
+
+    def addN(self, quads):
+        raise ReadOnlyError("the term store is read only")
+
+    def remove(self, triple, context=None):
+        raise ReadOnlyError("the term store is read only")
+
+    def rows(self, s, p, o):
+        """ positions of the rows matching the pattern of ids, None being
+        a wildcard
+        """
+        S, P, O = self.s, self.p, self.o
+        n = len(S)
+
+        if s is not None:
+            lo = bisect.bisect_left(S, s)
+            hi = bisect.bisect_right(S, s, lo)
+            if p is not None:
+                lo = bisect.bisect_left(P, p, lo, hi)
+                hi = bisect.bisect_right(P, p, lo, hi)
+                if o is not None:
+                    lo = bisect.bisect_left(O, o, lo, hi)
+                    hi = bisect.bisect_right(O, o, lo, hi)
+                return xrange(lo, hi)
+            if o is not None:
+                return (r for r in xrange(lo, hi) if O[r] == o)
+            return xrange(lo, hi)
+
+        if p is not None:
+            rows = self.pos
+            lo = bisect_rows(rows, P, p, 0, n)
+            hi = bisect_rows(rows, P, p, lo, n, right=True)
+            if o is not None:
+                lo = bisect_rows(rows, O, o, lo, hi)
+                hi = bisect_rows(rows, O, o, lo, hi, right=True)
+            return (rows[i] for i in xrange(lo, hi))
+
+        if o is not None:
+            rows = self.osp
+            lo = bisect_rows(rows, O, o, 0, n)
+            hi = bisect_rows(rows, O, o, lo, n, right=True)
+            return (rows[i] for i in xrange(lo, hi))
+
+        return xrange(n)
+
+    def row_contexts(self, row):
+        ctxs = [self.ctx[row]]
+        ctxs.extend(self.extra_contexts.get(row, ()))
+        return ctxs
+
+    def triples(self, triple_pattern, context=None):
+        ids = []
+        for term in triple_pattern:
+            if term is None:
+                ids.append(None)
+                continue
+            i = self.ids.get(term)
+            if i is None:
+                return  # nothing mentions it
+            ids.append(i)
+
+        ctx = None
+        if context is not None:
+            ctx = self.ids.get(context.identifier)
+            if ctx not in self.context_graphs:
+                return
+
+        terms, S, P, O = self.terms, self.s, self.p, self.o
+        for row in self.rows(*ids):
+            ctxs = self.row_contexts(row)
+            if ctx is not None and ctx not in ctxs:
+                continue
+            triple = (terms[S[row]], terms[P[row]], terms[O[row]])
+            yield triple, (self.context_graphs[c] for c in ctxs)
+
+    def __len__(self, context=None):
+        if context is None:
+            return len(self.s)
+
+        ctx = self.ids.get(context.identifier)
+        if ctx not in self.context_graphs:
+            return 0
+        return sum(1 for row in xrange(len(self.s)) if ctx in self.row_contexts(row))
+
+    def contexts(self, triple=None):
+        if triple is None:
+            for ctx in sorted(self.context_graphs):
+                yield self.context_graphs[ctx]
+            return
+
+        for _, ctxs in self.triples(triple):
+            for context in ctxs:
+                yield context
+
+
+class FrozenTable(object):
+    """ a term meta table (see snapshot's table kinds) as a read only
+    mapping, values are stored flat and indexed by term id and built
+    again on every access. strings are kept utf8 encoded.
+    """
+
+    PARTS = ("present", "offsets", "data")
+
+    def __init__(self, store, kind, table):
+        self.store = store
+        self.kind = kind
+
+        encoded = {}
+        for key in table:
+            value = None if kind == snapshot.SET else table[key]
+            encoded[store.intern(key)] = self.encode(value)
+
+        n = len(store.terms)
+        self.present = bytearray(n)
+        self.offsets = array(ID, [0] * (n + 1))
+        chunks = []
+        end = 0
+        for i in xrange(n):
+            value = encoded.get(i)
+            if value is not None:
+                self.present[i] = 1
+                chunks.append(value)
+                end += len(value)
+            self.offsets[i + 1] = end
+
+        self.size = len(encoded)
+        if kind == snapshot.TO_STR:
+            # every string of the table in one
+            self.data = b"".join(chunks)
+        else:
+            self.data = array(ID)
+            for chunk in chunks:
+                self.data.extend(chunk)
+
+    def encode(self, value):
+        intern = self.store.intern
+        if self.kind == snapshot.SET:
+            return ()
+        if self.kind == snapshot.TO_STR:
+            return value.encode("utf8")
+        if self.kind == snapshot.TO_LIST:
+            return [intern(t) for t in value]
+
+        # TO_DICT, [key, number of values, values..., key, ...]
+        flat = []
+        for key, targets in sorted(value.iteritems()):
+            flat.append(intern(key))
+            flat.append(len(targets))
+            flat.extend(intern(t) for t in targets)
+        return flat
+
+    def decode(self, i):
+        data = self.data[self.offsets[i] : self.offsets[i + 1]]
+        if self.kind == snapshot.TO_STR:
+            return data.decode("utf8")
+
+        terms = self.store.terms
+        if self.kind == snapshot.TO_LIST:
+            return [terms[t] for t in data]
+
+        value = {}
+        n = 0
+        while n < len(data):
+            count = data[n + 1]
+            value[terms[data[n]]] = [terms[t] for t in data[n + 2 : n + 2 + count]]
+            n += 2 + count
+        return value
+
+    def index(self, key):
+        i = self.store.ids.get(key)
+        if i is None or i >= len(self.present) or not self.present[i]:
+            return None
+        return i
+
+    def __contains__(self, key):
+        return self.index(key) is not None
+
+    def get(self, key, default=None):
+        i = self.index(key)
+        if i is None:
+            return default
+        return self.decode(i)
+
+    def __getitem__(self, key):
+        i = self.index(key)
+        if i is None:
+            raise KeyError(key)
+        return self.decode(i)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        terms, present = self.store.terms, self.present
+        return (terms[i] for i in xrange(len(present)) if present[i])
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def iteritems(self):
+        terms, present = self.store.terms, self.present
+        return ((terms[i], self.decode(i)) for i in xrange(len(present)) if present[i])
+
+    def items(self):
+        return list(self.iteritems())
+
+    def itervalues(self):
+        return (v for _, v in self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __or__(self, other):
+        return set(self) | set(other)
+
+    def __ror__(self, other):
+        return set(other) | set(self)
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+
+"""
+Checks the in-memory indexes built by RDFApi.reload_term_meta
+against a small hand written graph.
+"""
+
+import sys
+import logging
+import unittest
+import rdflib
+from rdflib.namespace import RDF, RDFS
+from sdoserver import RDFApi
+
+logging.basicConfig(stream=sys.stderr)
+log = logging.getLogger()
+
+SDO = rdflib.Namespace("http://schema.org/")
+
+
+def make_api():
+    """ Thing > Organization > Corporation, Thing > Person, Text > URL """
+    api = RDFApi(log)
+    g = api.graph
+
+    for name, parent in [
+        ("Thing", None),
+        ("Organization", "Thing"),
+        ("Corporation", "Organization"),
+        ("Person", "Thing"),
+        ("Text", None),
+        ("URL", "Text"),
+    ]:
+        g.add((SDO[name], RDF.type, RDFS.Class))
+        g.add((SDO[name], RDFS.label, rdflib.Literal(name)))
+        g.add((SDO[name], RDFS.comment, rdflib.Literal("A %s." % name)))
+        if parent is not None:
+            g.add((SDO[name], RDFS.subClassOf, SDO[parent]))
+
+    for name, domains, ranges in [
+        ("name", ["Thing"], ["Text"]),
+        ("url", ["Thing"], ["URL"]),
+        ("employee", ["Organization"], ["Person"]),
+        ("worksFor", ["Person"], ["Organization"]),
+        ("tickerSymbol", ["Corporation"], ["Text"]),
+    ]:
+        g.add((SDO[name], RDF.type, RDF.Property))
+        g.add((SDO[name], RDFS.label, rdflib.Literal(name)))
+        g.add((SDO[name], RDFS.comment, rdflib.Literal("The %s." % name)))
+        for domain in domains:
+            g.add((SDO[name], RDFApi.DOMAIN_INCLUDES, SDO[domain]))
+        for range_ in ranges:
+            g.add((SDO[name], RDFApi.RANGE_INCLUDES, SDO[range_]))
+
+    api.reload_term_meta()
+    return api
+
+
+class HierarchyIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api()
+
+    def test_ancestors_nearest_first(self):
+        self.assertEqual(
+            self.api.get_ancestors(SDO.Corporation),
+            [SDO.Corporation, SDO.Organization, SDO.Thing],
+        )
+        self.assertEqual(self.api.get_ancestors(SDO.Thing), [SDO.Thing])
+
+    def test_ancestors_of_non_class(self):
+        # the old rdfs:subClassOf* query matched the zero length path
+        self.assertEqual(self.api.get_ancestors(SDO.name), [SDO.name])
+        self.assertEqual(
+            self.api.get_ancestors("http://example.com/x"),
+            [rdflib.URIRef("http://example.com/x")],
+        )
+
+    def test_descendants_are_direct_subclasses(self):
+        self.assertEqual(
+            self.api.get_descendants(SDO.Thing), [SDO.Organization, SDO.Person]
+        )
+        self.assertEqual(self.api.get_descendants(SDO.Corporation), [])
+        self.assertTrue(self.api.has_descendants(SDO.Organization))
+        self.assertFalse(self.api.has_descendants(SDO.Corporation))
+
+    def test_iter_hierarchy(self):
+        self.assertEqual(
+            list(self.api.iter_hierarchy(SDO.Thing)),
+            [SDO.Thing, SDO.Organization, SDO.Corporation, SDO.Person],
+        )
+
+    def test_multiple_inheritance(self):
+        g = self.api.graph
+        g.add((SDO.LocalBusiness, RDF.type, RDFS.Class))
+        g.add((SDO.LocalBusiness, RDFS.subClassOf, SDO.Organization))
+        g.add((SDO.LocalBusiness, RDFS.subClassOf, SDO.Place))
+        g.add((SDO.Place, RDF.type, RDFS.Class))
+        g.add((SDO.Place, RDFS.subClassOf, SDO.Thing))
+        self.api.reload_term_meta()
+
+        self.assertEqual(
+            self.api.get_ancestors(SDO.LocalBusiness),
+            [SDO.LocalBusiness, SDO.Organization, SDO.Place, SDO.Thing],
+        )
+
+    def test_cycles(self):
+        g = self.api.graph
+        for name, parent in [("A", "Person"), ("B", "A"), ("C", "B"), ("A", "C")]:
+            g.add((SDO[name], RDF.type, RDFS.Class))
+            g.add((SDO[name], RDFS.subClassOf, SDO[parent]))
+        self.api.reload_term_meta()
+
+        self.assertEqual(
+            list(self.api.iter_hierarchy(SDO.Person)), [SDO.Person, SDO.A, SDO.B, SDO.C]
+        )
+        self.assertEqual(
+            set(self.api.get_ancestors(SDO.A)),
+            set([SDO.A, SDO.B, SDO.C, SDO.Person, SDO.Thing]),
+        )
+
+    def test_deep_chain(self):
+        g = self.api.graph
+        parent = SDO.Thing
+        for n in xrange(sys.getrecursionlimit() * 2):
+            g.add((SDO["C%d" % n], RDFS.subClassOf, parent))
+            parent = SDO["C%d" % n]
+        self.api.reload_term_meta()
+
+        self.assertEqual(len(self.api.get_ancestors(parent)), n + 2)
+        self.assertEqual(self.api.get_ancestors(parent)[-1], SDO.Thing)
+        self.assertEqual(len(list(self.api.iter_hierarchy(SDO.Thing))), n + 5)
+
+
+class PropertyIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api()
+
+    def test_properties_as_domain(self):
+        self.assertEqual(
+            self.api.get_properties_for_class_as_domain(SDO.Thing),
+            {SDO.name: [SDO.Text], SDO.url: [SDO.URL]},
+        )
+        self.assertEqual(self.api.get_properties_for_class_as_domain(SDO.URL), {})
+
+    def test_properties_as_range(self):
+        self.assertEqual(
+            self.api.get_properties_for_class_as_range(SDO.Text),
+            {SDO.name: [SDO.Thing], SDO.tickerSymbol: [SDO.Corporation]},
+        )
+
+    def test_property_without_range_is_left_out(self):
+        self.api.graph.add((SDO.legalName, RDFApi.DOMAIN_INCLUDES, SDO.Organization))
+        self.api.reload_term_meta()
+        self.assertNotIn(
+            SDO.legalName, self.api.get_properties_for_class_as_domain(SDO.Organization)
+        )
+
+    def test_inherited_properties(self):
+        self.assertEqual(
+            self.api.get_inherited_properties_for_class(SDO.Corporation),
+            [
+                (SDO.Corporation, {SDO.tickerSymbol: [SDO.Text]}),
+                (SDO.Organization, {SDO.employee: [SDO.Person]}),
+                (SDO.Thing, {SDO.name: [SDO.Text], SDO.url: [SDO.URL]}),
+            ],
+        )
+        self.assertEqual(self.api.get_inherited_properties_for_class(SDO.Text), [])
+
+
+class FileContextTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = RDFApi(log)
+        a = self.api.file_context("/rdf/a.rdfa")
+        a.add((SDO.Thing, RDF.type, RDFS.Class))
+        b = self.api.file_context("/rdf/b.rdfa")
+        b.add((SDO.Person, RDF.type, RDFS.Class))
+        b.add((SDO.Person, RDFS.subClassOf, SDO.Thing))
+        self.api.files.update(["/rdf/a.rdfa", "/rdf/b.rdfa"])
+        self.api.reload_term_meta()
+
+    def test_remove_file(self):
+        self.api.remove_file("/rdf/b.rdfa")
+        self.api.reload_term_meta()
+        self.assertEqual(self.api.classes, set([SDO.Thing]))
+        self.assertEqual(self.api.files, set(["/rdf/a.rdfa"]))
+
+    def test_copy_files(self):
+        api = RDFApi(log)
+        api.copy_files(self.api, ["/rdf/b.rdfa"])
+        api.reload_term_meta()
+        self.assertEqual(api.classes, set([SDO.Person]))
+        self.assertEqual(api.get_ancestors(SDO.Person), [SDO.Person, SDO.Thing])
+        self.assertEqual(len(api.file_context("/rdf/b.rdfa")), 2)
+
+
+class TermsMetaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api()
+
+    def test_batch(self):
+        terms = self.api.get_terms_meta(
+            [SDO.Corporation, "http://schema.org/name"], ["kind", "label", "ancestors"]
+        )
+        self.assertEqual(
+            terms,
+            {
+                u"http://schema.org/Corporation": {
+                    "kind": "class",
+                    "label": u"Corporation",
+                    "ancestors": [
+                        u"http://schema.org/Corporation",
+                        u"http://schema.org/Organization",
+                        u"http://schema.org/Thing",
+                    ],
+                },
+                u"http://schema.org/name": {
+                    "kind": "property",
+                    "label": u"name",
+                    "ancestors": [u"http://schema.org/name"],
+                },
+            },
+        )
+
+    def test_all_fields(self):
+        meta = self.api.get_terms_meta([SDO.Thing])[u"http://schema.org/Thing"]
+        self.assertEqual(set(meta), set(RDFApi.TERM_META_FIELDS))
+        self.assertEqual(
+            meta["domain_properties"],
+            {
+                u"http://schema.org/name": [u"http://schema.org/Text"],
+                u"http://schema.org/url": [u"http://schema.org/URL"],
+            },
+        )
+        self.assertIn(
+            [unicode(RDFS.label), {"type": "literal", "value": u"Thing"}],
+            meta["predicate_objects"],
+        )
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, self.api.get_terms_meta, [SDO.Thing], ["nope"])
+
+
+class CompleteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api()
+
+    def test_classes_before_properties(self):
+        self.assertEqual(
+            self.api.complete("T"), (3, [SDO.Text, SDO.Thing, SDO.tickerSymbol])
+        )
+
+    def test_shallower_classes_first(self):
+        self.api.graph.add((SDO.Organ, RDFS.label, rdflib.Literal("Organ")))
+        self.api.graph.add((SDO.Organ, RDF.type, RDFS.Class))
+        self.api.graph.add((SDO.Organ, RDFS.subClassOf, SDO.Corporation))
+        self.api.reload_term_meta()
+        self.assertEqual(self.api.complete("organ"), (2, [SDO.Organization, SDO.Organ]))
+
+    def test_pages(self):
+        self.assertEqual(self.api.complete("t", offset=1, limit=1), (3, [SDO.Thing]))
+        self.assertEqual(self.api.complete("works"), (1, [SDO.worksFor]))
+        self.assertEqual(self.api.complete("xyz"), (0, []))
+        self.assertEqual(self.api.complete(""), (0, []))
+
+
+class TermLinkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api()
+        self.api.graph.set((SDO.Person, RDFS.label, rdflib.Literal("People & <b>")))
+        self.api.reload_term_meta()
+
+    def check_links(self):
+        api = self.api
+        self.assertEqual(
+            api.term_link(SDO.Person),
+            '<a href="/schema/schema.org/Person"> People &amp; &lt;b&gt; </a>',
+        )
+        self.assertEqual(
+            api.term_link("http://schema.org/url"),
+            '<a href="/schema/schema.org/url"> url </a>',
+        )
+        self.assertEqual(
+            api.term_link(rdflib.URIRef("http://example.com/?a=1&b=2")),
+            '<a href="http://example.com/?a=1&amp;b=2" target="_blank">'
+            " http://example.com/?a=1&amp;b=2 </a>",
+        )
+        # literals are never links, even when they look like a known uri
+        self.assertEqual(api.term_link(rdflib.Literal(SDO.Person)), unicode(SDO.Person))
+        self.assertEqual(api.term_link(rdflib.Literal("a < b")), "a &lt; b")
+        self.assertEqual(api.term_link(rdflib.Literal(5)), "5")
+        self.assertEqual(
+            api.term_links([SDO.Thing, SDO.URL], " or "),
+            '<a href="/schema/schema.org/Thing"> Thing </a> or '
+            '<a href="/schema/schema.org/URL"> URL </a>',
+        )
+
+    def test_links(self):
+        self.check_links()
+
+    def test_frozen_links(self):
+        self.api.freeze()
+        self.check_links()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,9 @@
 """
 Re-Using SPARQL queries from schema.org and adding more
 for ontology consistency.
+
+The checks themselves live in consistency.py so the server can run them
+against the graph it has loaded, this runs them against RDF_DIR.
 """
 
 # TODO use a reasoner !
@@ -10,172 +13,165 @@ for ontology consistency.
 import os
 import sys
 import glob
+import json
+import shutil
+import tempfile
 import logging
 import unittest
+import rdflib
+from rdflib.namespace import RDFS
+import consistency
 from sdoserver import RDFApi
 
+SDO = rdflib.Namespace("http://schema.org/")
+
 logging.basicConfig(stream=sys.stderr)
 log = logging.getLogger()
 warnings = []
 
 
 class GraphConsistenctyTestCase(unittest.TestCase):
-    def setUp(self):
-        self.api = RDFApi(log)
-        self.rdf_dir = os.getenv("RDF_DIR")
-        if self.rdf_dir is None:
+    @classmethod
+    def setUpClass(cls):
+        # the graph is loaded once for all the checks
+        cls.api = None
+        rdf_dir = os.getenv("RDF_DIR")
+        if rdf_dir is None:
             warnings.append("skipping test as RDF_DIR is not set")
             log.warning("skipping test as RDF_DIR is not set")
-            raise unittest.SkipTest("Environmental variable RDF_DIR  needs to be set")
+            return
 
-        rdf_dirs = self.rdf_dir.split(":")
         filelist = []
-        for rdf_dir in rdf_dirs:
+        for rdf_dir in rdf_dir.split(":"):
             for ext in RDFApi.EXT_TO_FORMAT.iterkeys():
                 files = glob.glob(os.path.join(rdf_dir, "*%s" % ext))
                 filelist.extend(files)
 
-        for f in filelist:
-            self.api.add_file(f)
+        cls.api = RDFApi(log)
+        cls.api.add_files(filelist)
+        cls.api.reload_term_meta()
+
+    def setUp(self):
+        if self.api is None:
+            raise unittest.SkipTest("Environmental variable RDF_DIR  needs to be set")
+
+    def assertCheckPasses(self, name, msg):
+        global warnings
+        problems = consistency.CHECKS[name](self.api)
+        for problem in problems:
+            warnings.append(problem)
+            log.warn(problem)
+
+        self.assertEqual(len(problems), 0, "%s. Found: %s" % (msg, len(problems)))
 
     def test_even_number_inverseOf(self):
-        inverseOf_results = self.api.graph.query(
-            """
-            SELECT ?x ?y WHERE { ?x <http://schema.org/inverseOf> ?y }
-        """
+        self.assertCheckPasses(
+            "even_number_inverseOf", "Even number of inverseOf triples expected"
         )
-        self.assertEqual(
-            len(inverseOf_results) % 2 == 0,
-            True,
-            "Even number of inverseOf triples expected. Found: %s"
-            % len(inverseOf_results),
+
+    def test_symmetric_inverseOf(self):
+        self.assertCheckPasses(
+            "symmetric_inverseOf", "inverseOf should be declared both ways"
+        )
+
+    def test_inverseOf_domain_range(self):
+        self.assertCheckPasses(
+            "inverseOf_domain_range",
+            "rangeIncludes of a property should be domainIncludes of its inverse",
         )
 
     # @unittest.expectedFailure # autos
     def test_needless_domainIncludes(self):
-        global warnings
-        # check immediate subtypes don't declare same domainIncludes
-        # TODO: could we use property paths here to be more thorough?
-        # rdfs:subClassOf+ should work but seems not to.
-        query = """
-            prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT ?prop ?c1 ?c2
-            WHERE {
-                ?prop <http://schema.org/domainIncludes> ?c1 .
-                ?prop <http://schema.org/domainIncludes> ?c2 .
-                ?c1 rdfs:subClassOf ?c2 .
-                FILTER (?c1 != ?c2) .
-            }
-            ORDER BY ?prop
-        """
-
-        result = self.api.graph.query(query)
-        fmt = "property {prop} defining domain, {c1}, [which is subclassOf] {c2} unnecessarily."
-
-        if len(result) > 0:
-            for row in result:
-                warn = fmt.format(prop=row[0], c1=row[1], c2=row[2])
-                warnings.append(warn)
-                log.warn(warn)
-
-        self.assertEqual(
-            len(result),
-            0,
-            "No subtype need redeclare a domainIncludes of its parents. Found: %s "
-            % len(result),
+        self.assertCheckPasses(
+            "needless_domainIncludes",
+            "No subtype need redeclare a domainIncludes of its parents",
         )
 
     # @unittest.expectedFailure
     def test_needlessRangeIncludes(self):
-        global warnings
-        # as above, but for range. We excuse URL as it is special, not best seen as a Text subtype.
-        # check immediate subtypes don't declare same domainIncludes
-        # TODO: could we use property paths here to be more thorough?
-        query = """
-            prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT ?prop ?c1 ?c2
-            WHERE {
-                ?prop <http://schema.org/rangeIncludes> ?c1 .
-                ?prop <http://schema.org/rangeIncludes> ?c2 .
-                ?c1 rdfs:subClassOf ?c2 .
-                FILTER (?c1 != ?c2) .
-                FILTER (?c1 != <http://schema.org/URL>) .
-            }
-            ORDER BY ?prop
-        """
-
-        result = self.api.graph.query(query)
-        fmt = "property {prop} defining range, {c1}, [which is subclassOf] {c2} unnecessarily."
-
-        if len(result) > 0:
-            for row in result:
-                warn = fmt.format(prop=row[0], c1=row[1], c2=row[2])
-                warnings.append(warn)
-                log.warn(warn)
-
-        self.assertEqual(
-            len(result),
-            0,
-            "No subtype need redeclare a rangeIncludes of its parents. Found: %s "
-            % len(result),
+        self.assertCheckPasses(
+            "needless_rangeIncludes",
+            "No subtype need redeclare a rangeIncludes of its parents",
         )
 
     def test_valid_rangeIncludes(self):
-        """ Every range includes should be a valid type """
-        query = """
-            prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT ?prop ?c1
-            WHERE {
-                ?prop <http://schema.org/rangeIncludes> ?c1 .
-                OPTIONAL {
-                    ?c1 rdf:type ?c2 .
-                    ?c1 rdf:type rdfs:Class .
-                }.
-                FILTER (!BOUND(?c2))
-            }
-            ORDER BY ?prop
-        """
-
-        result = self.api.graph.query(query)
-        for row in result:
-            log.warn(
-                "Property %s invalid rangeIncludes value: %s", row["prop"], row["c1"]
-            )
-
-        self.assertEqual(
-            len(result),
-            0,
-            "RangeIncludes should define valid type. Found: %s" % len(result),
+        self.assertCheckPasses(
+            "valid_rangeIncludes", "RangeIncludes should define valid type"
         )
 
     def test_valid_domainIncludes(self):
-        """ Every domain includes should be a valid type """
-        query = """
-            prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT ?prop ?c1
-            WHERE {
-                ?prop <http://schema.org/domainIncludes> ?c1 .
-                OPTIONAL {
-                    ?c1 rdf:type ?c2 .
-                    ?c1 rdf:type rdfs:Class .
-                }.
-                FILTER (!BOUND(?c2))
-            }
-            ORDER BY ?prop
-        """
-
-        result = self.api.graph.query(query)
-        for row in result:
-            log.warn(
-                "Property %s invalid domainIncludes value: %s", row["prop"], row["c1"]
-            )
+        self.assertCheckPasses(
+            "valid_domainIncludes", "DomainIncludes should define valid type"
+        )
+
+    def test_duplicate_comments(self):
+        self.assertCheckPasses(
+            "duplicate_comments", "Different terms should not share a comment"
+        )
+
+
+class ChecksTestCase(unittest.TestCase):
+    """ the checks themselves, against the small graph of test_api """
+
+    def setUp(self):
+        from tests.test_api import make_api
+
+        self.api = make_api()
 
+    def run_check(self, name):
+        self.api.reload_term_meta()
+        return consistency.CHECKS[name](self.api)
+
+    def test_all_pass(self):
+        for name in consistency.CHECKS:
+            self.assertEqual(self.run_check(name), [], name)
+
+    def test_inverse_of(self):
+        g = self.api.graph
+        g.add((SDO.employee, consistency.INVERSE_OF, SDO.worksFor))
+        self.assertEqual(len(self.run_check("even_number_inverseOf")), 1)
+        self.assertEqual(len(self.run_check("symmetric_inverseOf")), 1)
+
+        g.add((SDO.worksFor, consistency.INVERSE_OF, SDO.employee))
+        self.assertEqual(self.run_check("symmetric_inverseOf"), [])
+        self.assertEqual(self.run_check("inverseOf_domain_range"), [])
+
+        g.add((SDO.worksFor, RDFApi.RANGE_INCLUDES, SDO.Corporation))
+        self.assertEqual(len(self.run_check("inverseOf_domain_range")), 1)
+
+    def test_needless_includes(self):
+        g = self.api.graph
+        g.add((SDO.employee, RDFApi.DOMAIN_INCLUDES, SDO.Corporation))
+        g.add((SDO.name, RDFApi.RANGE_INCLUDES, SDO.URL))
+        self.assertEqual(len(self.run_check("needless_domainIncludes")), 1)
+        # URL is excused
+        self.assertEqual(self.run_check("needless_rangeIncludes"), [])
+
+    def test_invalid_includes(self):
+        self.api.graph.add((SDO.name, RDFApi.RANGE_INCLUDES, SDO.Nothing))
         self.assertEqual(
-            len(result),
-            0,
-            "DomainIncludes should define valid type. Found %s" % len(result),
+            self.run_check("valid_rangeIncludes"),
+            ["Property %s invalid rangeIncludes value: %s" % (SDO.name, SDO.Nothing)],
         )
 
+    def test_duplicate_comments(self):
+        self.api.graph.set((SDO.url, RDFS.comment, rdflib.Literal("The name.")))
+        self.assertEqual(len(self.run_check("duplicate_comments")), 1)
+
+    def test_report_file(self):
+        path = os.path.join(tempfile.mkdtemp(), "graph.image.checks.json")
+        try:
+            shared = consistency.ReportFile(path, self.api.generation)
+            self.assertEqual(shared.to_json()["state"], "pending")
+
+            self.api.reload_term_meta()
+            report = consistency.ConsistencyReport(self.api, log, path)
+            report.run()
+            self.assertEqual(shared.to_json(), json.loads(json.dumps(report.to_json())))
+            self.assertEqual(shared.to_json()["state"], "done")
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+
 
 def tearDownModule():
     global warnings
@@ -187,9 +183,7 @@ def tearDownModule():
 
 # TODO: Unwritten tests (from basics; easier here?)
 #
-# * different terms should not have identical comments
 # * rdflib and internal parsers should have same number of triples
-# * if x and y are inverseOf each other, the rangeIncludes types on x should be domainIncludes on y, and vice-versa.
 # * need a few supporting functions e.g. all terms, all types, all properties, all enum values; candidates for api later but just use here first.
 
 
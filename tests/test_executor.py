@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+from executor import BoundedExecutor, Saturated
+from latency import STATS, Trace
+
+
+class BoundedExecutorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.executor = BoundedExecutor(1, 1)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+
+    def test_saturated(self):
+        running = self.executor.submit("test", self.release.wait)
+        queued = self.executor.submit("test", lambda: 2)
+        with self.assertRaises(Saturated):
+            self.executor.submit("test", lambda: 3)
+
+        # follow up work of admitted requests is never turned away
+        admitted = self.executor.submit_admitted("test", lambda: 4)
+        stats = self.executor.to_json()
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["running"] + stats["queued"], 3)
+
+        self.release.set()
+        self.assertEqual(queued.result(), 2)
+        self.assertEqual(admitted.result(), 4)
+        running.result()
+        self.assertEqual(self.executor.to_json()["queued"], 0)
+        self.assertEqual(self.executor.submit("test", lambda: 5).result(), 5)
+
+    def test_queue_time_and_trace(self):
+        trace = Trace()
+        current = self.executor.submit(
+            "traced", STATS.current_trace, trace=trace
+        ).result()
+        admitted = self.executor.submit_admitted(
+            "traced", STATS.current_trace, trace=trace
+        ).result()
+
+        # the calls ran on behalf of trace's request
+        self.assertIs(current, trace)
+        self.assertIs(admitted, trace)
+        self.assertIsNone(self.executor.submit("traced", STATS.current_trace).result())
+        self.assertIsNone(STATS.current_trace())
+        self.assertGreaterEqual(STATS.to_json()["queue"]["traced"]["count"], 1)
+
+    def test_errors_are_raised_by_the_future(self):
+        future = self.executor.submit("test", int, "not a number")
+        with self.assertRaises(ValueError):
+            future.result()
+        self.assertEqual(self.executor.to_json()["running"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
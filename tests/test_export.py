@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import os
+import gzip
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+from StringIO import StringIO
+from concurrent.futures import Future
+
+import rdflib
+from export import (
+    Export,
+    ExportCache,
+    FORMATS,
+    RangeNotSatisfiable,
+    parse_range,
+    serialize,
+)
+from sdoserver import RDFApi
+from tests.test_api import make_api
+
+
+def run_now(fn, *args):
+    """ a submit that runs fn right away """
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+class ParseRangeTestCase(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 10))
+        self.assertEqual(parse_range("bytes=90-200", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=95-", 100), (95, 100))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=-200", 100), (0, 100))
+
+    def test_ignored(self):
+        for header in [
+            None,
+            "",
+            "items=0-9",
+            "bytes=0-9,20-29",
+            "bytes=9-0",
+            "bytes=a-",
+        ]:
+            self.assertIsNone(parse_range(header, 100), header)
+
+    def test_not_satisfiable(self):
+        for header in ["bytes=100-", "bytes=200-300", "bytes=-0"]:
+            with self.assertRaises(RangeNotSatisfiable):
+                parse_range(header, 100)
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api()
+        self.api.freeze()
+
+    def test_formats_roundtrip(self):
+        expected = set(self.api.graph)
+        for fmt, (rdflib_format, _) in FORMATS.iteritems():
+            graph = rdflib.Graph()
+            graph.parse(data=serialize(self.api.graph, fmt), format=rdflib_format)
+            self.assertEqual(set(graph), expected, fmt)
+
+    def test_encodings(self):
+        export = Export("nt", 1, serialize(self.api.graph, "nt"))
+        body, etag = export.bodies[None]
+        gzipped, gzip_etag = export.bodies["gzip"]
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(gzipped)).read(), body)
+        self.assertNotEqual(etag, gzip_etag)
+
+        self.assertEqual(export.negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(export.negotiate("deflate, *"), "gzip")
+        self.assertIsNone(export.negotiate(""))
+        self.assertIsNone(export.negotiate("gzip;q=0, deflate"))
+        self.assertIsNone(export.negotiate("x-gzip"))
+        if "br" in export.bodies:
+            self.assertEqual(export.negotiate("gzip, br"), "br")
+            self.assertEqual(export.negotiate("gzip, br;q=0"), "gzip")
+
+    def test_files_are_left_out(self):
+        # loaded the way the server does, a named graph per file
+        work_dir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(work_dir, "schema.jsonld")
+            self.api.graph.serialize(destination=fname, format="json-ld")
+            api = RDFApi(logging.getLogger())
+            api.add_file(fname)
+            api.reload_term_meta()
+            api.freeze()
+        finally:
+            shutil.rmtree(work_dir)
+
+        bound = dict(api.graph.namespaces())
+        doc = json.loads(serialize(api.graph, "jsonld"))
+        self.assertEqual(len(doc), len(set(api.graph.subjects())))
+        self.assertFalse([d for d in doc if d["@id"].startswith("file://")])
+        self.assertNotIn("file://", serialize(api.graph, "ttl"))
+        self.assertIn(
+            "@prefix schema: <http://schema.org/>", serialize(api.graph, "ttl")
+        )
+        # the shared graph is left as it was
+        self.assertEqual(dict(api.graph.namespaces()), bound)
+
+    def test_cache_builds_once(self):
+        cache = ExportCache()
+        first = cache.get(self.api, "ttl", run_now)
+        self.assertIs(cache.get(self.api, "ttl", run_now), first)
+        self.assertEqual(cache.builds, 1)
+
+        self.api.generation += 1
+        self.assertIsNot(cache.get(self.api, "ttl", run_now), first)
+        cache.expire(self.api.generation)
+        self.assertEqual(cache.exports.keys(), [(self.api.generation, "ttl")])
+
+    def test_failed_build_is_retried(self):
+        cache = ExportCache()
+        failed = cache.get(self.api, "unknown", run_now)
+        self.assertIsNotNone(failed.exception())
+        self.assertIsNot(cache.get(self.api, "unknown", run_now), failed)
+        self.assertEqual(cache.builds, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
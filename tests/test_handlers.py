@@ -0,0 +1,585 @@
+#!/usr/bin/env python
+
+"""
+Requests against a whole SdoServer serving make_api's schema, loaded
+from a json-ld file in a temporary directory.
+"""
+
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import shutil
+import signal
+import socket
+import urllib2
+import contextlib
+import urllib
+import tempfile
+import unittest
+import threading
+import subprocess
+from StringIO import StringIO
+
+import rdflib
+import tornado.ioloop
+import tornado.testing
+from rdflib.namespace import RDF, RDFS
+import validation
+from sdoserver import CompleteHandler, SdoServer, TermsHandler, ValidateHandler
+from tests.test_api import make_api, SDO
+from tests.test_sparql import CLASSES, RUNAWAY
+from tests.test_validation import DyingConstraints
+
+
+class IdleLoop(object):
+    """ stands in for the ioloop Server.run would start, the test's
+    own ioloop runs the app instead
+    """
+
+    def start(self):
+        pass
+
+
+@contextlib.contextmanager
+def ioloop_instance(loop):
+    """ makes IOLoop.instance() return loop for a while """
+    # a staticmethod, put back the descriptor itself
+    instance = tornado.ioloop.IOLoop.__dict__["instance"]
+    tornado.ioloop.IOLoop.instance = staticmethod(lambda: loop)
+    try:
+        yield
+    finally:
+        tornado.ioloop.IOLoop.instance = instance
+
+
+def make_server(rdf_dir, work_dir, args=()):
+    """ a prepared SdoServer over the rdf files in rdf_dir, not listening """
+    server = SdoServer(
+        ["--log-level", "warning", "run", rdf_dir]
+        + ["--index-dir", os.path.join(work_dir, "index")]
+        + ["--snapshot-file", "", "--skip-tests", "--validate-workers", "1"]
+        + list(args)
+    )
+    server.args.port = 0
+    with ioloop_instance(IdleLoop()):
+        server.run()
+    return server
+
+
+def gunzip(body):
+    return gzip.GzipFile(fileobj=StringIO(body)).read()
+
+
+class ServerTestCase(tornado.testing.AsyncHTTPTestCase):
+    """ one server per test case class, started with ARGS """
+
+    ARGS = ()
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp()
+        cls.rdf_dir = os.path.join(cls.work_dir, "rdf")
+        os.mkdir(cls.rdf_dir)
+        with open(os.path.join(cls.rdf_dir, "schema.jsonld"), "w") as f:
+            f.write(make_api().graph.serialize(format="json-ld"))
+
+        cls.server = make_server(cls.rdf_dir, cls.work_dir, cls.ARGS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.executor.shutdown()
+        cls.server.threadpool.terminate()
+        cls.server.validation.retire()
+        shutil.rmtree(cls.work_dir)
+
+    def get_app(self):
+        return self.server.app
+
+
+class CachedPageTestCase(ServerTestCase):
+    """ pages gzipped once per request, tornado's transform stays out """
+
+    def fetch_page(self, accept_encoding=None, etag=None):
+        headers = {}
+        if accept_encoding is not None:
+            headers["Accept-Encoding"] = accept_encoding
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        # or the client asks for gzip itself
+        return self.fetch(
+            "/schema/schema.org/Person", headers=headers, decompress_response=False
+        )
+
+    def test_etag_and_gzip(self):
+        response = self.fetch_page("gzip")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertIn("A Person.", gunzip(response.body))
+        etag = response.headers["Etag"]
+        self.assertTrue(etag.endswith('-gzip"'))
+        self.assertEqual(self.fetch_page("gzip", etag).code, 304)
+
+        # refused and not asked for gzip both get the page as it is, under
+        # an etag of its own
+        for accept_encoding in ["gzip;q=0", "identity"]:
+            plain = self.fetch_page(accept_encoding)
+            self.assertEqual(plain.code, 200)
+            self.assertNotIn("Content-Encoding", plain.headers)
+            self.assertIn("A Person.", plain.body)
+            self.assertEqual(plain.headers["Etag"], '%s"' % etag[: -len('-gzip"')])
+
+        self.assertEqual(self.fetch_page("gzip", plain.headers["Etag"]).code, 200)
+        self.assertEqual(self.fetch_page(None, plain.headers["Etag"]).code, 304)
+        self.assertEqual(self.fetch_page("identity", etag).code, 200)
+
+
+class PrecompressedPageTestCase(CachedPageTestCase):
+    """ the same responses from pages kept gzipped """
+
+    ARGS = ["--page-cache-gzip"]
+
+
+class FullSchemaTestCase(ServerTestCase):
+    def test_sections_are_cached(self):
+        page_cache = self.server.page_cache
+        page = self.fetch("/schema/full")
+        self.assertEqual(page.code, 200)
+        for name in ["Thing", "Organization", "Corporation", "Person"]:
+            self.assertIn("/schema/schema.org/%s" % name, page.body)
+
+        misses = page_cache.misses
+        again = self.fetch("/schema/full")
+        self.assertEqual(again.body, page.body)
+        self.assertEqual(page_cache.misses, misses)
+
+        # a section for every class and the page around them
+        generation = self.server.api.generation
+        keys = [k for k in page_cache.pages if k[0] == "/schema/full"]
+        self.assertEqual(len(keys), 5)
+        self.assertTrue(all(k[-1] == generation for k in keys))
+
+        response = self.fetch(
+            "/schema/full", headers={"If-None-Match": page.headers["Etag"]}
+        )
+        self.assertEqual(response.code, 304)
+
+
+class ExportTestCase(ServerTestCase):
+    def fetch_export(self, **headers):
+        return self.fetch(
+            "/schema/export.nt", headers=headers, decompress_response=False
+        )
+
+    def test_ranges(self):
+        whole = self.fetch_export()
+        self.assertEqual(whole.code, 200)
+        self.assertEqual(whole.headers["Accept-Ranges"], "bytes")
+        self.assertNotIn("Content-Encoding", whole.headers)
+        self.assertIn("<http://schema.org/Person>", whole.body)
+        size, etag = len(whole.body), whole.headers["Etag"]
+
+        part = self.fetch_export(Range="bytes=10-19")
+        self.assertEqual(part.code, 206)
+        self.assertEqual(part.headers["Content-Range"], "bytes 10-19/%d" % size)
+        self.assertEqual(part.body, whole.body[10:20])
+
+        # resuming needs the same export
+        part = self.fetch_export(Range="bytes=-5", **{"If-Range": etag})
+        self.assertEqual(part.code, 206)
+        self.assertEqual(part.body, whole.body[-5:])
+        stale = self.fetch_export(Range="bytes=-5", **{"If-Range": '"stale"'})
+        self.assertEqual(stale.code, 200)
+        self.assertEqual(stale.body, whole.body)
+
+        response = self.fetch_export(Range="bytes=%d-" % size)
+        self.assertEqual(response.code, 416)
+        self.assertEqual(response.headers["Content-Range"], "bytes */%d" % size)
+
+        self.assertEqual(self.fetch_export(**{"If-None-Match": etag}).code, 304)
+
+    def test_encodings(self):
+        whole = self.fetch_export()
+        gzipped = self.fetch_export(**{"Accept-Encoding": "gzip"})
+        self.assertEqual(gzipped.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gunzip(gzipped.body), whole.body)
+        self.assertNotEqual(gzipped.headers["Etag"], whole.headers["Etag"])
+
+        # ranges are of the encoded bytes
+        part = self.fetch_export(**{"Accept-Encoding": "gzip", "Range": "bytes=0-9"})
+        self.assertEqual(part.code, 206)
+        self.assertEqual(part.body, gzipped.body[:10])
+
+        refused = self.fetch_export(**{"Accept-Encoding": "gzip;q=0"})
+        self.assertNotIn("Content-Encoding", refused.headers)
+        self.assertEqual(refused.headers["Etag"], whole.headers["Etag"])
+        self.assertEqual(refused.body, whole.body)
+
+        jsonld = self.fetch("/schema/export.jsonld")
+        self.assertNotIn("file://", jsonld.body)
+
+
+class ContextTestCase(ServerTestCase):
+    def test_namespaces(self):
+        response = self.fetch("/schema/context.jsonld")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers["Access-Control-Allow-Origin"], "*")
+        context = json.loads(response.body)["@context"]
+        self.assertEqual(context["@vocab"], "http://schema.org/")
+        # @vocab expands the bare names
+        self.assertNotIn("Person", context)
+
+        schema = self.fetch("/schema/context.jsonld?ns=schema")
+        self.assertEqual(schema.code, 200)
+        self.assertEqual(self.fetch("/schema/context.jsonld?ns=nope").code, 404)
+
+
+class ChildrenTestCase(ServerTestCase):
+    def children(self, uri):
+        response = self.fetch("/schema/api/children?uri=%s" % uri)
+        self.assertEqual(response.code, 200)
+        nodes = re.findall(
+            r'data-uri="([^"]+)" data-has-children="(\w+)"', response.body
+        )
+        return [(rdflib.URIRef(node), flag) for node, flag in nodes]
+
+    def test_branches(self):
+        # the tree comes with Thing's own children only
+        tree = self.fetch("/schema/tree").body
+        self.assertIn("/schema/schema.org/Organization", tree)
+        self.assertNotIn("/schema/schema.org/Corporation", tree)
+
+        self.assertEqual(
+            self.children(SDO.Thing),
+            [(SDO.Organization, "true"), (SDO.Person, "false")],
+        )
+        self.assertEqual(self.children(SDO.Organization), [(SDO.Corporation, "false")])
+        self.assertEqual(self.children(SDO.Corporation), [])
+        self.assertEqual(self.fetch("/schema/api/children").code, 400)
+
+
+class TermsTestCase(ServerTestCase):
+    def post_terms(self, doc):
+        return self.fetch("/schema/api/terms", method="POST", body=json.dumps(doc))
+
+    def test_batch(self):
+        uris = [unicode(SDO.Person), unicode(SDO.name)]
+        response = self.post_terms(dict(uris=uris, fields=["kind", "label"]))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(
+            json.loads(response.body)["terms"],
+            {
+                uris[0]: dict(kind="class", label="Person"),
+                uris[1]: dict(kind="property", label="name"),
+            },
+        )
+
+        response = self.fetch("/schema/api/terms?fields=ancestors&uri=%s" % uris[0])
+        self.assertEqual(
+            json.loads(response.body)["terms"][uris[0]]["ancestors"],
+            [uris[0], unicode(SDO.Thing)],
+        )
+
+    def test_bad_requests(self):
+        uris = [unicode(SDO.Person)] * (TermsHandler.MAX_TERMS + 1)
+        self.assertEqual(self.post_terms(dict(uris=uris)).code, 400)
+        self.assertEqual(self.post_terms(dict(uris=uris[:1], fields=["x"])).code, 400)
+        self.assertEqual(self.post_terms(["not", "a", "dict"]).code, 400)
+        self.assertEqual(self.post_terms(dict(uris=[1])).code, 400)
+        self.assertEqual(self.post_terms(dict(uris=unicode(SDO.Person))).code, 400)
+        self.assertEqual(self.post_terms(dict(uris=uris[:1], fields="kind")).code, 400)
+        self.assertEqual(self.post_terms(dict(uris=uris[:1], fields=[None])).code, 400)
+
+
+class CompleteTestCase(ServerTestCase):
+    def complete(self, query):
+        response = self.fetch("/schema/api/complete?" + query)
+        self.assertEqual(response.code, 200)
+        return json.loads(response.body)
+
+    def test_paging(self):
+        doc = self.complete("q=t&limit=2")
+        self.assertEqual((doc["total"], doc["offset"], doc["limit"]), (3, 0, 2))
+        self.assertEqual([r["label"] for r in doc["results"]], ["Text", "Thing"])
+        self.assertEqual(
+            doc["results"][1],
+            dict(
+                uri=unicode(SDO.Thing),
+                label="Thing",
+                kind="class",
+                href="/schema/schema.org/Thing",
+            ),
+        )
+
+        doc = self.complete("q=t&offset=2&limit=2")
+        self.assertEqual([r["label"] for r in doc["results"]], ["tickerSymbol"])
+        self.assertEqual(self.complete("q=t&offset=3")["results"], [])
+        self.assertEqual(
+            self.complete("q=t&limit=100000")["limit"], CompleteHandler.MAX_LIMIT
+        )
+        self.assertEqual(self.fetch("/schema/api/complete?q=t&offset=x").code, 400)
+
+
+class ValidateTestCase(ServerTestCase):
+    ARGS = ["--validate-workers", "2"]
+
+    def validate(self, lines, query=""):
+        response = self.fetch(
+            "/schema/api/validate" + query, method="POST", body="\n".join(lines)
+        )
+        self.assertEqual(response.code, 200)
+        return [json.loads(line) for line in response.body.splitlines()]
+
+    def test_batches_keep_order(self):
+        # more batches than are validated at once
+        n = validation.BATCH_SIZE * (ValidateHandler.MAX_BATCHES + 2) + 10
+        lines = [
+            json.dumps({"@type": "Person" if i % 7 else "Robot", "name": "n%d" % i})
+            for i in xrange(n)
+        ]
+        results = self.validate(lines)
+        self.assertEqual([r["line"] for r in results], range(1, n + 1))
+        self.assertEqual(
+            [r["valid"] for r in results], [bool(i % 7) for i in xrange(n)]
+        )
+
+        errors = self.validate(lines, "?errors_only=1")
+        self.assertEqual([r["line"] for r in errors], range(1, n + 1, 7))
+        self.assertEqual(errors[0]["errors"][0]["error"], "type")
+
+    def test_dead_worker(self):
+        pool = self.server.validation
+        dying = self.server.validation = validation.ValidationPool(
+            DyingConstraints(self.server.api), 2, timeout=0.5
+        )
+        try:
+            response = self.fetch("/schema/api/validate", method="POST", body="die")
+        finally:
+            self.server.validation = pool
+            dying.retire()
+        self.assertEqual(response.code, 503)
+
+
+class SaturatedTestCase(ServerTestCase):
+    ARGS = ["--executor-workers", "1", "--executor-queue", "0", "--retry-after", "7"]
+
+    def test_validate(self):
+        release = threading.Event()
+        blocked = self.server.executor.submit("test", release.wait)
+        body = json.dumps({"@type": "Person"})
+        try:
+            response = self.fetch("/schema/api/validate", method="POST", body=body)
+        finally:
+            release.set()
+        blocked.result()
+
+        self.assertEqual(response.code, 503)
+        self.assertEqual(response.headers["Retry-After"], "7")
+        response = self.fetch("/schema/api/validate", method="POST", body=body)
+        self.assertEqual(response.code, 200)
+
+    def test_retry_after(self):
+        release = threading.Event()
+        blocked = self.server.executor.submit("test", release.wait)
+        try:
+            response = self.fetch("/schema/tree")
+        finally:
+            release.set()
+        blocked.result()
+
+        self.assertEqual(response.code, 503)
+        self.assertEqual(response.headers["Retry-After"], "7")
+        self.assertEqual(self.fetch("/schema/tree").code, 200)
+        self.assertEqual(self.server.executor.to_json()["rejected"], 1)
+
+
+class SparqlTestCase(ServerTestCase):
+    ARGS = ["--sparql-timeout", "0.5", "--sparql-processes", "1", "--retry-after", "7"]
+
+    def query(self, text, **kwargs):
+        args = dict(kwargs, query=text)
+        return self.fetch("/sparql?" + urllib.urlencode(args))
+
+    def test_results(self):
+        response = self.query(CLASSES)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(len(json.loads(response.body)["results"]["bindings"]), 6)
+
+        response = self.fetch(
+            "/sparql",
+            method="POST",
+            body=CLASSES,
+            headers={"Content-Type": "application/sparql-query", "Accept": "text/csv"},
+        )
+        self.assertEqual(response.code, 200)
+        self.assertTrue(response.body.startswith("class,label\r\n"))
+
+    def test_refused(self):
+        for text in [
+            "SELECT * FROM <file:///etc/passwd> WHERE { ?s ?p ?o }",
+            "INSERT DATA { <a:b> <a:c> <a:d> }",
+            "SELECT ?g WHERE { GRAPH ?g { ?s ?p ?o } }",
+        ]:
+            response = self.query(text)
+            self.assertEqual(response.code, 400)
+            self.assertNotIn("file://", response.body)
+
+        response = self.query("ASK { ?s ?p ?o }", format="csv")
+        self.assertEqual(response.code, 406)
+
+    def test_timeout(self):
+        response = self.query(RUNAWAY)
+        self.assertEqual(response.code, 503)
+        self.assertEqual(response.headers["Retry-After"], "7")
+        self.assertEqual(self.server.sparql.to_json()["running"], 0)
+
+    def test_saturated(self):
+        sparql = self.server.sparql
+        process = sparql.start(self.server.api.graph, sparql.plans.get(CLASSES), "json")
+        try:
+            response = self.query(CLASSES)
+        finally:
+            sparql.done(process)
+
+        self.assertEqual(response.code, 503)
+        self.assertEqual(response.headers["Retry-After"], "7")
+        self.assertEqual(self.query(CLASSES).code, 200)
+
+
+class ReloadTestCase(ServerTestCase):
+    def reload(self):
+        with ioloop_instance(self.io_loop):
+            self.server.reload_graph()
+        # swap_api, when there is anything to swap, runs before stop
+        self.io_loop.add_callback(self.stop)
+        self.wait()
+
+    def kind(self, uri):
+        response = self.fetch("/schema/api/terms?fields=kind&uri=%s" % uri)
+        return json.loads(response.body)["terms"][unicode(uri)]["kind"]
+
+    def test_reload(self):
+        api = self.server.api
+        self.assertNotIn("Animal", self.fetch("/schema/tree").body)
+
+        graph = rdflib.Graph()
+        graph.add((SDO.Animal, RDF.type, RDFS.Class))
+        graph.add((SDO.Animal, RDFS.label, rdflib.Literal("Animal")))
+        graph.add((SDO.Animal, RDFS.subClassOf, SDO.Thing))
+        ext = os.path.join(self.rdf_dir, "ext.jsonld")
+        with open(ext, "w") as f:
+            f.write(graph.serialize(format="json-ld"))
+
+        self.reload()
+        self.assertIsNot(self.server.api, api)
+        self.assertEqual(self.server.api.generation, api.generation + 1)
+        self.assertEqual(self.kind(SDO.Animal), "class")
+        # the cached tree of the old graph is gone
+        self.assertIn("Animal", self.fetch("/schema/tree").body)
+
+        # nothing changed, nothing is swapped
+        api = self.server.api
+        self.reload()
+        self.assertIs(self.server.api, api)
+
+        os.remove(ext)
+        self.reload()
+        self.assertIsNone(self.kind(SDO.Animal))
+        self.assertEqual(self.kind(SDO.Person), "class")
+        self.assertEqual(self.server.api.generation, api.generation + 1)
+
+
+# starts an SdoServer listening on argv[1], there is no --port
+RUN_SERVER = """
+import sys
+from sdoserver import SdoServer
+
+server = SdoServer(sys.argv[2:])
+server.args.port = int(sys.argv[1])
+server.run()
+"""
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/task"), "needs /proc")
+class WorkersTestCase(unittest.TestCase):
+    """ --workers, in a process of its own as it forks """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        rdf_dir = os.path.join(self.work_dir, "rdf")
+        os.mkdir(rdf_dir)
+        with open(os.path.join(rdf_dir, "schema.jsonld"), "w") as f:
+            f.write(make_api().graph.serialize(format="json-ld"))
+
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+
+        self.image_file = os.path.join(self.work_dir, "graph.image")
+        args = ["--log-level", "warning", "run", rdf_dir, "--workers", "2"]
+        args += ["--image-file", self.image_file, "--snapshot-file", ""]
+        args += ["--index-dir", os.path.join(self.work_dir, "index")]
+        # in a session of its own, so that the workers go with it
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", RUN_SERVER, str(self.port)] + args,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            preexec_fn=os.setsid,
+        )
+
+    def tearDown(self):
+        os.killpg(self.process.pid, signal.SIGTERM)
+        self.process.wait()
+        shutil.rmtree(self.work_dir)
+
+    def wait_for(self, fn, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            self.assertIsNone(self.process.poll(), "the server exited")
+            try:
+                value = fn()
+            except (IOError, ValueError):
+                value = None
+            if value:
+                return value
+            time.sleep(0.2)
+        self.fail("gave up waiting on %s" % fn.__name__)
+
+    def get(self, path):
+        url = "http://127.0.0.1:%d%s" % (self.port, path)
+        return urllib2.urlopen(url, timeout=5).read()
+
+    def workers(self):
+        path = "/proc/%d/task/%d/children" % (self.process.pid, self.process.pid)
+        with open(path) as f:
+            pids = set(int(pid) for pid in f.read().split())
+        return pids if len(pids) == 2 else None
+
+    def test_workers(self):
+        def checks_done():
+            checks = json.loads(self.get("/schema/api/checks"))
+            return checks["state"] == "done" and checks
+
+        # whichever worker answers has the report of the one that ran them
+        checks = self.wait_for(checks_done)
+        self.assertTrue(all(c["passed"] for c in checks["checks"].itervalues()))
+        self.assertTrue(os.path.exists(self.image_file + ".checks.json"))
+
+        workers = self.wait_for(self.workers)
+        killed = sorted(workers)[0]
+        os.kill(killed, signal.SIGKILL)
+
+        def restarted():
+            pids = self.workers()
+            return pids and killed not in pids and pids
+
+        self.assertEqual(len(self.wait_for(restarted)), 2)
+        for _ in xrange(4):
+            self.assertIn("A Person.", self.get("/schema/schema.org/Person"))
+
+
+if __name__ == "__main__":
+    unittest.main()
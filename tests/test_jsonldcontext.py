@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+
+import rdflib
+from rdflib.namespace import RDF, RDFS
+from jsonldcontext import ContextCache, UnknownNamespace, Vocabulary, type_hint
+from tests.test_api import make_api, SDO
+from tests.test_export import run_now
+
+EXT = rdflib.Namespace("http://example.com/ext#")
+
+
+def make_ext_api():
+    """ make_api's schema, a Date property and an extension namespace
+    with a name clashing with schema.org's
+    """
+    api = make_api()
+    g = api.graph
+    g.add((SDO.Date, RDF.type, RDFS.Class))
+    g.add((SDO.birthDate, RDF.type, RDF.Property))
+    g.add((SDO.birthDate, api.RANGE_INCLUDES, SDO.Date))
+    for name in ["name", "badge"]:
+        g.add((EXT[name], RDF.type, RDF.Property))
+    g.add((EXT.badge, api.RANGE_INCLUDES, SDO.URL))
+    g.bind("ext", EXT)
+    api.reload_term_meta()
+    return api
+
+
+class TypeHintTestCase(unittest.TestCase):
+    def test_hints(self):
+        self.assertEqual(type_hint([SDO.URL]), "@id")
+        self.assertEqual(type_hint([SDO.URL, SDO.Person]), "@id")
+        self.assertEqual(type_hint([SDO.Date]), unicode(SDO.Date))
+        # ambiguous, the value decides
+        self.assertIsNone(type_hint([SDO.URL, SDO.Text]))
+        self.assertIsNone(type_hint([SDO.Date, SDO.DateTime]))
+        self.assertIsNone(type_hint([SDO.Person]))
+        self.assertIsNone(type_hint([]))
+
+
+class VocabularyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.vocabulary = Vocabulary(make_ext_api())
+
+    def test_full_context(self):
+        context = self.vocabulary.context()["@context"]
+        self.assertEqual(context["@vocab"], SDO)
+        self.assertEqual(context["schema"], SDO)
+        self.assertEqual(context["ext"], unicode(EXT))
+        self.assertEqual(context["url"], {"@id": "schema:url", "@type": "@id"})
+        self.assertEqual(
+            context["birthDate"], {"@id": "schema:birthDate", "@type": "schema:Date"}
+        )
+        # schema.org keeps the bare name, the ext term is told apart
+        self.assertEqual(context["ext:name"], "ext:name")
+        self.assertEqual(context["badge"], {"@id": "ext:badge", "@type": "@id"})
+        # nothing but the terms @vocab can't expand by their name
+        self.assertEqual(
+            sorted(k for k in context if k not in self.vocabulary.prefixes),
+            ["@vocab", "badge", "birthDate", "ext:name", "url"],
+        )
+
+    def test_slices(self):
+        ext = self.vocabulary.context(self.vocabulary.namespace("ext"))["@context"]
+        self.assertNotIn("@vocab", ext)
+        self.assertNotIn("Person", ext)
+        # the same prefixes, only the namespace's terms
+        self.assertEqual(
+            sorted(k for k in ext if k not in self.vocabulary.prefixes),
+            ["badge", "ext:name"],
+        )
+        self.assertEqual(self.vocabulary.namespace(unicode(EXT)), unicode(EXT))
+        with self.assertRaises(UnknownNamespace):
+            self.vocabulary.namespace("nope")
+
+    def test_expands(self):
+        context = self.vocabulary.context()
+        doc = dict(
+            context,
+            **{
+                "@type": "Person",
+                "name": "Ann",
+                "ext:name": "A.",
+                "worksFor": {"@type": "Corporation", "tickerSymbol": "ACME"},
+                "url": "http://example.com/ann",
+                "birthDate": "1970-01-01",
+                "badge": "http://example.com/badge",
+            }
+        )
+        graph = rdflib.Graph().parse(data=json.dumps(doc), format="json-ld")
+        person = graph.value(predicate=RDF.type, object=SDO.Person)
+        self.assertEqual(graph.value(person, SDO.name), rdflib.Literal("Ann"))
+        self.assertEqual(graph.value(person, EXT.name), rdflib.Literal("A."))
+        employer = graph.value(person, SDO.worksFor)
+        self.assertEqual(graph.value(employer, RDF.type), SDO.Corporation)
+        self.assertEqual(
+            graph.value(employer, SDO.tickerSymbol), rdflib.Literal("ACME")
+        )
+        self.assertEqual(
+            graph.value(person, SDO.url), rdflib.URIRef("http://example.com/ann")
+        )
+        self.assertEqual(graph.value(person, SDO.birthDate).datatype, SDO.Date)
+        self.assertEqual(
+            graph.value(person, EXT.badge), rdflib.URIRef("http://example.com/badge")
+        )
+
+
+class ContextCacheTestCase(unittest.TestCase):
+    def test_cached_per_generation(self):
+        api = make_ext_api()
+        cache = ContextCache()
+        full = cache.get(api, None, run_now).result()
+        self.assertIs(cache.get(api, None, run_now).result(), full)
+        self.assertEqual(full.content_type, "application/ld+json")
+        self.assertIn("gzip", full.bodies)
+
+        ext = cache.get(api, "ext", run_now).result()
+        self.assertLess(len(ext.bodies[None][0]), len(full.bodies[None][0]))
+        with self.assertRaises(UnknownNamespace):
+            cache.get(api, "nope", run_now).result()
+
+        api.generation += 1
+        self.assertIsNot(cache.get(api, None, run_now).result(), full)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import unittest
+import threading
+import latency
+from latency import Histogram, LatencyStats, STATS, Trace
+from tests.test_api import make_api, SDO
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_percentiles(self):
+        h = Histogram()
+        for ms in [0.05] * 90 + [3] * 9 + [20000]:
+            h.add(ms)
+
+        self.assertEqual(h.count, 100)
+        self.assertEqual(h.max, 20000)
+        self.assertEqual(h.percentile(50), 0.1)
+        self.assertEqual(h.percentile(99), 5)
+        self.assertEqual(h.percentile(100), 20000)
+        self.assertEqual(h.to_json()["buckets"], {"le_0.1": 90, "le_5": 9, "le_inf": 1})
+
+
+class LatencyStatsTestCase(unittest.TestCase):
+    def test_names_are_bounded(self):
+        stats = LatencyStats()
+        for n in xrange(latency.MAX_NAMES + 10):
+            stats.record("requests", "/schema/%d" % n, 1)
+
+        requests = stats.to_json()["requests"]
+        self.assertEqual(len(requests), latency.MAX_NAMES + 1)
+        self.assertEqual(requests[latency.OVERFLOW]["count"], 10)
+
+    def test_trace_breakdown(self):
+        stats = LatencyStats()
+
+        class Api(object):
+            @stats.time_method
+            def outer(self):
+                return self.inner() + 1
+
+            @stats.time_method
+            def inner(self):
+                stats.time_query("q", 2.0)
+                return 1
+
+        trace = Trace()
+        stats.resume_trace(trace)
+        self.assertEqual(Api().outer(), 2)
+        stats.end_trace(trace)
+        Api().outer()
+        # a query timed for a trace that isn't this thread's
+        stats.time_query("q", 3.0, trace)
+
+        # nested api calls only count once in the breakdown
+        self.assertEqual(sorted(trace.timings), ["outer", "query:q"])
+        self.assertEqual(trace.timings["query:q"], [2, 5.0])
+        self.assertEqual(stats.to_json()["methods"]["inner"]["count"], 2)
+        self.assertIsNone(stats.current_trace())
+
+    def test_trace_across_threads(self):
+        stats = LatencyStats()
+        trace = Trace()
+
+        class Api(object):
+            @stats.time_method
+            def outer(self):
+                for _ in xrange(100):
+                    self.inner()
+
+            @stats.time_method
+            def inner(self):
+                pass
+
+        def run():
+            stats.resume_trace(trace)
+            for _ in xrange(10):
+                Api().outer()
+
+        threads = [threading.Thread(target=run) for _ in xrange(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # each thread's nesting is its own
+        self.assertEqual(sorted(trace.timings), ["outer"])
+        self.assertEqual(trace.timings["outer"][0], 80)
+
+
+class RDFApiTimingTestCase(unittest.TestCase):
+    def test_api_is_timed(self):
+        STATS.reset()
+        api = make_api()
+        api.get_label(SDO.Person)
+        api.get_ancestors(SDO.Person)
+
+        stats = STATS.to_json()
+        self.assertEqual(stats["queries"]["get_classes"]["count"], 1)
+        self.assertEqual(stats["methods"]["reload_term_meta"]["count"], 1)
+        self.assertEqual(stats["methods"]["get_ancestors"]["count"], 1)
+        # the per term lookups of templates are left alone
+        self.assertNotIn("get_label", stats["methods"])
+        # queried rows can still be read after being timed
+        self.assertEqual(len(list(api.execute_prepared_query("get_classes"))), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
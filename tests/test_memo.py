@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import unittest
+import rdflib
+from rdflib.namespace import RDFS
+from memo import MemoCache
+from tests.test_api import make_api, SDO
+
+
+class MemoCacheTestCase(unittest.TestCase):
+    def test_generation(self):
+        memo = MemoCache(10)
+        self.assertEqual(memo.get(1, "a"), (False, None))
+        memo.put(1, "a", 1)
+        self.assertEqual(memo.get(1, "a"), (True, 1))
+
+        # another generation drops everything
+        self.assertEqual(memo.get(2, "a"), (False, None))
+        # a put computed for an older generation is ignored
+        memo.put(1, "a", 1)
+        self.assertEqual(memo.get(2, "a"), (False, None))
+        self.assertEqual((memo.hits, memo.misses), (1, 3))
+
+    def test_bounded(self):
+        memo = MemoCache(2)
+        memo.get(1, None)
+        for key in "abc":
+            memo.put(1, key, key)
+
+        self.assertEqual(memo.entries, {"c": "c"})
+        self.assertEqual(memo.evictions, 1)
+
+    def test_unhashable(self):
+        memo = MemoCache(2)
+        memo.get(1, None)
+        memo.put(1, ("x", [1]), 1)
+        self.assertEqual(memo.get(1, ("x", [1])), (False, None))
+
+
+class RDFApiMemoTestCase(unittest.TestCase):
+    def test_lookups_follow_reloads(self):
+        api = make_api()
+        ancestors = [SDO.Person, SDO.Thing]
+        self.assertEqual(api.get_ancestors_beta(SDO.Person), ancestors)
+        # a list of its own for every caller
+        api.get_ancestors_beta(SDO.Person).append(SDO.Text)
+        self.assertEqual(api.get_ancestors_beta(SDO.Person), ancestors)
+        self.assertEqual(api.memo.hits, 2)
+
+        api.graph.set((SDO.Person, RDFS.label, rdflib.Literal("Human")))
+        api.reload_term_meta()
+        self.assertEqual(api.get_label(SDO.Person), "Human")
+        self.assertEqual(
+            dict(api.get_predicate_object_for_subject(SDO.Person))[RDFS.label],
+            rdflib.Literal("Human"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
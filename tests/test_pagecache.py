@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import gzip
+import unittest
+from StringIO import StringIO
+from pagecache import PageCache, accepts_encoding
+
+
+class PageCacheTestCase(unittest.TestCase):
+    def test_hit_and_miss(self):
+        cache = PageCache(1024)
+        self.assertIsNone(cache.get(("/schema/full", 1)))
+
+        page = cache.put(("/schema/full", 1), u"<html></html>")
+        self.assertEqual(page.body, "<html></html>")
+        self.assertEqual(cache.get(("/schema/full", 1)), page)
+        self.assertIsNone(cache.get(("/schema/full", 2)))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_etag_is_stable(self):
+        a = PageCache(1024).put("x", "body")
+        b = PageCache(1024).put("y", "body")
+        self.assertEqual(a.etag, b.etag)
+        self.assertTrue(a.etag.startswith('"') and a.etag.endswith('"'))
+
+    def test_lru_eviction(self):
+        cache = PageCache(10)
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        cache.get("a")
+        cache.put("c", "cccc")
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.nbytes, 8)
+
+    def test_too_large_is_not_cached(self):
+        cache = PageCache(2)
+        page = cache.put("a", "aaaa")
+        self.assertEqual(page.body, "aaaa")
+        self.assertIsNone(cache.get("a"))
+
+    def test_gzipped(self):
+        cache = PageCache(1024, compress=True)
+        page = cache.put("a", "a" * 100)
+        body = gzip.GzipFile(fileobj=StringIO(page.gzipped)).read()
+        self.assertEqual(body, page.body)
+        self.assertEqual(cache.put("b", "a" * 100).gzipped, page.gzipped)
+        self.assertIsNone(cache.put("c", "a" * 100, compress=False).gzipped)
+
+    def test_accepts_encoding(self):
+        self.assertTrue(accepts_encoding("gzip, deflate", "gzip"))
+        self.assertTrue(accepts_encoding("deflate, GZIP;q=0.5", "gzip"))
+        self.assertTrue(accepts_encoding("*", "gzip"))
+        self.assertFalse(accepts_encoding("gzip;q=0", "gzip"))
+        self.assertFalse(accepts_encoding("gzip ; q=0.0, *", "gzip"))
+        self.assertFalse(accepts_encoding("x-gzip2, identity", "gzip"))
+        self.assertFalse(accepts_encoding("", "gzip"))
+
+
+if __name__ == "__main__":
+    unittest.main()
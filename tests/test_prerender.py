@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import rdflib
+from rdflib.namespace import RDFS
+from prerender import Prerenderer
+from sdoserver import FullSchemaHandler
+from tests.test_api import make_api, log, SDO
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+
+class StaticServer(object):
+    """ what the templates and Prerenderer need of SdoServer """
+
+    NAME = "SDOServer"
+
+    def __init__(self, api):
+        self.api = api
+        self.nav_tabs = []
+
+    def prepare_template_loader(self, loader):
+        loader.add_dir(TEMPLATE_DIR)
+        return loader
+
+    def define_template_namespace(self):
+        return dict(server=self, api=self.api, static_site=False)
+
+
+class PrerenderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.api = make_api()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def prerender(self):
+        prerenderer = Prerenderer(
+            StaticServer(self.api),
+            self.api,
+            self.out_dir,
+            (FullSchemaHandler.TEMPLATE, FullSchemaHandler.SECTIONS),
+            log,
+        )
+        return prerenderer.run()
+
+    def read(self, relpath):
+        with open(os.path.join(self.out_dir, relpath)) as f:
+            return f.read()
+
+    def test_pages(self):
+        rendered, unchanged, removed = self.prerender()
+        self.assertEqual(unchanged, [])
+        for relpath in [
+            "schema/schema.org/Person/index.html",
+            "schema/schema.org/worksFor/index.html",
+            "schema/children/schema.org/Thing.html",
+            "schema/tree/index.html",
+            "schema/full/index.html",
+            "schema/search/index.json",
+        ]:
+            self.assertIn(relpath, rendered)
+
+        page = self.read("schema/schema.org/Person/index.html")
+        self.assertIn("A Person.", page)
+        gzipped = gzip.open(
+            os.path.join(self.out_dir, "schema/schema.org/Person/index.html.gz")
+        )
+        self.assertEqual(gzipped.read(), page)
+        self.assertIn("/schema/children/", self.read("schema/tree/index.html"))
+
+    def test_incremental(self):
+        self.prerender()
+        rendered, _, _ = self.prerender()
+        self.assertEqual(rendered, [])
+
+        g = self.api.graph
+        g.set((SDO.tickerSymbol, RDFS.comment, rdflib.Literal("The ticker.")))
+        self.api.reload_term_meta()
+
+        rendered, _, removed = self.prerender()
+        self.assertIn("schema/schema.org/tickerSymbol/index.html", rendered)
+        # Corporation lists tickerSymbol, Person doesn't
+        self.assertIn("schema/schema.org/Corporation/index.html", rendered)
+        self.assertNotIn("schema/schema.org/Person/index.html", rendered)
+        self.assertEqual(removed, [])
+
+        g.remove((SDO.url, None, None))
+        self.api.reload_term_meta()
+        rendered, _, removed = self.prerender()
+        # every class inherits url from Thing
+        self.assertIn("schema/schema.org/Person/index.html", rendered)
+        self.assertEqual(removed, ["schema/schema.org/url/index.html"])
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, removed[0] + ".gz")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import unittest
+
+import rdflib
+from rdflib.namespace import RDF, RDFS
+from schemadiff import SchemaDiff, Version, graph_lines, merge, sorted_lines
+from tests.test_api import make_api, SDO
+
+
+def changes(diff):
+    return {t.name: (t.status, t.kind, sorted(t.sections)) for t in diff.terms}
+
+
+class SortedLinesTestCase(unittest.TestCase):
+    def test_spilled_chunks_merge(self):
+        lines = ["%03d" % (n * 7 % 50) for n in xrange(100)]
+        self.assertEqual(list(sorted_lines(lines, spill_lines=8)), sorted(set(lines)))
+
+    def test_merge(self):
+        self.assertEqual(
+            list(merge(["a", "c", "d"], ["b", "c"])),
+            [("-", "a"), ("+", "b"), ("=", "c"), ("-", "d")],
+        )
+
+
+class SchemaDiffTestCase(unittest.TestCase):
+    def setUp(self):
+        self.old = make_api()
+        self.new = make_api()
+
+    def diff(self):
+        old = sorted_lines(graph_lines(self.old.graph))
+        new = sorted_lines(graph_lines(self.new.graph))
+        return SchemaDiff(old, new)
+
+    def test_unchanged(self):
+        diff = self.diff()
+        self.assertEqual(diff.terms, [])
+        self.assertEqual(diff.triples["="], len(self.old.graph))
+
+    def test_changes_per_term(self):
+        g = self.new.graph
+        # a new class under Organization, Person moved under it
+        g.add((SDO.School, RDF.type, RDFS.Class))
+        g.add((SDO.School, RDFS.subClassOf, SDO.Organization))
+        g.remove((SDO.Person, RDFS.subClassOf, SDO.Thing))
+        g.add((SDO.Person, RDFS.subClassOf, SDO.School))
+        # tickerSymbol gone, employee takes Corporations only
+        g.remove((SDO.tickerSymbol, None, None))
+        g.remove((SDO.employee, None, SDO.Person))
+        g.add((SDO.employee, self.new.RANGE_INCLUDES, SDO.Corporation))
+        g.set((SDO.name, RDFS.comment, rdflib.Literal("The name.\nNew.")))
+        # blank nodes are left out
+        g.add((SDO.url, RDFS.seeAlso, rdflib.BNode()))
+
+        diff = self.diff()
+        self.assertEqual(
+            changes(diff),
+            {
+                "School": ("added", "class", ["parents", "types"]),
+                "Person": ("changed", "class", ["parents"]),
+                "tickerSymbol": (
+                    "removed",
+                    "property",
+                    ["domains", "other", "ranges", "types"],
+                ),
+                "employee": ("changed", "property", ["ranges"]),
+                "name": ("changed", "property", ["other"]),
+            },
+        )
+
+        person = [t for t in diff.terms if t.name == "Person"][0]
+        self.assertEqual(
+            person.sections["parents"], {"added": ["School"], "removed": ["Thing"]}
+        )
+        summary = diff.summary()
+        self.assertEqual(summary["added_classes"], 1)
+        self.assertEqual(summary["removed_properties"], 1)
+        self.assertEqual(summary["moved"], 1)
+        self.assertEqual(summary["ranges"], 1)
+        self.assertIn("+ parents School", diff.to_text())
+
+    def test_frozen_graph_and_version_file(self):
+        self.new.graph.remove((SDO.URL, RDFS.subClassOf, SDO.Text))
+        self.new.freeze()
+
+        old = Version(graph_lines(self.old.graph))
+        try:
+            self.assertEqual(old.count, len(self.old.graph))
+            diff = SchemaDiff(old.lines(), sorted_lines(graph_lines(self.new.graph)))
+        finally:
+            old.close()
+        self.assertEqual(changes(diff), {"URL": ("changed", "class", ["parents"])})
+
+
+if __name__ == "__main__":
+    unittest.main()
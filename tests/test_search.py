@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+import rdflib
+from rdflib.namespace import RDFS
+from search import RDFSearch
+from tests.test_api import make_api, SDO
+
+
+class RDFSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.graph = make_api().graph
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def test_one_document_per_subject(self):
+        searcher = RDFSearch(self.index_dir, self.graph)
+        self.assertEqual(searcher.search("person").count(u"%s" % SDO.Person), 1)
+        self.assertEqual(searcher.index.doc_count(), 11)
+
+    def test_reindex_is_incremental(self):
+        RDFSearch(self.index_dir, self.graph).close()
+
+        self.graph.remove((SDO.url, None, None))
+        self.graph.set((SDO.Person, RDFS.comment, rdflib.Literal("A human.")))
+        searcher = RDFSearch(self.index_dir, self.graph)
+
+        self.assertEqual(searcher.index.doc_count(), 10)
+        self.assertEqual(searcher.search("human"), [u"%s" % SDO.Person])
+        self.assertEqual(searcher.search("url"), [u"%s" % SDO.URL])
+
+        # nothing changed, nothing rewritten
+        generation = searcher.index.latest_generation()
+        RDFSearch(self.index_dir, self.graph).close()
+        self.assertEqual(searcher.index.latest_generation(), generation)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import rdflib
+import snapshot
+from sdoserver import RDFApi
+from tests.test_api import make_api, log, SDO
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.rdf_file = os.path.join(self.tmpdir, "schema.rdfa")
+        with open(self.rdf_file, "w") as f:
+            f.write("<html></html>")
+
+        self.path = os.path.join(self.tmpdir, "snapshot", "graph.snapshot")
+        self.api = make_api()
+        self.api.graph.add((SDO.Thing, SDO.note, rdflib.Literal("chose", lang="fr")))
+        self.api.graph.add((SDO.Thing, SDO.version, rdflib.Literal(3)))
+        self.api.graph.add((SDO.Thing, SDO.node, rdflib.BNode("b0")))
+        self.api.save_snapshot(self.path, snapshot.fingerprints([self.rdf_file]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        api = RDFApi(log)
+        fingerprints = snapshot.fingerprints([self.rdf_file])
+        self.assertTrue(api.load_snapshot(self.path, fingerprints))
+
+        self.assertEqual(set(api.graph), set(self.api.graph))
+        for name in RDFApi.TERM_META_TABLES:
+            self.assertEqual(getattr(api, name), getattr(self.api, name), name)
+
+        self.assertEqual(api.files, set([self.rdf_file]))
+        self.assertEqual(api.generation, 1)
+        self.assertEqual(
+            api.get_ancestors(SDO.Corporation),
+            [SDO.Corporation, SDO.Organization, SDO.Thing],
+        )
+
+    def test_changed_file_is_not_loaded(self):
+        with open(self.rdf_file, "a") as f:
+            f.write("<!-- edited -->")
+
+        api = RDFApi(log)
+        fingerprints = snapshot.fingerprints([self.rdf_file])
+        self.assertFalse(api.load_snapshot(self.path, fingerprints))
+        self.assertEqual(len(api.graph), 0)
+
+    def test_missing_snapshot(self):
+        api = RDFApi(log)
+        self.assertFalse(api.load_snapshot(self.path + ".missing", []))
+
+
+class PackGraphTestCase(unittest.TestCase):
+    def test_roundtrip(self):
+        api = make_api()
+        api.graph.add((SDO.Thing, SDO.note, rdflib.Literal("chose", lang="fr")))
+
+        graph = RDFApi.new_graph()
+        self.assertEqual(
+            snapshot.unpack_graph(snapshot.pack_graph(api.graph), graph), len(api.graph)
+        )
+        self.assertEqual(set(graph), set(api.graph))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+import os
+import csv
+import json
+import time
+import logging
+import unittest
+import threading
+from StringIO import StringIO
+
+import rdflib
+import tornado.gen
+import tornado.ioloop
+from executor import Saturated
+from sparql import (
+    PlanCache,
+    QueryError,
+    QueryProcess,
+    QueryTimeout,
+    SparqlRunner,
+    fork,
+    serialize,
+)
+from tests.test_api import make_api
+
+CLASSES = """
+SELECT ?class ?label WHERE {
+    ?class a rdfs:Class ; rdfs:label ?label .
+} ORDER BY ?class
+"""
+
+# never finishes on a graph of any size
+RUNAWAY = """
+SELECT * WHERE { ?a ?b ?c . ?d ?e ?f . ?g ?h ?i . ?j ?k ?l . FILTER (?a = 1) }
+"""
+
+
+def results(graph, text, fmt="json", max_rows=100):
+    plan = PlanCache.prepare(text)
+    return "".join(serialize(graph, plan, fmt, max_rows))
+
+
+class PlanCacheTestCase(unittest.TestCase):
+    def test_accepted(self):
+        cache = PlanCache(2)
+        plan = cache.get(CLASSES)
+        self.assertEqual(plan.kind, "SELECT")
+        self.assertIs(cache.get(CLASSES), plan)
+        self.assertEqual(cache.get("ASK { ?s ?p ?o }").kind, "ASK")
+        self.assertEqual(
+            cache.get("CONSTRUCT { ?s a ?o } WHERE { ?s a ?o }").kind, "CONSTRUCT"
+        )
+        # the least recently used plan went
+        self.assertEqual(cache.to_json(), dict(entries=2, hits=1, misses=3))
+        self.assertIsNot(cache.get(CLASSES), plan)
+
+    def test_rejected(self):
+        cache = PlanCache(2)
+        for text in [
+            "INSERT DATA { <a:b> <a:c> <a:d> }",
+            "DESCRIBE <http://schema.org/Thing>",
+            "SELECT * FROM <http://example.com/g> WHERE { ?s ?p ?o }",
+            "SELECT ?g WHERE { { ?s a ?o } UNION { GRAPH ?g { ?s ?p ?o } } }",
+            "ASK { FILTER EXISTS { GRAPH <file:///etc> { ?s ?p ?o } } }",
+            "SELECT nonsense",
+        ]:
+            with self.assertRaises(QueryError):
+                cache.get(text)
+        self.assertEqual(cache.to_json()["entries"], 0)
+
+    def test_negotiate(self):
+        plan = PlanCache.prepare(CLASSES)
+        self.assertEqual(plan.negotiate(), "json")
+        self.assertEqual(plan.negotiate(accept="text/csv, */*"), "csv")
+        self.assertEqual(plan.negotiate("csv", "application/json"), "csv")
+        self.assertIsNone(plan.negotiate("nt"))
+
+
+class SerializeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.graph = make_api().graph
+
+    def test_select_json(self):
+        doc = json.loads(results(self.graph, CLASSES))
+        self.assertEqual(doc["head"]["vars"], ["class", "label"])
+        bindings = doc["results"]["bindings"]
+        self.assertEqual(len(bindings), 6)
+        self.assertEqual(
+            bindings[0],
+            {
+                "class": {"type": "uri", "value": "http://schema.org/Corporation"},
+                "label": {"type": "literal", "value": "Corporation"},
+            },
+        )
+        self.assertNotIn("truncated", doc)
+
+        doc = json.loads(results(self.graph, CLASSES, max_rows=2))
+        self.assertEqual(len(doc["results"]["bindings"]), 2)
+        self.assertTrue(doc["truncated"])
+
+    def test_select_csv(self):
+        rows = list(csv.reader(StringIO(results(self.graph, CLASSES, "csv", 3))))
+        self.assertEqual(
+            rows,
+            [
+                ["class", "label"],
+                ["http://schema.org/Corporation", "Corporation"],
+                ["http://schema.org/Organization", "Organization"],
+                ["http://schema.org/Person", "Person"],
+            ],
+        )
+
+    def test_ask_and_construct(self):
+        ask = "ASK { schema:Person rdfs:subClassOf schema:Thing }"
+        self.assertEqual(json.loads(results(self.graph, ask))["boolean"], True)
+
+        construct = (
+            "CONSTRUCT { ?c rdfs:subClassOf ?p } WHERE { ?c rdfs:subClassOf ?p }"
+        )
+        graph = rdflib.Graph().parse(
+            data=results(self.graph, construct, "nt"), format="nt"
+        )
+        self.assertEqual(
+            set(graph), set(self.graph.triples((None, rdflib.RDFS.subClassOf, None)))
+        )
+
+
+class QueryProcessTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api()
+        self.api.freeze()
+        self.ioloop = tornado.ioloop.IOLoop()
+        self.ioloop.make_current()
+
+    def tearDown(self):
+        self.ioloop.close()
+
+    def run_process(self, text, timeout=10, max_rows=100):
+        plan = PlanCache.prepare(text)
+        process = QueryProcess(self.api.graph, plan, "json", max_rows, timeout, 1 << 30)
+
+        @tornado.gen.coroutine
+        def read_all():
+            chunks = []
+            try:
+                while True:
+                    chunk = yield process.read()
+                    if chunk is None:
+                        break
+                    chunks.append(chunk)
+            finally:
+                process.close()
+            raise tornado.gen.Return("".join(chunks))
+
+        return self.ioloop.run_sync(read_all)
+
+    def test_results(self):
+        doc = json.loads(self.run_process(CLASSES))
+        self.assertEqual(len(doc["results"]["bindings"]), 6)
+
+    def test_timeout(self):
+        with self.assertRaises(QueryTimeout):
+            self.run_process(RUNAWAY, timeout=0.3)
+
+    def test_fork_holds_logging_locks(self):
+        handler = logging.StreamHandler()
+        logging.getLogger().addHandler(handler)
+        self.addCleanup(logging.getLogger().removeHandler, handler)
+
+        # a thread logging while the query forks
+        holding = threading.Event()
+
+        def log():
+            with handler.lock:
+                holding.set()
+                time.sleep(0.2)
+
+        thread = threading.Thread(target=log)
+        thread.start()
+        holding.wait()
+        pid = fork()
+        if pid == 0:
+            handler.acquire()
+            os._exit(0)
+
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                break
+            time.sleep(0.05)
+        else:
+            os.kill(pid, 9)
+            os.waitpid(pid, 0)
+            self.fail("the child found the handler lock taken")
+        self.assertEqual(status, 0)
+        thread.join()
+
+    def test_runner_limits_processes(self):
+        runner = SparqlRunner(1, 100, 10, 1 << 30, PlanCache(10))
+        plan = runner.plans.get(CLASSES)
+        process = runner.start(self.api.graph, plan, "json")
+        with self.assertRaises(Saturated):
+            runner.start(self.api.graph, plan, "json")
+        runner.done(process)
+        self.assertEqual(runner.to_json()["running"], 0)
+        self.assertEqual(runner.to_json()["rejected"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+from sdoserver import RDFApi
+from benchmarks.synthetic import SyntheticSchema, generate
+from tests.test_api import log
+
+
+class SyntheticSchemaTestCase(unittest.TestCase):
+    def test_shape(self):
+        schema = SyntheticSchema(classes=100, depth=3, fanout=4, properties=2)
+        self.assertEqual(len(schema.classes), 100)
+        self.assertEqual(len(schema.properties), 200)
+        self.assertEqual(max(d for _, _, d in schema.classes), 3)
+
+    def test_formats_agree(self):
+        out_dir = tempfile.mkdtemp()
+        try:
+            generate(out_dir, classes=30, depth=3, fanout=3, properties=2)
+            apis = []
+            for fname in ("rdfa/schema.rdfa", "jsonld/schema.jsonld"):
+                api = RDFApi(log)
+                api.add_file(os.path.join(out_dir, fname))
+                api.reload_term_meta()
+                apis.append(api)
+        finally:
+            shutil.rmtree(out_dir)
+
+        rdfa, jsonld = apis
+        self.assertEqual(len(rdfa.classes), 30)
+        self.assertEqual(len(rdfa.properties), 60)
+        self.assertEqual(rdfa.term_to_ancestors, jsonld.term_to_ancestors)
+        self.assertEqual(rdfa.property_to_domains, jsonld.property_to_domains)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import rdflib
+import snapshot
+from rdflib.namespace import RDF, RDFS
+from sdoserver import RDFApi
+from termstore import TermStore, FrozenTable, ReadOnlyError
+from tests.test_api import make_api, log, SDO
+
+
+def make_graph():
+    """ two files, one triple in both """
+    graph = RDFApi.new_graph()
+    a = graph.get_context(rdflib.URIRef("file:///a.rdfa"))
+    b = graph.get_context(rdflib.URIRef("file:///b.rdfa"))
+    a.add((SDO.Thing, RDF.type, RDFS.Class))
+    a.add((SDO.Thing, RDFS.label, rdflib.Literal("Thing")))
+    a.add((SDO.Person, RDFS.subClassOf, SDO.Thing))
+    b.add((SDO.Person, RDFS.subClassOf, SDO.Thing))
+    b.add((SDO.Person, RDF.type, RDFS.Class))
+    b.add((SDO.name, SDO.domainIncludes, SDO.Person))
+    b.add((SDO.Thing, SDO.note, rdflib.Literal("chose", lang="fr")))
+    return graph
+
+
+class TermStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.graph = make_graph()
+        self.store = TermStore.from_graph(self.graph)
+        self.frozen = rdflib.ConjunctiveGraph(store=self.store)
+
+    def test_patterns(self):
+        self.assertEqual(len(self.frozen), len(self.graph))
+        terms = set()
+        for triple in self.graph:
+            terms.update(triple)
+        terms.add(None)
+        terms.add(SDO.Missing)
+
+        for s in terms:
+            for p in terms:
+                for o in terms:
+                    pattern = (s, p, o)
+                    self.assertEqual(
+                        set(self.frozen.triples(pattern)),
+                        set(self.graph.triples(pattern)),
+                        pattern,
+                    )
+
+    def test_contexts(self):
+        expected = sorted(c.identifier for c in self.graph.contexts())
+        self.assertEqual(sorted(c.identifier for c in self.frozen.contexts()), expected)
+
+        for identifier in expected:
+            self.assertEqual(
+                set(self.frozen.get_context(identifier)),
+                set(self.graph.get_context(identifier)),
+            )
+            self.assertEqual(
+                len(self.frozen.get_context(identifier)),
+                len(self.graph.get_context(identifier)),
+            )
+
+        both = (SDO.Person, RDFS.subClassOf, SDO.Thing)
+        self.assertEqual(
+            sorted(c.identifier for c in self.frozen.contexts(both)), expected
+        )
+
+    def test_read_only(self):
+        with self.assertRaises(ReadOnlyError):
+            self.frozen.add((SDO.Thing, RDFS.label, rdflib.Literal("Chose")))
+        with self.assertRaises(ReadOnlyError):
+            self.frozen.remove((SDO.Thing, None, None))
+
+
+class FreezeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.expected = make_api()
+        self.api = make_api()
+        self.api.freeze()
+
+    def test_tables(self):
+        for name, kind in RDFApi.TERM_META_TABLES.iteritems():
+            table = getattr(self.api, name)
+            self.assertIsInstance(table, FrozenTable)
+            expected = getattr(self.expected, name)
+            if kind == snapshot.SET:
+                self.assertEqual(set(table), expected, name)
+            else:
+                self.assertEqual(dict(table.iteritems()), expected, name)
+            self.assertEqual(len(table), len(expected), name)
+            self.assertNotIn(SDO.Missing, table)
+            self.assertIsNone(table.get(SDO.Missing))
+
+        self.assertEqual(
+            self.api.classes | self.api.properties,
+            self.expected.classes | self.expected.properties,
+        )
+
+    def test_lookups(self):
+        self.assertEqual(set(self.api.graph), set(self.expected.graph))
+        for term in [SDO.Corporation, SDO.url, SDO.Person]:
+            self.assertEqual(self.api.get_label(term), self.expected.get_label(term))
+            self.assertEqual(self.api.get_desc(term), self.expected.get_desc(term))
+            self.assertEqual(
+                self.api.get_ancestors(term), self.expected.get_ancestors(term)
+            )
+            self.assertEqual(
+                self.api.get_predicate_object_for_subject(term),
+                self.expected.get_predicate_object_for_subject(term),
+            )
+
+    def test_queries(self):
+        # sparql runs against the frozen store as well
+        self.assertEqual(
+            set(r[0] for r in self.api.execute_prepared_query("get_classes")),
+            self.expected.classes,
+        )
+
+    def test_frozen_snapshot(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "graph.snapshot")
+            self.expected.save_snapshot(path, [])
+            api = RDFApi(log)
+            self.assertTrue(api.load_snapshot(path, [], freeze=True))
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertIsInstance(api.term_to_label, FrozenTable)
+        self.assertEqual(set(api.graph), set(self.expected.graph))
+        self.assertEqual(
+            api.get_ancestors(SDO.Corporation),
+            [SDO.Corporation, SDO.Organization, SDO.Thing],
+        )
+
+
+class ImageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "images", "graph.image")
+
+        self.expected = make_api()
+        self.expected.term_to_label[SDO.Person] = u"Personne \xe9"
+        self.api = make_api()
+        self.api.term_to_label[SDO.Person] = u"Personne \xe9"
+        self.api.freeze()
+        self.api.save_image(self.path)
+        self.api.map_image(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_mapped(self):
+        self.assertIsNotNone(self.api.graph.store.image)
+        self.assertEqual(set(self.api.graph), set(self.expected.graph))
+        for name, kind in RDFApi.TERM_META_TABLES.iteritems():
+            table, expected = getattr(self.api, name), getattr(self.expected, name)
+            if kind == snapshot.SET:
+                self.assertEqual(set(table), expected, name)
+            else:
+                self.assertEqual(dict(table.iteritems()), expected, name)
+
+        self.assertEqual(self.api.get_label(SDO.Person), u"Personne \xe9")
+        self.assertEqual(
+            self.api.get_ancestors(SDO.Corporation),
+            [SDO.Corporation, SDO.Organization, SDO.Thing],
+        )
+        self.assertEqual(
+            set(r[0] for r in self.api.execute_prepared_query("get_properties")),
+            self.expected.properties,
+        )
+
+    def test_not_an_image(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            TermStore.map(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
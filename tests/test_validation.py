@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+import os
+import json
+import unittest
+from validation import Constraints, ValidationPool, ValidationTimeout, batches
+from tests.test_api import make_api
+
+
+def errors_of(constraints, doc):
+    return sorted((e["path"], e["error"]) for e in constraints.validate(doc))
+
+
+class DyingConstraints(Constraints):
+    """ kills the worker validating a line "die", the way a crash would """
+
+    def validate_lines(self, first, lines):
+        if "die" in lines:
+            os._exit(1)
+        return super(DyingConstraints, self).validate_lines(first, lines)
+
+
+class ConstraintsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.constraints = Constraints(make_api())
+
+    def test_effective_tables(self):
+        c = self.constraints
+        # inherited from Thing and Organization
+        self.assertEqual(
+            c.domain["Corporation"],
+            frozenset(["name", "url", "employee", "tickerSymbol"]),
+        )
+        self.assertEqual(c.domain["Person"], frozenset(["name", "url", "worksFor"]))
+        # subclasses of the range fit too
+        self.assertEqual(
+            c.range["worksFor"], frozenset(["Organization", "Corporation"])
+        )
+        self.assertEqual(c.range["name"], frozenset(["Text", "URL"]))
+        self.assertEqual(c.literals["url"], frozenset([unicode]))
+
+    def test_valid(self):
+        doc = {
+            "@context": "http://schema.org",
+            "@type": "Person",
+            "name": "Ann",
+            "schema:url": "http://example.com/ann",
+            "worksFor": [
+                {"@type": "Corporation", "tickerSymbol": "ACME"},
+                {"@id": "http://example.com/acme"},
+                "http://example.com/other",
+            ],
+        }
+        self.assertEqual(errors_of(self.constraints, doc), [])
+        graph = {"@graph": [doc, {"@type": "http://schema.org/Organization"}]}
+        self.assertEqual(errors_of(self.constraints, graph), [])
+
+    def test_errors(self):
+        doc = {
+            "@type": "Person",
+            "tickerSymbol": "X",
+            "nickname": "Annie",
+            "name": 5,
+            "worksFor": [{"@type": "Person"}, {"@type": "Robot"}],
+        }
+        self.assertEqual(
+            errors_of(self.constraints, doc),
+            [
+                ("/name", "range"),
+                ("/nickname", "property"),
+                ("/tickerSymbol", "domain"),
+                ("/worksFor/0", "range"),
+                ("/worksFor/1/@type", "type"),
+            ],
+        )
+        self.assertEqual(errors_of(self.constraints, {"name": "x"}), [("/", "type")])
+        self.assertEqual(errors_of(self.constraints, []), [("/", "document")])
+
+        messages = [
+            e["message"]
+            for e in self.constraints.validate(
+                {"@type": "Person", "name": [5, True, None]}
+            )
+        ]
+        self.assertEqual(
+            messages,
+            [
+                "name does not take %s values, expected Text, URL" % kind
+                for kind in ["number", "boolean", "null"]
+            ],
+        )
+
+    def test_lines(self):
+        lines = [
+            json.dumps({"@type": "Person", "@id": "http://example.com/ann"}),
+            "",
+            "{not json",
+            json.dumps({"@type": "Person", "tickerSymbol": "X"}),
+        ]
+        results = self.constraints.validate_lines(10, lines)
+        self.assertEqual([r["line"] for r in results], [10, 12, 13])
+        self.assertEqual([r["valid"] for r in results], [True, False, False])
+        self.assertEqual(results[0]["id"], "http://example.com/ann")
+        self.assertEqual(results[1]["errors"][0]["error"], "json")
+
+
+class ValidationPoolTestCase(unittest.TestCase):
+    def test_batches(self):
+        self.assertEqual(
+            list(batches(["a", "b", "c"], 2)), [(1, ["a", "b"]), (3, ["c"])]
+        )
+
+    def test_workers_keep_order(self):
+        lines = [
+            json.dumps({"@type": "Person" if n % 3 else "Robot", "name": "n%d" % n})
+            for n in xrange(50)
+        ]
+        constraints = Constraints(make_api())
+        pool = ValidationPool(constraints, 2)
+        try:
+            results = list(pool.imap(lines, size=7))
+            self.assertEqual([r["line"] for r in results], range(1, 51))
+            self.assertEqual(
+                [r["valid"] for r in results], [bool(n % 3) for n in xrange(50)]
+            )
+
+            self.assertEqual(pool.submit(8, lines[7:14]).result(), results[7:14])
+        finally:
+            pool.retire()
+        self.assertIsNone(pool.pool)
+
+    def test_dead_worker_times_out(self):
+        pool = ValidationPool(DyingConstraints(make_api()), 2, timeout=0.5)
+        try:
+            with self.assertRaises(ValidationTimeout):
+                pool.submit(1, ["die"]).result(10)
+            with self.assertRaises(ValidationTimeout):
+                list(pool.imap(["{}", "die", "{}"], size=1))
+
+            # the pool replaced its worker
+            lines = [json.dumps({"@type": "Person"})]
+            self.assertTrue(pool.submit(1, lines).result(10)[0]["valid"])
+        finally:
+            pool.retire()
+
+
+if __name__ == "__main__":
+    unittest.main()
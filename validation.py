@@ -0,0 +1,503 @@
+#!/usr/bin/env python
+
+"""
+Validates JSON-LD instance documents against the loaded schema, in bulk.
+
+Every property a document uses has to be known and valid on one of its
+node's types, domainIncludes being inherited down subClassOf, and every
+value has to fit one of the property's rangeIncludes or a subclass of
+one. Constraints flattens the api's tables into those effective
+domains and ranges once, keyed by plain names, so checking a document
+is a handful of dict and set lookups.
+
+Documents come one per line (newline delimited json) and are read with
+schema.org as their vocabulary, their @context isn't expanded. Results
+come one per line too, in the same order:
+
+    {"line": 1, "valid": false, "errors": [{"path": "/worksFor",
+     "error": "range", "message": "..."}]}
+
+Batches of lines are validated in a pool of worker processes, see
+ValidationPool, which gives up on a batch that takes longer than its
+timeout. From the command line:
+
+    python validation.py <RDFDIR> --input docs.ndjson --workers 8 --errors-only
+"""
+
+import sys
+import json
+import argparse
+import logging
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import Future
+
+SDO = "http://schema.org/"
+
+# the datatypes json values fit
+STRING_TYPES = frozenset(["Text", "URL", "Date", "DateTime", "Time"])
+NUMBER_TYPES = frozenset(["Number", "Integer", "Float"])
+BOOLEAN_TYPES = frozenset(["Boolean"])
+
+# lines per batch handed to a worker
+BATCH_SIZE = 1000
+
+# the json name of the python type of a value, for messages
+KIND_NAMES = {
+    unicode: "text",
+    int: "number",
+    long: "number",
+    float: "number",
+    bool: "boolean",
+    type(None): "null",
+    list: "array",
+}
+
+
+class ValidationTimeout(Exception):
+    pass
+
+
+def name(term):
+    """ Person for http://schema.org/Person, other terms stay whole """
+    term = unicode(term)
+    if term.startswith(SDO):
+        return term[len(SDO) :]
+    return term
+
+
+def error(path, kind, message):
+    return dict(path=path or "/", error=kind, message=message)
+
+
+class Constraints(object):
+    """ the effective domain and range tables of an api's schema """
+
+    def __init__(self, api):
+        self.generation = api.generation
+
+        ancestors = {}
+        for klass in api.classes:
+            chain = api.term_to_ancestors.get(klass, (klass,))
+            ancestors[name(klass)] = frozenset(name(a) for a in chain)
+        self.types = frozenset(ancestors)
+
+        # class -> the properties it is directly the domain of
+        direct = {}
+        self.properties = frozenset(name(p) for p in api.properties)
+        for prop, domains in api.property_to_domains.iteritems():
+            for domain in domains:
+                direct.setdefault(name(domain), set()).add(name(prop))
+
+        # type -> every property valid on it, inherited ones included
+        self.domain = {}
+        for klass, chain in ancestors.iteritems():
+            props = set()
+            for ancestor in chain:
+                props.update(direct.get(ancestor, ()))
+            self.domain[klass] = frozenset(props)
+
+        descendants = {}
+        for klass, chain in ancestors.iteritems():
+            for ancestor in chain:
+                descendants.setdefault(ancestor, set()).add(klass)
+
+        # property -> the types a node value may have, subclasses of
+        # the ranges included, and the kinds of literal values it takes
+        self.range = {}
+        self.literals = {}
+        for prop, ranges in api.property_to_ranges.iteritems():
+            types = set()
+            for range_ in ranges:
+                types.update(descendants.get(name(range_), [name(range_)]))
+
+            literals = set()
+            if types & STRING_TYPES or any(
+                "Text" in ancestors.get(t, ()) for t in types
+            ):
+                literals.add(unicode)
+            if types & NUMBER_TYPES:
+                literals.update([int, long, float])
+            if types & BOOLEAN_TYPES:
+                literals.add(bool)
+
+            self.range[name(prop)] = frozenset(types)
+            self.literals[name(prop)] = frozenset(literals)
+
+        self.type_names = self.spellings(self.types)
+        self.property_names = self.spellings(self.properties)
+
+    @staticmethod
+    def spellings(names):
+        """ every way a document may spell each name -> the name """
+        spelled = {}
+        for n in names:
+            spelled[n] = n
+            if not n.startswith(("http://", "https://")):
+                spelled[u"schema:" + n] = n
+                spelled[SDO + n] = n
+                spelled[u"https://schema.org/" + n] = n
+        return spelled
+
+    def types_of(self, node, path, errors):
+        """ the known types of node, reporting the unknown ones """
+        types = node.get("@type")
+        if types is None:
+            return []
+        if not isinstance(types, list):
+            types = [types]
+
+        known = []
+        for t in types:
+            n = self.type_names.get(t) if isinstance(t, basestring) else None
+            if n is None:
+                errors.append(error(path + "/@type", "type", "unknown type %s" % t))
+            else:
+                known.append(n)
+        return known
+
+    def validate(self, doc):
+        """ the errors in a parsed document, a node or a @graph of them """
+        errors = []
+        if not isinstance(doc, dict):
+            errors.append(error("", "document", "expected a json object"))
+            return errors
+
+        nodes = doc.get("@graph")
+        if isinstance(nodes, list):
+            for n, node in enumerate(nodes):
+                if not isinstance(node, dict):
+                    errors.append(
+                        error("/@graph/%d" % n, "document", "expected a json object")
+                    )
+                    continue
+                self.validate_node(node, "/@graph/%d" % n, errors, top=True)
+        else:
+            self.validate_node(doc, "", errors, top=True)
+        return errors
+
+    def validate_node(self, node, path, errors, known=None, top=False):
+        """ known are node's types when they were checked already """
+        if known is None:
+            known = self.types_of(node, path, errors)
+        if top and "@type" not in node:
+            errors.append(error(path, "type", "missing @type"))
+
+        property_names, domain = self.property_names, self.domain
+        for key, value in node.iteritems():
+            prop = property_names.get(key)
+            if prop is None:
+                if key.startswith("@"):
+                    continue
+                errors.append(
+                    error(
+                        "%s/%s" % (path, key), "property", "unknown property %s" % key
+                    )
+                )
+                continue
+
+            if known:
+                for t in known:
+                    if prop in domain[t]:
+                        break
+                else:
+                    errors.append(
+                        error(
+                            "%s/%s" % (path, key),
+                            "domain",
+                            "%s is not a property of %s" % (prop, ", ".join(known)),
+                        )
+                    )
+
+            if isinstance(value, list):
+                for n, v in enumerate(value):
+                    self.validate_value(prop, v, "%s/%s/%d" % (path, key, n), errors)
+            else:
+                self.validate_value(prop, value, "%s/%s" % (path, key), errors)
+
+    def validate_value(self, prop, value, path, errors):
+        ranges = self.range.get(prop)
+        if ranges is None:
+            # no rangeIncludes, anything goes
+            return
+
+        if isinstance(value, dict):
+            if "@value" not in value:
+                # a node, or a reference when it has no @type
+                types = self.types_of(value, path, errors)
+                if types and ranges.isdisjoint(types):
+                    errors.append(
+                        error(
+                            path,
+                            "range",
+                            "%s does not take %s" % (prop, ", ".join(types)),
+                        )
+                    )
+                self.validate_node(value, path, errors, known=types)
+                return
+            value = value["@value"]
+
+        kind = unicode if isinstance(value, basestring) else type(value)
+        if kind in self.literals[prop]:
+            return
+
+        if kind is unicode and value.startswith(("http://", "https://")):
+            # a reference to a node by its url
+            if ranges - STRING_TYPES - NUMBER_TYPES - BOOLEAN_TYPES:
+                return
+
+        errors.append(
+            error(
+                path,
+                "range",
+                "%s does not take %s values, expected %s"
+                % (
+                    prop,
+                    KIND_NAMES.get(kind, kind.__name__),
+                    ", ".join(sorted(ranges)),
+                ),
+            )
+        )
+
+    def validate_line(self, n, line):
+        """ the result of the document on line number n """
+        try:
+            doc = json.loads(line)
+        except ValueError as e:
+            return dict(line=n, valid=False, errors=[error("", "json", str(e))])
+
+        errors = self.validate(doc)
+        result = dict(line=n, valid=not errors, errors=errors)
+        if isinstance(doc, dict) and isinstance(doc.get("@id"), basestring):
+            result["id"] = doc["@id"]
+        return result
+
+    def validate_lines(self, first, lines):
+        """ results of consecutive lines, the first being number first,
+        blank lines are skipped
+        """
+        return [
+            self.validate_line(first + n, line)
+            for n, line in enumerate(lines)
+            if line.strip()
+        ]
+
+
+# set in the workers when the pool starts, see ValidationPool
+_constraints = None
+
+
+def init_worker(constraints):
+    global _constraints
+    _constraints = constraints
+
+
+def validate_batch(batch):
+    """ runs in a worker, returns (ok, results or the traceback) """
+    first, lines = batch
+    try:
+        return True, _constraints.validate_lines(first, lines)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+def batches(lines, size=BATCH_SIZE):
+    """ groups lines into (number of the first, lines) """
+    batch = []
+    first = 1
+    for n, line in enumerate(lines, 1):
+        batch.append(line)
+        if len(batch) >= size:
+            yield first, batch
+            batch, first = [], n + 1
+    if batch:
+        yield first, batch
+
+
+class ValidationPool(object):
+    """ validates batches of lines in worker processes that inherit the
+    constraints when they are forked, one pool per graph generation.
+    with one worker the batches are validated in the calling thread, or
+    in executor (see executor.BoundedExecutor) when there is one. a
+    batch still pending after timeout seconds fails with
+    ValidationTimeout, a worker that died never answers.
+
+    a pool replaced by a newer generation is retired and closes once
+    the requests using it are done.
+    """
+
+    def __init__(self, constraints, workers, executor=None, timeout=None):
+        self.constraints = constraints
+        self.executor = executor
+        self.timeout = timeout
+        self.generation = constraints.generation
+        self.pool = None
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, init_worker, (constraints,))
+
+        self.lock = threading.Lock()
+        self.users = 0
+        self.retired = False
+
+    def imap(self, lines, size=BATCH_SIZE):
+        """ results of every line, in order """
+        if self.pool is None:
+            results = (
+                self.constraints.validate_lines(*b) for b in batches(lines, size)
+            )
+        else:
+            done = self.pool.imap(validate_batch, batches(lines, size))
+            results = (self.check(outcome) for outcome in self.outcomes(done))
+        for batch in results:
+            for result in batch:
+                yield result
+
+    def outcomes(self, done):
+        """ the outcomes of pool.imap's iterator done, as they come """
+        while True:
+            try:
+                yield done.next(self.timeout)
+            except StopIteration:
+                return
+            except multiprocessing.TimeoutError:
+                raise ValidationTimeout("no batch in %ss" % self.timeout)
+
+    def submit(self, first, lines, trace=None, admitted=False):
+        """ a future of the results of one batch, trace is the latency.Trace
+        of the request validating it. the executor turns the batch away
+        with Saturated unless it is admitted.
+        """
+        if self.pool is None and self.executor is not None:
+            submit = self.executor.submit_admitted if admitted else self.executor.submit
+            return submit(
+                "validate", self.constraints.validate_lines, first, lines, trace=trace
+            )
+
+        future = Future()
+        if self.pool is None:
+            future.set_result(self.constraints.validate_lines(first, lines))
+            return future
+
+        # whichever of the outcome and the timeout comes first
+        lock = threading.Lock()
+
+        def settle(fn, value):
+            with lock:
+                if not future.done():
+                    fn(value)
+
+        def done(outcome):
+            ok, value = outcome
+            if ok:
+                settle(future.set_result, value)
+            else:
+                settle(future.set_exception, Exception(value))
+
+        if self.timeout is not None:
+            timer = threading.Timer(
+                self.timeout,
+                settle,
+                (
+                    future.set_exception,
+                    ValidationTimeout(
+                        "lines %d+ took over %ss" % (first, self.timeout)
+                    ),
+                ),
+            )
+            timer.daemon = True
+            timer.start()
+            future.add_done_callback(lambda f: timer.cancel())
+
+        self.pool.apply_async(validate_batch, ((first, lines),), callback=done)
+        return future
+
+    @staticmethod
+    def check(outcome):
+        ok, value = outcome
+        if not ok:
+            raise Exception(value)
+        return value
+
+    def acquire(self):
+        with self.lock:
+            self.users += 1
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            if self.retired and self.users == 0:
+                self.close()
+
+    def retire(self):
+        with self.lock:
+            self.retired = True
+            if self.users == 0:
+                self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+
+def main():
+    from sdoserver import RDFApi
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("rdf_dirs", nargs="+", help="directories of rdf files")
+    parser.add_argument(
+        "--input",
+        action="append",
+        default=[],
+        help="newline delimited json-ld file, repeatable, default stdin",
+    )
+    parser.add_argument(
+        "--workers", default=multiprocessing.cpu_count(), type=int,
+    )
+    parser.add_argument("--batch-size", default=BATCH_SIZE, type=int)
+    parser.add_argument(
+        "--timeout",
+        default=None,
+        type=float,
+        help="seconds to wait for a batch before giving up, default forever",
+    )
+    parser.add_argument(
+        "--errors-only",
+        default=False,
+        action="store_true",
+        help="only write the results of invalid documents",
+    )
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=args.log_level.upper())
+    log = logging.getLogger("validation")
+
+    api = RDFApi(log)
+    api.add_files(RDFApi.find_files(args.rdf_dirs), args.workers)
+    api.reload_term_meta()
+
+    pool = ValidationPool(Constraints(api), args.workers, timeout=args.timeout)
+    inputs = [open(f) for f in args.input] or [sys.stdin]
+
+    def lines():
+        for f in inputs:
+            for line in f:
+                yield line
+
+    invalid = 0
+    for result in pool.imap(lines(), args.batch_size):
+        if not result["valid"]:
+            invalid += 1
+        elif args.errors_only:
+            continue
+        sys.stdout.write(json.dumps(result))
+        sys.stdout.write("\n")
+
+    pool.close()
+    sys.exit(1 if invalid else 0)
+
+
+if __name__ == "__main__":
+    main()